@@ -6,11 +6,27 @@ Arquitetura Cliente-Servidor com Flask e SQLite
 """
 
 import sqlite3
-import os
-from datetime import datetime
-from flask import Flask, request, jsonify
+import time
+from datetime import datetime, timedelta
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from database import DatabaseManager
+from config import ServerConfig
+from database import DatabaseManager, CONSUMPTION_PERIODS
+from pagination import parse_page_args, fetch_page
+from search import search, parse_position
+from remnants import find_fitting_remnants, parse_dimensions
+import cut_planner
+from streaming import is_stream_requested, stream_json_array
+from conditional import conditional_get
+from ingest import iter_records, validate_app_slab
+from print_queue import PrintQueue, PrintError
+from write_queue import WriteRejected
+from sync import get_changes
+from archive import query_history
+import events
+import metrics
+from serializers import (CHAPA_LEGACY, CHAPA_APP, CHAPA_APP_DETAIL, RETALHO_LEGACY, RETALHO_APP,
+                         fetch_tuples, json_response)
 
 app = Flask(__name__)
 CORS(app)  # Permite requisições de outros domínios (necessário para o cliente)
@@ -18,40 +34,100 @@ CORS(app)  # Permite requisições de outros domínios (necessário para o clien
 # Inicializar gerenciador do banco de dados
 db_manager = DatabaseManager()
 
+# Fila de impressão de etiquetas (retoma jobs pendentes ao iniciar)
+print_queue = PrintQueue(db_manager)
+try:
+    print_queue.get_template()
+except (OSError, ValueError) as e:
+    print(f"AVISO: gabarito de etiquetas indisponível: {str(e)}")
+
+# Feed de alterações em tempo real (/events)
+event_broker = events.EventBroker(db_manager)
+
+
+@app.before_request
+def _iniciar_medicao():
+    """Marca o início da requisição para o histograma de latência"""
+    request.environ['qualicam.inicio'] = time.perf_counter()
+    metrics.IN_FLIGHT.inc()
+
+
+@app.after_request
+def _registrar_medicao(response):
+    """Registra a latência e o código de status pela rota (não pela URL)"""
+    environ = request.environ
+    started = environ.get('qualicam.inicio')
+    if started is not None:
+        rule = request.url_rule
+        route = rule.rule if rule is not None else 'outras'
+        method = environ['REQUEST_METHOD']
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, (method, route))
+        metrics.REQUESTS.inc((method, route, str(response.status_code)))
+    return response
+
+
+@app.teardown_request
+def _encerrar_medicao(error=None):
+    if request.environ.pop('qualicam.inicio', None) is not None:
+        metrics.IN_FLIGHT.dec()
+
+
+def init_process():
+    """Inicia as threads de fundo deste processo
+    
+    No ``serve.py`` é chamada em cada processo de trabalho logo após o
+    fork, para que nenhuma thread ou conexão do processo mestre seja herdada.
+    """
+    db_manager.writer.start()
+    print_queue.start()
+    event_broker.start()
+    metrics.start()
+
+
+def shutdown_process():
+    """Conclui as escritas pendentes e encerra as threads de fundo"""
+    event_broker.stop()
+    print_queue.stop()
+    cut_planner.shutdown()
+    db_manager.writer.stop()
+    db_manager.pool.close_all()
+    metrics.stop()
+
 
 @app.route('/chapas', methods=['GET'])
+@conditional_get(db_manager, 'chapas')
 def listar_chapas():
-    """Retorna lista de todas as chapas com status 'Disponível'"""
-    try:
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id_chapa, nome_material, fornecedor, preco_compra_m2,
-                   area_liquida_inicial, area_disponivel, localizacao, status, data_entrada
-            FROM chapas 
-            WHERE status = 'Disponível'
-            ORDER BY data_entrada DESC
-        ''')
-        
-        chapas = []
-        for row in cursor.fetchall():
-            chapa = {
-                'id_chapa': row['id_chapa'],
-                'nome_material': row['nome_material'],
-                'fornecedor': row['fornecedor'],
-                'preco_compra_m2': row['preco_compra_m2'],
-                'area_liquida_inicial': row['area_liquida_inicial'],
-                'area_disponivel': row['area_disponivel'],
-                'localizacao': row['localizacao'],
-                'status': row['status'],
-                'data_entrada': row['data_entrada']
-            }
-            chapas.append(chapa)
-        
-        conn.close()
-        return jsonify({'success': True, 'chapas': chapas})
+    """Retorna lista de todas as chapas com status 'Disponível'
     
+    Com ``limit``/``cursor`` na query string a resposta é paginada e
+    inclui ``next_cursor``; sem eles mantém o formato antigo completo.
+    ``stream=1`` envia a lista completa em streaming.
+    """
+    try:
+        page = parse_page_args(request.args)
+        
+        query = CHAPA_LEGACY.select(where="status = 'Disponível'", order_by='data_entrada DESC')
+        if page is None and is_stream_requested(request.args):
+            return stream_json_array(db_manager, CHAPA_LEGACY, 'data_entrada', 'id_chapa',
+                                     where="status = 'Disponível'",
+                                     prefix='{"success": true, "chapas": [', suffix=']}')
+        
+        with db_manager.get_connection() as conn:
+            if page is None:
+                rows = fetch_tuples(conn, query)
+            else:
+                rows, next_cursor = fetch_page(conn, CHAPA_LEGACY.select(), 'data_entrada', 'id_chapa',
+                                               page, where="status = 'Disponível'")
+        
+        chapas = CHAPA_LEGACY.to_dicts(rows)
+        
+        resposta = {'success': True, 'chapas': chapas}
+        if page is not None:
+            resposta['next_cursor'] = next_cursor
+        return json_response(resposta)
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -67,13 +143,13 @@ def adicionar_chapa():
             if campo not in data or not data[campo]:
                 return jsonify({'success': False, 'error': f'Campo {campo} é obrigatório'}), 400
         
-        with db_manager.get_connection() as conn:
+        def op(conn):
             cursor = conn.cursor()
             
             # Verificar se ID já existe
             cursor.execute("SELECT id_chapa FROM chapas WHERE id_chapa = ?", (data['id_chapa'],))
             if cursor.fetchone():
-                return jsonify({'success': False, 'error': f'ID {data["id_chapa"]} já existe'}), 400
+                raise WriteRejected(f'ID {data["id_chapa"]} já existe')
             
             # Inserir chapa
             cursor.execute('''
@@ -84,10 +160,16 @@ def adicionar_chapa():
                   data['preco_compra_m2'], data['area_liquida_inicial'], 
                   data['area_liquida_inicial'], data['localizacao']))
             
-            conn.commit()
+            events.record_event(conn, events.CHAPA_CRIADA, data['id_chapa'], **events.slab_fields(
+                data['nome_material'], data['fornecedor'], data['area_liquida_inicial'],
+                data['preco_compra_m2'], data['localizacao']))
+        
+        db_manager.write(op)
         
         return jsonify({'success': True, 'id_chapa': data['id_chapa']})
         
+    except WriteRejected as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         print(f"ERRO ao adicionar chapa: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -104,19 +186,10 @@ def atualizar_area_chapa():
         
         id_chapa = data['id_chapa']
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar se chapa existe
-        cursor.execute("SELECT id_chapa, area_disponivel, localizacao FROM chapas WHERE id_chapa = ?", (id_chapa,))
-        chapa_existente = cursor.fetchone()
-        
-        if not chapa_existente:
-            return jsonify({'success': False, 'error': f'Chapa {id_chapa} não encontrada'}), 404
-        
         # Preparar dados para atualização
         updates = []
         params = []
+        campos = {}
         
         # Atualizar área disponível se fornecida
         if 'nova_area_disponivel' in data and data['nova_area_disponivel'] is not None:
@@ -125,34 +198,46 @@ def atualizar_area_chapa():
                 return jsonify({'success': False, 'error': 'Área não pode ser negativa'}), 400
             updates.append("area_disponivel = ?")
             params.append(nova_area)
+            campos['nova_area_disponivel'] = nova_area
         
         # Atualizar localização se fornecida
         if 'nova_localizacao' in data and data['nova_localizacao'].strip():
             updates.append("localizacao = ?")
             params.append(data['nova_localizacao'].strip())
+            campos['nova_localizacao'] = data['nova_localizacao'].strip()
         
         # Atualizar OS associada se fornecida
         if 'os_associada' in data and data['os_associada'].strip():
             updates.append("os_associada = ?")
             params.append(data['os_associada'].strip())
         
-        # Se não há nada para atualizar
-        if not updates:
-            return jsonify({'success': False, 'error': 'Nenhum campo para atualizar foi fornecido'}), 400
-        
-        # Adicionar ID da chapa aos parâmetros
-        params.append(id_chapa)
-        
-        # Executar atualização
-        query = f"UPDATE chapas SET {', '.join(updates)} WHERE id_chapa = ?"
-        cursor.execute(query, params)
-        
-        # Verificar se alguma linha foi afetada
-        if cursor.rowcount == 0:
-            return jsonify({'success': False, 'error': 'Nenhuma chapa foi atualizada'}), 400
+        def op(conn):
+            cursor = conn.cursor()
+            
+            # Verificar se chapa existe
+            cursor.execute("SELECT id_chapa, area_disponivel, localizacao FROM chapas WHERE id_chapa = ?", (id_chapa,))
+            if not cursor.fetchone():
+                raise WriteRejected(f'Chapa {id_chapa} não encontrada', 404)
+            
+            # Se não há nada para atualizar
+            if not updates:
+                raise WriteRejected('Nenhum campo para atualizar foi fornecido')
+            
+            # Executar atualização
+            query = f"UPDATE chapas SET {', '.join(updates)} WHERE id_chapa = ?"
+            cursor.execute(query, params + [id_chapa])
+            
+            # Verificar se alguma linha foi afetada
+            if cursor.rowcount == 0:
+                raise WriteRejected('Nenhuma chapa foi atualizada')
+            
+            if 'nova_area_disponivel' in campos:
+                events.record_event(conn, events.AREA_ATUALIZADA, id_chapa, tamanho=campos['nova_area_disponivel'])
+            if 'nova_localizacao' in campos:
+                events.record_event(conn, events.CHAPA_MOVIDA, id_chapa, localizacao=campos['nova_localizacao'])
         
-        conn.commit()
-        conn.close()
+        db_manager.write(op)
+        db_manager.invalidate_slab(id_chapa)
         
         return jsonify({
             'success': True, 
@@ -160,6 +245,8 @@ def atualizar_area_chapa():
             'id_chapa': id_chapa
         })
         
+    except WriteRejected as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except ValueError as e:
         return jsonify({'success': False, 'error': f'Dados inválidos: {str(e)}'}), 400
     except Exception as e:
@@ -167,7 +254,11 @@ def atualizar_area_chapa():
 
 @app.route('/chapas/transformar-retalho', methods=['POST'])
 def transformar_em_retalho():
-    """Transforma uma chapa em retalho"""
+    """Transforma uma chapa em retalho
+    
+    ``largura`` e ``comprimento`` (metros) são opcionais e permitem achar
+    o retalho depois por medidas em ``/retalhos/match``.
+    """
     try:
         data = request.get_json()
         
@@ -176,59 +267,73 @@ def transformar_em_retalho():
             return jsonify({'success': False, 'error': 'ID da chapa é obrigatório'}), 400
         
         id_chapa = data['id_chapa']
+        try:
+            largura, comprimento = parse_dimensions(data.get('largura'), data.get('comprimento'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        def op(conn):
+            cursor = conn.cursor()
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
+            # Verificar se chapa existe
+            cursor.execute("""
+                SELECT id_chapa, nome_material, fornecedor, area_disponivel, localizacao, status 
+                FROM chapas 
+                WHERE id_chapa = ?
+            """, (id_chapa,))
         
-        # Verificar se chapa existe
-        cursor.execute("""
-            SELECT id_chapa, nome_material, fornecedor, area_disponivel, localizacao, status 
-            FROM chapas 
-            WHERE id_chapa = ?
-        """, (id_chapa,))
+            chapa = cursor.fetchone()
         
-        chapa = cursor.fetchone()
+            if not chapa:
+                raise WriteRejected(f'Chapa {id_chapa} não encontrada', 404)
         
-        if not chapa:
-            return jsonify({'success': False, 'error': f'Chapa {id_chapa} não encontrada'}), 404
+            # Verificar se já é retalho
+            if chapa['status'] == 'Retalho':
+                raise WriteRejected(f'Chapa {id_chapa} já é um retalho')
         
-        # Verificar se já é retalho
-        if chapa['status'] == 'Retalho':
-            return jsonify({'success': False, 'error': f'Chapa {id_chapa} já é um retalho'}), 400
+            # Remover da tabela chapas e inserir na tabela retalhos
+            cursor.execute("""
+                DELETE FROM chapas 
+                WHERE id_chapa = ?
+            """, (id_chapa,))
         
-        # Remover da tabela chapas e inserir na tabela retalhos
-        cursor.execute("""
-            DELETE FROM chapas 
-            WHERE id_chapa = ?
-        """, (id_chapa,))
+            # Inserir na tabela retalhos
+            cursor.execute("""
+                INSERT INTO retalhos (id_chapa_original, nome_material, fornecedor, area_retalho, localizacao,
+                                      largura, comprimento, data_transformacao)
+                VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+            """, (id_chapa, chapa['nome_material'], chapa['fornecedor'], chapa['area_disponivel'], chapa['localizacao'],
+                  largura, comprimento))
         
-        # Inserir na tabela retalhos
-        cursor.execute("""
-            INSERT INTO retalhos (id_chapa_original, nome_material, fornecedor, area_retalho, localizacao, data_transformacao)
-            VALUES (?, ?, ?, ?, ?, datetime('now'))
-        """, (id_chapa, chapa['nome_material'], chapa['fornecedor'], chapa['area_disponivel'], chapa['localizacao']))
+            # Registrar movimentação
+            cursor.execute("""
+                INSERT INTO movimentacoes (id_chapa, tipo_movimentacao, quantidade_m2, data_movimentacao)
+                VALUES (?, 'TRANSFORMAR_RETALHO', ?, datetime('now'))
+            """, (id_chapa, chapa['area_disponivel']))
         
-        # Registrar movimentação
-        cursor.execute("""
-            INSERT INTO movimentacoes (id_chapa, tipo_movimentacao, quantidade_m2, data_movimentacao)
-            VALUES (?, 'TRANSFORMAR_RETALHO', ?, datetime('now'))
-        """, (id_chapa, chapa['area_disponivel']))
+            events.record_event(conn, events.TRANSFORMADA_RETALHO, id_chapa, tamanho=chapa['area_disponivel'],
+                         localizacao=chapa['localizacao'])
         
-        conn.commit()
-        conn.close()
+            return chapa['area_disponivel']
+        
+        area_retalho = db_manager.write(op)
+        db_manager.invalidate_slab(id_chapa)
         
         return jsonify({
             'success': True,
             'message': f'Chapa {id_chapa} transformada em retalho com sucesso',
             'id_chapa': id_chapa,
-            'area_retalho': chapa['area_disponivel']
+            'area_retalho': area_retalho
         })
         
+    except WriteRejected as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         print(f"ERRO ao transformar chapa em retalho: {str(e)}")
         return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
 
 @app.route('/chapas/metragem-total', methods=['GET'])
+@conditional_get(db_manager, 'chapas')
 def obter_metragem_total():
     """Retorna metragem total por material"""
     try:
@@ -241,11 +346,137 @@ def obter_metragem_total():
         print(f"ERRO ao obter metragem total: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/movimentacoes/consumo', methods=['GET'])
+def obter_consumo():
+    """Retorna a metragem movimentada por período, material e tipo
+    
+    Parâmetros: ``inicio`` e ``fim`` (AAAA-MM-DD, padrão últimos 30 dias),
+    ``granularidade`` (``dia``, ``semana`` ou ``mes``) e os filtros opcionais
+    ``material``, ``fornecedor``, ``tipo`` e ``por_fornecedor=1``.
+    """
+    try:
+        fim = request.args.get('fim') or datetime.now().strftime('%Y-%m-%d')
+        fim_data = datetime.strptime(fim, '%Y-%m-%d')
+        inicio = request.args.get('inicio') or (fim_data - timedelta(days=30)).strftime('%Y-%m-%d')
+        if datetime.strptime(inicio, '%Y-%m-%d') > fim_data:
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Datas devem estar no formato AAAA-MM-DD, com inicio <= fim'}), 400
+    
+    granularidade = request.args.get('granularidade', 'dia')
+    if granularidade not in CONSUMPTION_PERIODS:
+        return jsonify({'success': False, 'error': 'granularidade deve ser dia, semana ou mes'}), 400
+    
+    try:
+        consumo = db_manager.get_consumption(
+            inicio, fim, granularidade,
+            material=request.args.get('material'),
+            supplier=request.args.get('fornecedor'),
+            movement_type=request.args.get('tipo'),
+            by_supplier=request.args.get('por_fornecedor') == '1')
+    
+        return json_response({'success': True, 'granularidade': granularidade,
+                              'inicio': inicio, 'fim': fim, 'consumo': consumo})
+    
+    except Exception as e:
+        print(f"ERRO ao obter consumo: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/movimentacoes/historico', methods=['GET'])
+def historico_movimentacoes():
+    """Lista movimentações, incluindo os meses já arquivados
+    
+    Parâmetros opcionais: ``id_chapa``, ``inicio`` e ``fim`` (AAAA-MM-DD),
+    ``tipo`` e ``limit``. Só os arquivos mensais do intervalo são lidos.
+    """
+    try:
+        id_chapa = request.args.get('id_chapa')
+        id_chapa = int(id_chapa) if id_chapa else None
+        limit = int(request.args.get('limit', ServerConfig.get_history_max_rows()))
+        if limit <= 0:
+            raise ValueError
+        inicio = request.args.get('inicio')
+        fim = request.args.get('fim')
+        for data in (inicio, fim):
+            if data:
+                datetime.strptime(data, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Parâmetros inválidos: id_chapa e limit inteiros, datas AAAA-MM-DD'}), 400
+    
+    try:
+        movimentacoes = query_history(db_manager, id_chapa=id_chapa, start=inicio, end=fim,
+                                      movement_type=request.args.get('tipo'), limit=limit)
+        
+        return json_response({'success': True, 'movimentacoes': movimentacoes})
+    
+    except Exception as e:
+        print(f"ERRO ao consultar histórico de movimentações: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Endpoint para verificar se o servidor está funcionando"""
     return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
 
+@app.route('/debug/cache', methods=['GET'])
+def cache_stats():
+    """Retorna os contadores do cache de consulta de chapas por ID"""
+    return jsonify({'success': True, 'slab_cache': db_manager.slab_cache.stats()})
+
+@app.route('/debug/sql', methods=['GET', 'DELETE'])
+def perfil_sql():
+    """Consultas SQL mais caras deste processo, com plano e consultas lentas
+    
+    Só com ``QUALICAM_SQL_PROFILE=1``. Parâmetros: ``ordem`` (total, max,
+    calls, vm_steps) e ``limit``. ``DELETE`` zera as estatísticas.
+    """
+    profiler = db_manager.sql_profiler
+    if profiler is None:
+        return jsonify({'success': False, 'error': 'Perfil SQL desligado (QUALICAM_SQL_PROFILE=1)'}), 404
+    
+    if request.method == 'DELETE':
+        profiler.reset()
+        return jsonify({'success': True})
+    
+    ordem = request.args.get('ordem', 'total')
+    if ordem not in ('total', 'max', 'calls', 'vm_steps'):
+        return jsonify({'success': False, 'error': 'ordem deve ser total, max, calls ou vm_steps'}), 400
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit inválido'}), 400
+    
+    return jsonify({'success': True, **profiler.summary(ordem, limit)})
+
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    """Métricas de todos os processos no formato texto do Prometheus"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/events', methods=['GET'])
+def feed_eventos():
+    """Feed de alterações em tempo real (Server-Sent Events)
+    
+    Sem ``Last-Event-ID`` envia apenas as alterações a partir da conexão.
+    Com ele (o EventSource reenvia o cabeçalho ao reconectar; também aceito
+    como ``?lastEventId=``) envia antes os eventos perdidos.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Last-Event-ID inválido'}), 400
+    
+    if not event_broker.try_acquire():
+        response = jsonify({'success': False, 'error': 'Limite de clientes do feed atingido'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    response = Response(event_broker.stream(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # =============================================================================
 # ROTAS ESPECÍFICAS PARA O APP QUALICAM
 # =============================================================================
@@ -259,23 +490,10 @@ def app_health_check():
 def app_get_chapa(chapa_id):
     """Busca uma chapa pelo ID - Rota específica do app QualiCam"""
     try:
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM chapas WHERE id_chapa = ?', (chapa_id,))
-        chapa = cursor.fetchone()
-        
-        conn.close()
+        chapa = db_manager.get_slab(chapa_id)
         
         if chapa:
-            return jsonify({
-                "id": chapa["id_chapa"],
-                "nomeMaterial": chapa["nome_material"],
-                "fornecedor": chapa["fornecedor"],
-                "tamanho": chapa["area_disponivel"],
-                "preco": chapa["preco_compra_m2"],
-                "localizacao": chapa["localizacao"]
-            }), 200
+            return json_response(CHAPA_APP_DETAIL.from_mapping(chapa))
         else:
             return jsonify({"message": "Chapa não encontrada"}), 404
             
@@ -294,41 +512,119 @@ def app_create_chapa():
             if field not in data:
                 return jsonify({"error": f"Campo obrigatório: {field}"}), 400
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Verifica se a chapa já existe
-        cursor.execute('SELECT id_chapa FROM chapas WHERE id_chapa = ?', (data['id'],))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify({"error": "Chapa já existe"}), 409
-        
-        # Insere a nova chapa
-        cursor.execute('''
-            INSERT INTO chapas (id_chapa, nome_material, fornecedor, preco_compra_m2, 
-                              area_liquida_inicial, area_disponivel, localizacao, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, 'Disponível')
-        ''', (
-            data['id'],
-            data['nomeMaterial'],
-            data['fornecedor'],
-            data['preco'],
-            data['tamanho'],
-            data['tamanho'],
-            data['localizacao']
-        ))
-        
-        # Registrar movimentação de entrada
-        cursor.execute('''
-            INSERT INTO movimentacoes (id_chapa, tipo_movimentacao, quantidade_m2)
-            VALUES (?, 'ENTRADA', ?)
-        ''', (data['id'], data['tamanho']))
-        
-        conn.commit()
-        conn.close()
+        def op(conn):
+            cursor = conn.cursor()
+        
+            # Verifica se a chapa já existe
+            cursor.execute('SELECT id_chapa FROM chapas WHERE id_chapa = ?', (data['id'],))
+            if cursor.fetchone():
+                raise WriteRejected("Chapa já existe", 409)
+        
+            # Insere a nova chapa
+            cursor.execute('''
+                INSERT INTO chapas (id_chapa, nome_material, fornecedor, preco_compra_m2, 
+                                  area_liquida_inicial, area_disponivel, localizacao, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'Disponível')
+            ''', (
+                data['id'],
+                data['nomeMaterial'],
+                data['fornecedor'],
+                data['preco'],
+                data['tamanho'],
+                data['tamanho'],
+                data['localizacao']
+            ))
+        
+            # Registrar movimentação de entrada
+            cursor.execute('''
+                INSERT INTO movimentacoes (id_chapa, tipo_movimentacao, quantidade_m2)
+                VALUES (?, 'ENTRADA', ?)
+            ''', (data['id'], data['tamanho']))
+        
+            events.record_event(conn, events.CHAPA_CRIADA, data['id'], **events.slab_fields(
+                data['nomeMaterial'], data['fornecedor'], data['tamanho'], data['preco'], data['localizacao']))
+        
+        db_manager.write(op)
         
         return jsonify({"message": "Chapa criada com sucesso"}), 201
         
+    except WriteRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": "Erro interno do servidor"}), 500
+
+@app.route('/app/chapas/bulk', methods=['POST'])
+def app_bulk_create_chapas():
+    """Cadastra uma remessa de chapas de uma vez - Rota específica do app QualiCam
+    
+    Aceita NDJSON (``application/x-ndjson``) ou um array JSON de chapas no
+    formato do app. Tudo é gravado em uma única transação e a resposta traz
+    o resultado de cada linha: ``created``, ``duplicate`` ou ``invalid``.
+    """
+    try:
+        results = []
+        valid = []
+        for line_no, item in iter_records(request):
+            slab, error = validate_app_slab(item)
+            if error:
+                results.append({"linha": line_no, "id": item.get('id') if isinstance(item, dict) else None,
+                                "status": "invalid", "error": error})
+            else:
+                results.append({"linha": line_no, "id": slab['id_chapa'], "status": None})
+                valid.append(slab)
+        
+        statuses = iter(db_manager.add_slabs_bulk(valid))
+        for result in results:
+            if result["status"] is None:
+                result["status"] = next(statuses)
+        
+        resumo = {status: sum(1 for r in results if r["status"] == status)
+                  for status in ("created", "duplicate", "invalid")}
+        return jsonify({"resumo": resumo, "resultados": results}), 200
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"ERRO na carga em lote: {str(e)}")
+        return jsonify({"error": "Erro interno do servidor"}), 500
+
+@app.route('/app/chapas/lookup', methods=['POST'])
+def app_lookup_chapas():
+    """Busca várias chapas de uma vez - Rota específica do app QualiCam
+    
+    Recebe ``{"ids": [...]}`` com os códigos lidos em sequência e devolve
+    as chapas encontradas e os IDs que não existem, em uma única consulta.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids')
+        if not isinstance(ids, list):
+            return jsonify({"error": "Campo obrigatório: ids (lista)"}), 400
+        
+        max_ids = ServerConfig.get_lookup_max_ids()
+        if len(ids) > max_ids:
+            return jsonify({"error": f"Máximo de {max_ids} IDs por consulta"}), 400
+        
+        # Normaliza para inteiro preservando a ordem e removendo repetidos
+        wanted = []
+        seen = set()
+        missing = []
+        for raw in ids:
+            try:
+                id_chapa = int(raw)
+            except (TypeError, ValueError):
+                missing.append(raw)
+                continue
+            if id_chapa not in seen:
+                seen.add(id_chapa)
+                wanted.append(id_chapa)
+        
+        rows = db_manager.get_slabs_by_ids(wanted)
+        found = [CHAPA_APP_DETAIL.from_mapping(rows[i]) for i in wanted if i in rows]
+        missing.extend(i for i in wanted if i not in rows)
+        
+        return json_response({"found": found, "missing": missing})
+        
     except Exception as e:
         return jsonify({"error": "Erro interno do servidor"}), 500
 
@@ -344,35 +640,39 @@ def app_update_chapa(chapa_id):
             if field not in data:
                 return jsonify({"error": f"Campo obrigatório: {field}"}), 400
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Verifica se a chapa existe
-        cursor.execute('SELECT id_chapa FROM chapas WHERE id_chapa = ?', (chapa_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return jsonify({"error": "Chapa não encontrada"}), 404
-        
-        # Atualiza a chapa
-        cursor.execute('''
-            UPDATE chapas 
-            SET nome_material = ?, fornecedor = ?, preco_compra_m2 = ?, 
-                area_disponivel = ?, localizacao = ?
-            WHERE id_chapa = ?
-        ''', (
-            data['nomeMaterial'],
-            data['fornecedor'],
-            data['preco'],
-            data['tamanho'],
-            data['localizacao'],
-            chapa_id
-        ))
-        
-        conn.commit()
-        conn.close()
+        def op(conn):
+            cursor = conn.cursor()
+        
+            # Verifica se a chapa existe
+            cursor.execute('SELECT id_chapa FROM chapas WHERE id_chapa = ?', (chapa_id,))
+            if not cursor.fetchone():
+                raise WriteRejected("Chapa não encontrada", 404)
+        
+            # Atualiza a chapa
+            cursor.execute('''
+                UPDATE chapas 
+                SET nome_material = ?, fornecedor = ?, preco_compra_m2 = ?, 
+                    area_disponivel = ?, localizacao = ?
+                WHERE id_chapa = ?
+            ''', (
+                data['nomeMaterial'],
+                data['fornecedor'],
+                data['preco'],
+                data['tamanho'],
+                data['localizacao'],
+                chapa_id
+            ))
+        
+            events.record_event(conn, events.CHAPA_ATUALIZADA, int(chapa_id), **events.slab_fields(
+                data['nomeMaterial'], data['fornecedor'], data['tamanho'], data['preco'], data['localizacao']))
+        
+        db_manager.write(op)
+        db_manager.invalidate_slab(chapa_id)
         
         return jsonify({"message": "Chapa atualizada com sucesso"}), 200
         
+    except WriteRejected as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         return jsonify({"error": "Erro interno do servidor"}), 500
 
@@ -380,23 +680,26 @@ def app_update_chapa(chapa_id):
 def app_delete_chapa(chapa_id):
     """Remove uma chapa - Rota específica do app QualiCam"""
     try:
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
+        def op(conn):
+            cursor = conn.cursor()
         
-        # Verifica se a chapa existe
-        cursor.execute('SELECT id_chapa FROM chapas WHERE id_chapa = ?', (chapa_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return jsonify({"error": "Chapa não encontrada"}), 404
+            # Verifica se a chapa existe
+            cursor.execute('SELECT id_chapa FROM chapas WHERE id_chapa = ?', (chapa_id,))
+            if not cursor.fetchone():
+                raise WriteRejected("Chapa não encontrada", 404)
         
-        # Remove a chapa
-        cursor.execute('DELETE FROM chapas WHERE id_chapa = ?', (chapa_id,))
+            # Remove a chapa
+            cursor.execute('DELETE FROM chapas WHERE id_chapa = ?', (chapa_id,))
         
-        conn.commit()
-        conn.close()
+            events.record_event(conn, events.CHAPA_REMOVIDA, int(chapa_id))
+        
+        db_manager.write(op)
+        db_manager.invalidate_slab(chapa_id)
         
         return jsonify({"message": "Chapa removida com sucesso"}), 200
         
+    except WriteRejected as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         return jsonify({"error": "Erro interno do servidor"}), 500
 
@@ -412,275 +715,367 @@ def app_create_retalho():
             if field not in data:
                 return jsonify({"error": f"Campo obrigatório: {field}"}), 400
         
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Verifica se o retalho já existe
-        cursor.execute('SELECT id_retalho FROM retalhos WHERE id_chapa_original = ?', (data['id'],))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify({"error": "Retalho já existe"}), 409
-        
-        # Insere o novo retalho
-        cursor.execute('''
-            INSERT INTO retalhos (id_chapa_original, nome_material, fornecedor, area_retalho, localizacao)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            data['id'],
-            data['nomeMaterial'],
-            data['fornecedor'],
-            data['tamanho'],
-            data['localizacao']
-        ))
-        
-        conn.commit()
-        conn.close()
+        # Medidas opcionais, usadas por /retalhos/match
+        try:
+            largura, comprimento = parse_dimensions(data.get('largura'), data.get('comprimento'))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        
+        def op(conn):
+            cursor = conn.cursor()
+        
+            # Verifica se o retalho já existe
+            cursor.execute('SELECT id_retalho FROM retalhos WHERE id_chapa_original = ?', (data['id'],))
+            if cursor.fetchone():
+                raise WriteRejected("Retalho já existe", 409)
+        
+            # Insere o novo retalho
+            cursor.execute('''
+                INSERT INTO retalhos (id_chapa_original, nome_material, fornecedor, area_retalho, localizacao,
+                                      largura, comprimento)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                data['id'],
+                data['nomeMaterial'],
+                data['fornecedor'],
+                data['tamanho'],
+                data['localizacao'],
+                largura,
+                comprimento
+            ))
+        
+            events.record_event(conn, events.RETALHO_CRIADO, data['id'], nomeMaterial=data['nomeMaterial'],
+                         fornecedor=data['fornecedor'], tamanho=data['tamanho'],
+                         localizacao=data['localizacao'])
+        
+        db_manager.write(op)
         
         return jsonify({"message": "Retalho criado com sucesso"}), 201
         
+    except WriteRejected as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         return jsonify({"error": "Erro interno do servidor"}), 500
 
 @app.route('/app/chapas', methods=['GET'])
+@conditional_get(db_manager, 'chapas')
 def app_list_chapas():
-    """Lista todas as chapas - Rota específica do app QualiCam"""
+    """Lista todas as chapas - Rota específica do app QualiCam
+    
+    Com ``limit``/``cursor`` retorna ``{"items": [...], "nextCursor": ...}``;
+    sem eles mantém a lista completa usada pelas versões antigas do app.
+    ``stream=1`` envia a lista completa em streaming.
+    """
     try:
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
+        page = parse_page_args(request.args)
         
-        cursor.execute('SELECT * FROM chapas ORDER BY data_entrada DESC')
-        chapas = cursor.fetchall()
+        query = CHAPA_APP.select(order_by='data_entrada DESC')
+        if page is None and is_stream_requested(request.args):
+            return stream_json_array(db_manager, CHAPA_APP, 'data_entrada', 'id_chapa')
         
-        conn.close()
+        with db_manager.get_connection() as conn:
+            if page is None:
+                chapas = fetch_tuples(conn, query)
+            else:
+                chapas, next_cursor = fetch_page(conn, CHAPA_APP.select(),
+                                                 'data_entrada', 'id_chapa', page)
         
-        result = []
-        for chapa in chapas:
-            result.append({
-                "id": chapa["id_chapa"],
-                "nomeMaterial": chapa["nome_material"],
-                "fornecedor": chapa["fornecedor"],
-                "tamanho": chapa["area_disponivel"],
-                "preco": chapa["preco_compra_m2"],
-                "localizacao": chapa["localizacao"],
-                "dataCriacao": chapa["data_entrada"]
-            })
+        result = CHAPA_APP.to_dicts(chapas)
         
-        return jsonify(result), 200
+        if page is not None:
+            return json_response({"items": result, "nextCursor": next_cursor})
+        return json_response(result)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": "Erro interno do servidor"}), 500
 
 @app.route('/app/retalhos', methods=['GET'])
+@conditional_get(db_manager, 'retalhos')
 def app_list_retalhos():
-    """Lista todos os retalhos - Rota específica do app QualiCam"""
+    """Lista todos os retalhos - Rota específica do app QualiCam
+    
+    Aceita ``limit``/``cursor`` e ``stream`` da mesma forma que ``GET /app/chapas``.
+    """
     try:
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
+        page = parse_page_args(request.args)
+        
+        query = RETALHO_APP.select(order_by='data_transformacao DESC')
+        if page is None and is_stream_requested(request.args):
+            return stream_json_array(db_manager, RETALHO_APP, 'data_transformacao', 'id_retalho')
+        
+        with db_manager.get_connection() as conn:
+            if page is None:
+                retalhos = fetch_tuples(conn, query)
+            else:
+                retalhos, next_cursor = fetch_page(conn, RETALHO_APP.select(),
+                                                   'data_transformacao', 'id_retalho', page)
         
-        cursor.execute('SELECT * FROM retalhos ORDER BY data_transformacao DESC')
-        retalhos = cursor.fetchall()
+        result = RETALHO_APP.to_dicts(retalhos)
         
-        conn.close()
+        if page is not None:
+            return json_response({"items": result, "nextCursor": next_cursor})
+        return json_response(result)
         
-        result = []
-        for retalho in retalhos:
-            result.append({
-                "id": retalho["id_chapa_original"],
-                "nomeMaterial": retalho["nome_material"],
-                "fornecedor": retalho["fornecedor"],
-                "tamanho": retalho["area_retalho"],
-                "localizacao": retalho["localizacao"],
-                "dataCriacao": retalho["data_transformacao"]
-            })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": "Erro interno do servidor"}), 500
+
+@app.route('/app/search', methods=['GET'])
+def app_search():
+    """Busca chapas e retalhos por material, fornecedor ou localização - Rota específica do app QualiCam
+    
+    ``q`` aceita palavras parciais e sem acento (``q=bran prat``); ``tipo``
+    restringe a ``chapa`` ou ``retalho``. Resultados paginados por
+    ``limit``/``cursor``, mais relevantes primeiro.
+    """
+    try:
+        tipo = request.args.get('tipo')
+        if tipo not in (None, 'chapa', 'retalho'):
+            raise ValueError('Parâmetro tipo deve ser chapa ou retalho')
+        page = parse_page_args(request.args)
+        limit, position = page if page is not None else (ServerConfig.get_default_page_size(), None)
         
-        return jsonify(result), 200
+        items, next_cursor = search(db_manager, request.args.get('q', ''), limit,
+                                    parse_position(position), [tipo] if tipo else None)
+        return json_response({"items": items, "nextCursor": next_cursor})
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
+        print(f"ERRO na busca: {str(e)}")
+        return jsonify({"error": "Erro interno do servidor"}), 500
+
+@app.route('/app/sync', methods=['GET'])
+def app_sync():
+    """Alterações desde a última sincronização - Rota específica do app QualiCam
+    
+    ``since`` é o ``highWaterMark`` da resposta anterior (0 na primeira
+    vez). Com ``resync: true`` o app deve baixar as listas completas e
+    continuar a partir do ``highWaterMark`` recebido.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        if since < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "Parâmetro since deve ser um inteiro não negativo"}), 400
+    
+    try:
+        return json_response(get_changes(db_manager, since))
+    except Exception as e:
+        print(f"ERRO na sincronização: {str(e)}")
         return jsonify({"error": "Erro interno do servidor"}), 500
 
 @app.route('/impressora/testar', methods=['POST'])
 def testar_impressora():
     """Testa a impressora usando o gabarito oficial"""
     try:
-        import subprocess
-        
         # Usar diretamente o gabarito oficial para teste
-        comando = ['lpr', '-P', '4BARCODE', '-o', 'raw', '/home/maikon/Documents/QualiPatio/SERVIDOR/gabarito_oficial.zpl']
+        gabarito = print_queue.template_path
+        with open(gabarito, 'rb') as f:
+            print_queue.sink.send(f.read())
         
-        resultado = subprocess.run(comando, capture_output=True, text=True, timeout=30)
-        
-        if resultado.returncode == 0:
-            return jsonify({
-                'success': True,
-                'message': 'Teste de impressão enviado com sucesso usando gabarito oficial!',
-                'comando_executado': ' '.join(comando),
-                'gabarito_usado': '/home/maikon/Documents/QualiPatio/SERVIDOR/gabarito_oficial.zpl'
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': f'Erro na impressão: {resultado.stderr}',
-                'comando_executado': ' '.join(comando)
-            }), 500
+        return jsonify({
+            'success': True,
+            'message': 'Teste de impressão enviado com sucesso usando gabarito oficial!',
+            'destino': repr(print_queue.sink),
+            'gabarito_usado': gabarito
+        })
             
+    except PrintError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erro na impressão: {str(e)}',
+            'destino': repr(print_queue.sink)
+        }), 500
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def gerar_numero_unico():
-    """Gera um número único de 5 dígitos verificando APENAS a tabela chapas"""
-    import random
-    
-    conn = db_manager.get_connection()
-    cursor = conn.cursor()
-    
-    max_tentativas = 100
-    for _ in range(max_tentativas):
-        # Gerar número de 5 dígitos
-        numero = random.randint(10000, 99999)
-        
-        # Verificar se já existe APENAS na tabela chapas
-        cursor.execute('SELECT COUNT(*) FROM chapas WHERE id_chapa = ?', (numero,))
-        existe = cursor.fetchone()[0]
-        
-        if existe == 0:
-            conn.close()
-            return numero
-    
-    conn.close()
-    # Se não conseguir gerar único, usar timestamp
-    return int(str(int(datetime.now().timestamp()))[-5:])
-
 @app.route('/etiquetas/gerar', methods=['POST'])
 def gerar_etiqueta():
-    """Gera etiquetas com múltiplos IDs únicos e quantidade por ID"""
+    """Enfileira etiquetas com múltiplos IDs únicos e quantidade por ID
+    
+    A impressão acontece em segundo plano; a resposta traz o ID do job,
+    cujo progresso é consultado em ``GET /etiquetas/jobs/<id>``.
+    """
     try:
-        import subprocess
-        import tempfile
-        
         # Obter dados da requisição
         dados = request.get_json() or {}
         # Aceitar tanto os nomes novos quanto os antigos do cliente
-        quantidade_ids = dados.get('quantidade_ids', dados.get('quantidade_etiquetas', 1))
-        quantidade_por_id = dados.get('quantidade_por_id', dados.get('quantidade_cada', 1))
-        
-        
-        # Ler o gabarito oficial
-        with open('/home/maikon/Documents/QualiPatio/SERVIDOR/gabarito_oficial.zpl', 'r') as f:
-            gabarito_base = f.read()
+        quantidade_ids = int(dados.get('quantidade_ids', dados.get('quantidade_etiquetas', 1)))
+        quantidade_por_id = int(dados.get('quantidade_por_id', dados.get('quantidade_cada', 1)))
+        if quantidade_por_id < 1:
+            return jsonify({'success': False, 'error': 'Quantidade por ID deve ser maior que zero'}), 400
         
-        # Processar cada ID único
-        total_sucessos = 0
-        total_erros = []
-        ids_gerados = []
+        gabarito = print_queue.template_path
+        try:
+            print_queue.get_template()
+        except (OSError, ValueError) as e:
+            return jsonify({'success': False, 'error': f'Gabarito indisponível: {str(e)}'}), 500
         
-        for id_index in range(quantidade_ids):
-            # Gerar número único para este ID
-            numero_etiqueta = gerar_numero_unico()
-            ids_gerados.append(numero_etiqueta)
-            
-            
-            # Substituir o número placeholder (12345) pelo número gerado
-            zpl_content = gabarito_base.replace('12345', str(numero_etiqueta))
-            
-            # Salvar arquivo temporário com o número substituído
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.zpl', delete=False) as f:
-                f.write(zpl_content)
-                arquivo_zpl = f.name
-            
-            # Imprimir múltiplas etiquetas deste ID
-            for etiqueta_index in range(quantidade_por_id):
-                comando = ['lpr', '-P', '4BARCODE', '-o', 'raw', arquivo_zpl]
-                
-                resultado = subprocess.run(comando, capture_output=True, text=True, timeout=30)
-                
-                if resultado.returncode == 0:
-                    total_sucessos += 1
-                else:
-                    total_erros.append(f"Erro na etiqueta {etiqueta_index + 1} do ID {numero_etiqueta}: {resultado.stderr}")
-            
-            # Limpar arquivo temporário
-            os.unlink(arquivo_zpl)
+        # Reservar os IDs únicos e gravar o job juntos (ou nenhum dos dois)
+        job_id, ids_gerados = print_queue.enqueue_new_labels(quantidade_ids, quantidade_por_id)
         
         total_solicitado = quantidade_ids * quantidade_por_id
-        
-        if total_sucessos == total_solicitado:
-            return jsonify({
-                'success': True,
-                'message': f'{total_sucessos} etiquetas impressas com sucesso! ({quantidade_ids} IDs únicos, {quantidade_por_id} etiquetas cada)',
-                'ids_gerados': ids_gerados,
-                'quantidade_ids': quantidade_ids,
-                'quantidade_por_id': quantidade_por_id,
-                'total_impresso': total_sucessos,
-                'total_solicitado': total_solicitado,
-                'gabarito_usado': '/home/maikon/Documents/QualiPatio/SERVIDOR/gabarito_oficial.zpl'
-            })
-        elif total_sucessos > 0:
-            return jsonify({
-                'success': True,
-                'message': f'{total_sucessos} de {total_solicitado} etiquetas impressas. Alguns erros ocorreram.',
-                'ids_gerados': ids_gerados,
-                'quantidade_ids': quantidade_ids,
-                'quantidade_por_id': quantidade_por_id,
-                'total_impresso': total_sucessos,
-                'total_solicitado': total_solicitado,
-                'erros': total_erros,
-                'gabarito_usado': '/home/maikon/Documents/QualiPatio/SERVIDOR/gabarito_oficial.zpl'
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': f'Nenhuma etiqueta foi impressa. Erros: {total_erros}',
-                'ids_gerados': ids_gerados,
-                'quantidade_ids': quantidade_ids,
-                'quantidade_por_id': quantidade_por_id,
-                'total_solicitado': total_solicitado,
-                'erros': total_erros
-            }), 500
+        return jsonify({
+            'success': True,
+            'message': f'{total_solicitado} etiquetas enviadas para a fila de impressão ({quantidade_ids} IDs únicos, {quantidade_por_id} etiquetas cada)',
+            'job_id': job_id,
+            'status_url': f'/etiquetas/jobs/{job_id}',
+            'ids_gerados': ids_gerados,
+            'quantidade_ids': quantidade_ids,
+            'quantidade_por_id': quantidade_por_id,
+            'total_solicitado': total_solicitado,
+            'gabarito_usado': gabarito
+        }), 202
             
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-if __name__ == '__main__':
-    # O banco de dados é criado automaticamente pelo DatabaseManager
+@app.route('/etiquetas/jobs/<int:job_id>', methods=['GET'])
+def consultar_job_impressao(job_id):
+    """Retorna o progresso de um job de impressão e as falhas por etiqueta"""
+    try:
+        job = print_queue.get_job(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': f'Job {job_id} não encontrado'}), 404
+        return jsonify({'success': True, 'job': job})
     
-    print("SERVIDOR DE CONTROLE DE ESTOQUE - MARMORARIA")
-    print("Servidor rodando em: http://localhost:5000")
-    print("Para parar o servidor, pressione Ctrl+C")
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/etiquetas/reservadas', methods=['GET'])
+def listar_etiquetas_reservadas():
+    """Lista IDs já impressos que ainda não foram cadastrados como chapa"""
+    try:
+        pendentes = db_manager.get_pending_label_ids()
+        return jsonify({'success': True, 'total': len(pendentes), 'etiquetas': pendentes})
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/retalhos', methods=['GET'])
+@conditional_get(db_manager, 'retalhos')
 def listar_retalhos():
-    """Lista os retalhos cadastrados"""
-    try:
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT id_retalho, id_chapa_original, nome_material, fornecedor,
-                   area_retalho, localizacao, data_transformacao
-            FROM retalhos
-            ORDER BY data_transformacao DESC
-        ''')
-
-        retalhos = []
-        for row in cursor.fetchall():
-            ret = {
-                'id_retalho': row['id_retalho'],
-                'id_chapa_original': row['id_chapa_original'],
-                'nome_material': row['nome_material'],
-                'fornecedor': row['fornecedor'],
-                'area_retalho': row['area_retalho'],
-                'localizacao': row['localizacao'],
-                'data_transformacao': row['data_transformacao']
-            }
-            retalhos.append(ret)
-
-        conn.close()
-        return jsonify({'success': True, 'retalhos': retalhos})
+    """Lista os retalhos cadastrados
+    
+    Aceita ``limit``/``cursor`` e ``stream`` da mesma forma que ``GET /chapas``.
+    """
+    try:
+        page = parse_page_args(request.args)
+
+        query = RETALHO_LEGACY.select(order_by='data_transformacao DESC')
+        if page is None and is_stream_requested(request.args):
+            return stream_json_array(db_manager, RETALHO_LEGACY, 'data_transformacao', 'id_retalho',
+                                     prefix='{"success": true, "retalhos": [', suffix=']}')
+
+        with db_manager.get_connection() as conn:
+            if page is None:
+                rows = fetch_tuples(conn, query)
+            else:
+                rows, next_cursor = fetch_page(conn, RETALHO_LEGACY.select(),
+                                               'data_transformacao', 'id_retalho', page)
+
+        retalhos = RETALHO_LEGACY.to_dicts(rows)
+
+        resposta = {'success': True, 'retalhos': retalhos}
+        if page is not None:
+            resposta['next_cursor'] = next_cursor
+        return json_response(resposta)
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/retalhos/match', methods=['GET'])
+def encontrar_retalhos():
+    """Retorna os menores retalhos do material que comportam uma peça
+    
+    Parâmetros: ``material`` (obrigatório), ``min_area`` (m²), ``w`` e ``h``
+    (medidas da peça em metros, em qualquer orientação) e ``limit``.
+    """
+    material = request.args.get('material', '').strip()
+    if not material:
+        return jsonify({'success': False, 'error': 'Parâmetro material é obrigatório'}), 400
+    
+    try:
+        min_area = float(request.args.get('min_area', 0))
+        largura, comprimento = parse_dimensions(request.args.get('w'), request.args.get('h'))
+        limit = int(request.args.get('limit', ServerConfig.get_remnant_match_limit()))
+        if min_area < 0 or limit < 1:
+            raise ValueError('min_area não pode ser negativa e limit deve ser maior que zero')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        retalhos = find_fitting_remnants(db_manager, material, min_area, largura, comprimento,
+                                         min(limit, ServerConfig.get_max_page_size()))
+        
+        return json_response({'success': True, 'retalhos': retalhos})
+    
+    except Exception as e:
+        print(f"ERRO ao buscar retalhos: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/cortes/planejar', methods=['POST'])
+def planejar_cortes():
+    """Distribui as peças de uma OS entre os retalhos e chapas do material
+    
+    Body: ``material`` e ``pecas`` (``largura``, ``comprimento`` em metros,
+    ``quantidade`` e ``ref`` opcionais). Nada é gravado; o plano retornado
+    pode ser confirmado em ``/cortes/confirmar``.
+    """
+    try:
+        data = request.get_json()
+        
+        material = (data.get('material') or '').strip()
+        if not material:
+            return jsonify({'success': False, 'error': 'Campo material é obrigatório'}), 400
+        pecas = cut_planner.parse_pieces(data.get('pecas'))
+        
+        plano = cut_planner.plan_cuts(material, pecas, cut_planner.load_stock(db_manager, material))
+        
+        return json_response({'success': True, 'plano': plano})
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"ERRO ao planejar cortes: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/cortes/confirmar', methods=['POST'])
+def confirmar_cortes():
+    """Registra um plano de corte como saídas de estoque da OS
+    
+    Body: ``os`` e ``plano`` (como retornado por ``/cortes/planejar``).
+    Todas as chapas e retalhos do plano são baixados juntos ou nenhum.
+    """
+    try:
+        data = request.get_json()
+        
+        if not isinstance(data.get('plano'), dict):
+            return jsonify({'success': False, 'error': 'Campo plano é obrigatório'}), 400
+        
+        resultado = cut_planner.commit_plan(db_manager, data['plano'], (data.get('os') or '').strip())
+        
+        return jsonify({'success': True, **resultado})
     
+    except WriteRejected as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
+        print(f"ERRO ao confirmar plano de corte: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 if __name__ == '__main__':
-    # Executar servidor Flask
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Servidor de desenvolvimento (um processo); em produção use serve.py
+    metrics.clear_snapshots()
+    init_process()
+    app.run(host=ServerConfig.get_server_host(), port=ServerConfig.get_server_port(),
+            debug=ServerConfig.get_debug_mode())
 
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Arquivamento das movimentações antigas em arquivos mensais
+
+``movimentacoes`` só cresce. Os meses fechados além dos últimos
+``get_archive_keep_months()`` são copiados para
+``archive/movimentacoes_AAAA_MM.db`` e depois apagados do banco principal,
+que continua pequeno (backup e cache de páginas mais leves).
+
+A cópia é idempotente (``INSERT OR IGNORE`` pela chave original) e as
+linhas só saem do banco principal depois de confirmadas no arquivo: se o
+processo cair no meio, a próxima execução retoma sem perder nem duplicar
+nada. O resumo ``consumo_diario`` não é afetado.
+
+As consultas ao histórico anexam (ATTACH) apenas os arquivos dos meses
+pedidos, em grupos abaixo do limite de bancos anexados do SQLite, e leem
+por uma view temporária que une o banco principal aos arquivos.
+"""
+
+import os
+import re
+import sqlite3
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+from config import ServerConfig
+
+_COLUMNS = 'id_movimentacao, id_chapa, tipo_movimentacao, quantidade_m2, os_associada, data_movimentacao'
+
+_ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS movimentacoes (
+        id_movimentacao INTEGER PRIMARY KEY,
+        id_chapa INTEGER NOT NULL,
+        tipo_movimentacao TEXT NOT NULL,
+        quantidade_m2 REAL NOT NULL,
+        os_associada TEXT,
+        data_movimentacao TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_movimentacoes_chapa_data ON movimentacoes (id_chapa, data_movimentacao)',
+    'CREATE INDEX IF NOT EXISTS idx_movimentacoes_data ON movimentacoes (data_movimentacao)',
+]
+
+_FILE_NAME = re.compile(r'^movimentacoes_(\d{4})_(\d{2})\.db$')
+
+# Linhas copiadas por bloco para o arquivo mensal
+_COPY_CHUNK_ROWS = 5000
+
+
+def _month_start(year: int, month: int) -> str:
+    return f'{year:04d}-{month:02d}-01'
+
+
+def _next_month(year: int, month: int) -> Tuple[int, int]:
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def archive_cutoff(keep_months: int, today: Optional[date] = None) -> str:
+    """Primeiro dia do mês mais antigo que permanece no banco principal"""
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - keep_months
+    return _month_start(index // 12, index % 12 + 1)
+
+
+def archive_path(year: int, month: int, archive_dir: Optional[str] = None) -> str:
+    """Caminho do arquivo mensal de ``year``/``month``"""
+    return os.path.join(archive_dir or ServerConfig.get_archive_dir(),
+                        f'movimentacoes_{year:04d}_{month:02d}.db')
+
+
+def list_archives(archive_dir: Optional[str] = None) -> List[Tuple[int, int, str]]:
+    """Arquivos mensais existentes como ``(ano, mês, caminho)``, do mais antigo ao mais novo"""
+    archive_dir = archive_dir or ServerConfig.get_archive_dir()
+    if not os.path.isdir(archive_dir):
+        return []
+    archives = []
+    for name in os.listdir(archive_dir):
+        match = _FILE_NAME.match(name)
+        if match:
+            archives.append((int(match.group(1)), int(match.group(2)), os.path.join(archive_dir, name)))
+    return sorted(archives)
+
+
+def first_unarchived_month(archive_dir: Optional[str] = None) -> Optional[str]:
+    """Primeiro dia do mês seguinte ao arquivo mensal mais recente (None sem arquivos)"""
+    archives = list_archives(archive_dir)
+    if not archives:
+        return None
+    year, month, _ = archives[-1]
+    return _month_start(*_next_month(year, month))
+
+
+def archive_closed_months(db_manager, keep_months: Optional[int] = None,
+                          archive_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Move para os arquivos mensais os meses anteriores ao corte
+
+    Retorna, por mês, o arquivo e quantas linhas foram copiadas e removidas.
+    """
+    if keep_months is None:
+        keep_months = ServerConfig.get_archive_keep_months()
+    archive_dir = archive_dir or ServerConfig.get_archive_dir()
+    cutoff = archive_cutoff(keep_months)
+
+    with db_manager.get_connection() as conn:
+        months = [row[0] for row in conn.execute('''
+            SELECT DISTINCT substr(data_movimentacao, 1, 7) FROM movimentacoes
+            WHERE data_movimentacao < ?
+            ORDER BY 1
+        ''', (cutoff,))]
+
+    os.makedirs(archive_dir, exist_ok=True)
+    return [_archive_month(db_manager, int(month[:4]), int(month[5:7]), archive_dir) for month in months]
+
+
+def _archive_month(db_manager, year: int, month: int, archive_dir: str) -> Dict[str, Any]:
+    """Copia um mês para o seu arquivo e só então o apaga do banco principal"""
+    start = _month_start(year, month)
+    end = _month_start(*_next_month(year, month))
+    path = archive_path(year, month, archive_dir)
+
+    copied = 0
+    last_id = None
+    archive = sqlite3.connect(path)
+    try:
+        archive.execute('PRAGMA synchronous = FULL')
+        for statement in _ARCHIVE_SCHEMA:
+            archive.execute(statement)
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(f'''
+                SELECT {_COLUMNS} FROM movimentacoes
+                WHERE data_movimentacao >= ? AND data_movimentacao < ?
+                ORDER BY id_movimentacao
+            ''', (start, end))
+            while True:
+                rows = cursor.fetchmany(_COPY_CHUNK_ROWS)
+                if not rows:
+                    break
+                archive.executemany(f'INSERT OR IGNORE INTO movimentacoes ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)',
+                                    rows)
+                copied += len(rows)
+                last_id = rows[-1][0]
+        archive.commit()
+    finally:
+        archive.close()
+
+    removed = 0
+    if last_id is not None:
+        # Linhas do mês gravadas depois da cópia ficam para a próxima execução
+        removed = db_manager.write(lambda conn: conn.execute('''
+            DELETE FROM movimentacoes
+            WHERE data_movimentacao >= ? AND data_movimentacao < ? AND id_movimentacao <= ?
+        ''', (start, end, last_id)).rowcount)
+
+    print(f"Movimentações de {year:04d}-{month:02d} arquivadas em {path}: {copied} copiadas, {removed} removidas")
+    return {'mes': f'{year:04d}-{month:02d}', 'arquivo': path, 'copiadas': copied, 'removidas': removed}
+
+
+def query_history(db_manager, id_chapa: Optional[int] = None, start: Optional[str] = None,
+                  end: Optional[str] = None, movement_type: Optional[str] = None,
+                  limit: Optional[int] = None, archive_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Movimentações do banco principal e dos arquivos, mais recentes primeiro
+
+    ``start`` e ``end`` são datas AAAA-MM-DD inclusivas; só os arquivos dos
+    meses dentro do intervalo são anexados.
+    """
+    max_rows = ServerConfig.get_history_max_rows()
+    limit = min(limit or max_rows, max_rows)
+
+    conditions = []
+    params: List[Any] = []
+    if id_chapa is not None:
+        conditions.append('id_chapa = ?')
+        params.append(id_chapa)
+    if start:
+        conditions.append('data_movimentacao >= ?')
+        params.append(start)
+    if end:
+        conditions.append("data_movimentacao < date(?, '+1 day')")
+        params.append(end)
+    if movement_type:
+        conditions.append('tipo_movimentacao = ?')
+        params.append(movement_type)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    archives = [path for year, month, path in list_archives(archive_dir)
+                if (not end or _month_start(year, month) <= end)
+                and (not start or _month_start(*_next_month(year, month)) > start)]
+
+    # Conexão própria: ATTACH altera o estado da conexão e não pode ocorrer
+    # dentro de uma transação, então as conexões do pool não são usadas
+    conn = sqlite3.connect(f'file:{db_manager.db_path}?mode=ro', uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    found: Dict[int, Dict[str, Any]] = {}
+    try:
+        batch_size = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        batches = [archives[i:i + batch_size] for i in range(0, len(archives), batch_size)] or [[]]
+        for index, batch in enumerate(batches):
+            sources = ['main.movimentacoes'] if index == 0 else []
+            try:
+                for position, path in enumerate(batch):
+                    conn.execute(f'ATTACH DATABASE ? AS arquivo_{position}', (f'file:{path}?mode=ro',))
+                    sources.append(f'arquivo_{position}.movimentacoes')
+                conn.execute('CREATE TEMP VIEW movimentacoes_historico AS '
+                             + ' UNION ALL '.join(f'SELECT {_COLUMNS} FROM {source}' for source in sources))
+                rows = conn.execute(f'''
+                    SELECT {_COLUMNS} FROM movimentacoes_historico
+                    {where}
+                    ORDER BY data_movimentacao DESC, id_movimentacao DESC
+                    LIMIT ?
+                ''', params + [limit]).fetchall()
+                # Um mês copiado mas ainda não apagado aparece nos dois lados
+                for row in rows:
+                    found[row['id_movimentacao']] = dict(row)
+            finally:
+                conn.execute('DROP VIEW IF EXISTS movimentacoes_historico')
+                for source in sources:
+                    if source != 'main.movimentacoes':
+                        conn.execute(f"DETACH DATABASE {source.split('.')[0]}")
+    finally:
+        conn.close()
+
+    history = sorted(found.values(), key=lambda row: (row['data_movimentacao'], row['id_movimentacao']),
+                     reverse=True)
+    return history[:limit]
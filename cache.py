@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache LRU com TTL para consultas quentes (leitura de QR Code por ID)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Cache em memória, limitado por tamanho e por tempo de vida
+    
+    ``get_or_load`` faz leitura-com-carga (read-through). Uma invalidação
+    que ocorra enquanto um valor está sendo carregado impede que esse valor,
+    possivelmente já desatualizado, seja guardado.
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """Retorna o valor em cache ou o carrega com ``loader``
+        
+        Resultados ``None`` (registro inexistente) não são guardados.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+        
+        value = loader()
+        if value is None:
+            return None
+        
+        with self._lock:
+            if self._generation == generation:
+                self._data[key] = (value, time.monotonic() + self.ttl)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return value
+    
+    def invalidate(self, key: Hashable):
+        """Remove uma chave após uma escrita"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._generation += 1
+            self.invalidations += 1
+    
+    def clear(self):
+        """Esvazia o cache"""
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Retorna os contadores de uso do cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GETs condicionais (ETag / If-None-Match) para as rotas consultadas em polling
+
+O ETag é derivado do contador de versões das tabelas lidas pela rota
+(mantido por triggers, ver migração 3) e da URL completa. Quando o
+cliente já tem a versão atual, a rota responde ``304 Not Modified`` sem
+executar a consulta das linhas.
+"""
+
+import hashlib
+from functools import wraps
+from flask import Response, make_response, request
+
+
+def conditional_get(db_manager, *tables):
+    """Decorator que aplica ETag/304 a uma rota que depende de ``tables``"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = db_manager.get_table_versions(tables)
+            key = request.full_path + '|' + ','.join(f'{t}:{versions.get(t, 0)}' for t in tables)
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+            
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
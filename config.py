@@ -11,8 +11,8 @@ class ServerConfig:
     
     @staticmethod
     def get_database_path():
-        """Retorna o caminho do banco de dados"""
-        return os.path.join(os.path.dirname(__file__), 'qualicam.db')
+        """Retorna o caminho do banco de dados (``QUALICAM_DB_PATH`` substitui o padrão)"""
+        return os.environ.get('QUALICAM_DB_PATH') or os.path.join(os.path.dirname(__file__), 'qualicam.db')
     
     @staticmethod
     def get_server_host():
@@ -21,6 +21,318 @@ class ServerConfig:
     
     @staticmethod
     def get_server_port():
-        """Retorna a porta do servidor"""
+        """Retorna a porta do servidor (``QUALICAM_PORT`` substitui o padrão)"""
+        return int(os.environ.get('QUALICAM_PORT') or 5000)
+    
+    @staticmethod
+    def get_debug_mode():
+        """Indica se o servidor de desenvolvimento roda com debugger e reloader"""
+        return False
+    
+    @staticmethod
+    def get_server_workers():
+        """Retorna quantos processos de trabalho o ``serve.py`` cria (um por núcleo)
+        
+        ``QUALICAM_WORKERS`` substitui o padrão.
+        """
+        return int(os.environ.get('QUALICAM_WORKERS') or os.cpu_count() or 2)
+    
+    @staticmethod
+    def get_server_threads():
+        """Retorna quantas threads atendem requisições em cada processo
+        
+        Igual ao tamanho do pool para que toda thread consiga uma conexão.
+        O escritor, o feed de eventos e a impressão usam conexões próprias,
+        fora do pool, e não ocupam essas vagas.
+        """
+        return ServerConfig.get_pool_size()
+    
+    @staticmethod
+    def get_keepalive():
+        """Retorna por quantos segundos uma conexão HTTP ociosa fica aberta"""
+        return 5
+    
+    @staticmethod
+    def get_request_timeout():
+        """Retorna após quantos segundos sem resposta um processo é reiniciado"""
+        return 60
+    
+    @staticmethod
+    def get_graceful_timeout():
+        """Retorna quanto tempo (s) os processos têm para concluir as
+        requisições em andamento ao recarregar (SIGHUP) ou parar (SIGTERM)"""
+        return 30
+    
+    @staticmethod
+    def get_pool_size():
+        """Retorna o número máximo de conexões abertas no pool"""
+        return 8
+    
+    @staticmethod
+    def get_pool_timeout():
+        """Retorna o tempo máximo (s) de espera por uma conexão livre"""
+        return 10.0
+    
+    @staticmethod
+    def get_pool_max_age():
+        """Retorna a idade máxima (s) de uma conexão antes de ser reciclada"""
+        return 3600.0
+    
+    @staticmethod
+    def get_sqlite_pragmas():
+        """Retorna os PRAGMAs aplicados a cada conexão nova"""
+        return {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -16000,     # ~16 MB por conexão
+            'mmap_size': 268435456,   # 256 MB
+            'temp_store': 'MEMORY',
+        }
+    
+    @staticmethod
+    def get_default_page_size():
+        """Retorna o tamanho de página padrão das listagens paginadas"""
+        return 100
+    
+    @staticmethod
+    def get_max_page_size():
+        """Retorna o tamanho máximo de página aceito nas listagens"""
+        return 500
+    
+    @staticmethod
+    def get_stream_chunk_rows():
+        """Retorna quantas linhas cada página (uma conexão emprestada) lê nas respostas em streaming"""
+        return 500
+    
+    @staticmethod
+    def get_bulk_max_rows():
+        """Retorna o número máximo de chapas aceitas em uma única carga em lote"""
         return 5000
-
+    
+    @staticmethod
+    def get_lookup_max_ids():
+        """Retorna o número máximo de IDs aceitos em uma consulta múltipla"""
+        return 1000
+    
+    @staticmethod
+    def get_slab_cache_size():
+        """Retorna quantas chapas o cache de consulta por ID mantém em memória"""
+        return 2048
+    
+    @staticmethod
+    def get_slab_cache_ttl():
+        """Retorna a validade (s) de uma chapa no cache de consulta por ID
+        
+        A invalidação nas escritas é imediata, por chave, no próprio processo;
+        o TTL curto limita o atraso visto por outros processos do servidor,
+        sem custar uma ida ao banco a cada leitura em cache.
+        """
+        return 2.0
+    
+    @staticmethod
+    def get_printer_name():
+        """Retorna o nome da fila CUPS da impressora de etiquetas"""
+        return '4BARCODE'
+    
+    @staticmethod
+    def get_printer_uri():
+        """Retorna o destino dos trabalhos de impressão
+        
+        ``lpr://<fila>`` envia pelo CUPS; ``tcp://<host>:9100`` envia direto
+        para a porta RAW da impressora. ``QUALICAM_PRINTER_URI`` substitui
+        o padrão.
+        """
+        return os.environ.get('QUALICAM_PRINTER_URI') or f'lpr://{ServerConfig.get_printer_name()}'
+    
+    @staticmethod
+    def get_label_template_path():
+        """Retorna o caminho do gabarito ZPL oficial (``QUALICAM_LABEL_TEMPLATE`` substitui o padrão)"""
+        return (os.environ.get('QUALICAM_LABEL_TEMPLATE')
+                or '/home/maikon/Documents/QualiPatio/SERVIDOR/gabarito_oficial.zpl')
+    
+    @staticmethod
+    def get_label_max_ids():
+        """Retorna quantos IDs únicos um único pedido de etiquetas pode reservar"""
+        return 500
+    
+    @staticmethod
+    def get_print_workers():
+        """Retorna quantas threads consomem a fila de impressão"""
+        return 1
+    
+    @staticmethod
+    def get_print_max_attempts():
+        """Retorna quantas vezes uma etiqueta é tentada antes de falhar"""
+        return 5
+    
+    @staticmethod
+    def get_print_retry_delay():
+        """Retorna o intervalo base (s) entre tentativas, dobrado a cada falha"""
+        return 5.0
+    
+    @staticmethod
+    def get_print_lease():
+        """Retorna por quanto tempo (s) um worker detém uma etiqueta em impressão
+        
+        Se o processo morrer no meio, a etiqueta volta para a fila após esse prazo.
+        """
+        return 120.0
+    
+    @staticmethod
+    def get_print_batch_size():
+        """Retorna quantas etiquetas no máximo vão em um único trabalho de spool"""
+        return 200
+    
+    @staticmethod
+    def get_write_batch_size():
+        """Retorna quantas escritas no máximo vão em uma mesma transação do escritor"""
+        return 100
+    
+    @staticmethod
+    def get_write_batch_delay():
+        """Retorna quanto tempo (s) o escritor espera por mais escritas antes do COMMIT"""
+        return 0.002
+    
+    @staticmethod
+    def get_write_timeout():
+        """Retorna o tempo máximo (s) que uma requisição espera sua escrita ser confirmada"""
+        return 30.0
+    
+    @staticmethod
+    def get_sse_poll_interval():
+        """Retorna de quanto em quanto tempo (s) cada processo busca eventos novos no banco"""
+        return 0.25
+    
+    @staticmethod
+    def get_sse_heartbeat():
+        """Retorna o intervalo (s) dos comentários de keep-alive no feed ``/events``"""
+        return 15.0
+    
+    @staticmethod
+    def get_sse_buffer_size():
+        """Retorna quantos eventos recentes cada processo mantém em memória para retomada"""
+        return 1000
+    
+    @staticmethod
+    def get_sse_max_clients():
+        """Retorna quantos clientes ``/events`` cada processo aceita
+        
+        Cada cliente conectado ocupa uma thread de atendimento; o restante
+        fica livre para as demais rotas.
+        """
+        return max(1, ServerConfig.get_server_threads() // 2)
+    
+    @staticmethod
+    def get_event_retention():
+        """Retorna quantos eventos mais recentes são mantidos na tabela ``eventos``"""
+        return 50000
+    
+    @staticmethod
+    def get_sync_max_changes():
+        """Retorna quantas entradas do log de alterações vão em uma resposta de ``/app/sync``"""
+        return 1000
+    
+    @staticmethod
+    def get_sync_tombstone_days():
+        """Retorna por quantos dias as exclusões ficam no log antes da compactação
+        
+        Clientes que não sincronizam há mais tempo que isso precisam
+        baixar as listas completas novamente.
+        """
+        return 30
+    
+    @staticmethod
+    def get_archive_dir():
+        """Retorna a pasta dos arquivos mensais de movimentações arquivadas"""
+        return os.path.join(os.path.dirname(ServerConfig.get_database_path()), 'archive')
+    
+    @staticmethod
+    def get_archive_keep_months():
+        """Retorna quantos meses fechados de movimentações ficam no banco principal
+        
+        Meses mais antigos que isso são movidos para ``get_archive_dir()``.
+        """
+        return 12
+    
+    @staticmethod
+    def get_history_max_rows():
+        """Retorna o número máximo de movimentações em uma consulta ao histórico"""
+        return 1000
+    
+    @staticmethod
+    def get_metrics_dir():
+        """Retorna a pasta onde cada processo grava o retrato das suas métricas"""
+        return os.path.join(os.path.dirname(ServerConfig.get_database_path()), 'metrics')
+    
+    @staticmethod
+    def get_metrics_flush_interval():
+        """Retorna de quantos em quantos segundos cada processo grava suas métricas
+        
+        Os demais processos aparecem no ``/metrics`` com até esse atraso.
+        """
+        return 5.0
+    
+    @staticmethod
+    def get_sql_profiling():
+        """Retorna se as consultas SQL são cronometradas (``/debug/sql``)
+        
+        Desligado por padrão; ``QUALICAM_SQL_PROFILE=1`` liga.
+        """
+        return os.environ.get('QUALICAM_SQL_PROFILE', '') not in ('', '0')
+    
+    @staticmethod
+    def get_sql_slow_threshold():
+        """Retorna a partir de quantos segundos uma consulta vai para o log de lentas
+        
+        ``QUALICAM_SQL_SLOW`` substitui o padrão.
+        """
+        return float(os.environ.get('QUALICAM_SQL_SLOW') or 0.05)
+    
+    @staticmethod
+    def get_sql_profile_max_statements():
+        """Retorna quantas consultas distintas o perfil guarda (as demais são agrupadas)"""
+        return 500
+    
+    @staticmethod
+    def get_sql_slow_log_size():
+        """Retorna quantas consultas lentas recentes o ``/debug/sql`` mostra"""
+        return 50
+    
+    @staticmethod
+    def get_remnant_match_limit():
+        """Retorna quantos retalhos ``/retalhos/match`` devolve por padrão"""
+        return 10
+    
+    @staticmethod
+    def get_cut_plan_time_budget():
+        """Retorna por quanto tempo (s) o planejador de cortes procura planos melhores"""
+        return 1.0
+    
+    @staticmethod
+    def get_cut_kerf():
+        """Retorna a espessura do disco de corte (m), somada uma vez à largura e uma vez ao comprimento de cada peça"""
+        return 0.0
+    
+    @staticmethod
+    def get_cut_remnant_weight():
+        """Retorna o peso da área de um retalho aberto no custo do plano de corte
+        
+        Chapas pesam 1.0; um peso menor faz o planejador preferir retalhos.
+        """
+        return 0.25
+    
+    @staticmethod
+    def get_cut_max_pieces():
+        """Retorna quantas peças (somando as quantidades) um plano de corte aceita"""
+        return 2000
+    
+    @staticmethod
+    def get_cut_parallel_min_pieces():
+        """Retorna a partir de quantas peças a busca do plano roda em vários processos"""
+        return 200
+    
+    @staticmethod
+    def get_cut_plan_processes():
+        """Retorna quantos processos auxiliares o planejador de cortes usa em pedidos grandes"""
+        return max(1, (os.cpu_count() or 2) // 2)
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Planejamento de cortes das peças de uma OS
+
+Dadas as peças retangulares de uma OS e o material, distribui as peças
+entre os retalhos e as chapas disponíveis procurando abrir o mínimo de
+estoque novo. O custo de um plano é a área de cada chapa ou retalho
+aberto, com os retalhos pesando ``get_cut_remnant_weight()`` (padrão 1/4),
+então sobras existentes são usadas antes de chapas inteiras.
+
+Retalhos com largura e comprimento cadastrados recebem as peças em
+posições reais (guilhotina, com rotação); chapas e retalhos sem medidas
+só têm área, então neles a alocação é só por área disponível: nada
+garante que as peças caibam fisicamente em uma chapa, o que fica a
+cargo de quem executa o corte.
+
+Cada peça é posicionada pelo melhor candidato (estoque já aberto antes
+de estoque novo; depois o encaixe mais justo), calculado de uma vez para
+todos os candidatos com NumPy. A ordem das peças é reembaralhada em
+tentativas sucessivas até ``get_cut_plan_time_budget()`` segundos,
+guardando o melhor plano; pedidos grandes dividem as tentativas entre
+processos auxiliares.
+
+O plano não altera o banco. ``commit_plan`` registra tudo em uma única
+transação: uma movimentação ``SAÍDA`` por chapa ou retalho usado e a
+área restante de cada um. De um retalho com medidas sobra só o maior
+retângulo livre; o resto é descartado junto com a saída.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+import events
+from config import ServerConfig
+from write_queue import WriteRejected
+
+CHAPA = 'chapa'
+RETALHO = 'retalho'
+
+# Folga numérica nas comparações de medidas e áreas (m / m²)
+_EPS = 1e-9
+
+# Peso da sobra no desempate entre candidatos de mesmo custo de abertura
+_FIT_WEIGHT = 1e-3
+
+# Tentativas máximas por busca, mesmo que ainda reste tempo
+_MAX_ATTEMPTS = 500
+
+# Ordens tentadas ao refazer, na confirmação, o encaixe em um retalho
+_REFIT_ATTEMPTS = 50
+
+
+class Piece(NamedTuple):
+    """Uma peça da OS (já expandida pela quantidade)"""
+    ref: str
+    width: float
+    height: float
+
+
+class Stock(NamedTuple):
+    """Chapa ou retalho candidato; ``width``/``height`` None quando só há área"""
+    kind: str
+    id: int
+    id_chapa: int
+    area: float
+    width: Optional[float]
+    height: Optional[float]
+
+
+class _Result(NamedTuple):
+    key: Tuple[int, float, int]
+    placements: List[Optional[Tuple[int, float, float, bool]]]
+    leftovers: Dict[int, Tuple[float, float]]
+
+
+def parse_pieces(items: Any) -> List[Piece]:
+    """Valida ``[{"largura", "comprimento", "quantidade", "ref"}]`` e expande as quantidades"""
+    if not isinstance(items, list) or not items:
+        raise ValueError('Campo pecas deve ser uma lista não vazia')
+    max_pieces = ServerConfig.get_cut_max_pieces()
+    pieces = []
+    for index, item in enumerate(items, 1):
+        try:
+            width = float(item['largura'])
+            height = float(item['comprimento'])
+            quantity = int(item.get('quantidade', 1))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError(f'Peça {index}: largura e comprimento numéricos são obrigatórios')
+        if width <= 0 or height <= 0 or quantity < 1:
+            raise ValueError(f'Peça {index}: medidas e quantidade devem ser maiores que zero')
+        if len(pieces) + quantity > max_pieces:
+            raise ValueError(f'O plano aceita no máximo {max_pieces} peças')
+        ref = str(item.get('ref', index))
+        pieces.extend(Piece(ref, width, height) for _ in range(quantity))
+    return pieces
+
+
+def load_stock(db_manager, material: str) -> List[Stock]:
+    """Retalhos e chapas disponíveis do material"""
+    with db_manager.get_connection() as conn:
+        remnants = conn.execute('''
+            SELECT id_retalho, id_chapa_original, area_retalho, largura, comprimento
+            FROM retalhos
+            WHERE nome_material = ? AND area_retalho > 0
+        ''', (material,)).fetchall()
+        slabs = conn.execute('''
+            SELECT id_chapa, area_disponivel FROM chapas
+            WHERE nome_material = ? AND status = 'Disponível' AND area_disponivel > 0
+        ''', (material,)).fetchall()
+    stock = [Stock(RETALHO, row[0], row[1], row[2], row[3], row[4]) for row in remnants]
+    stock.extend(Stock(CHAPA, row[0], row[0], row[1], None, None) for row in slabs)
+    return stock
+
+
+# ----------------------------------------------------------------------
+# Busca do plano
+# ----------------------------------------------------------------------
+
+def _pack(sizes: np.ndarray, order: np.ndarray, areas: np.ndarray, widths: np.ndarray,
+          heights: np.ndarray, open_costs: np.ndarray) -> _Result:
+    """Posiciona as peças na ordem dada, cada uma no melhor candidato"""
+    n_stock = len(areas)
+    remaining = areas.copy()
+    opened = np.zeros(n_stock, dtype=bool)
+    area_only = np.isnan(widths)
+
+    # Retângulos livres dos estoques com medidas: cada peça posicionada
+    # consome um e cria no máximo dois
+    with_size = np.flatnonzero(~area_only)
+    capacity = len(with_size) + 2 * len(sizes)
+    rect_stock = np.zeros(capacity, dtype=np.int64)
+    rect_x = np.zeros(capacity)
+    rect_y = np.zeros(capacity)
+    rect_w = np.zeros(capacity)
+    rect_h = np.zeros(capacity)
+    valid = np.zeros(capacity, dtype=bool)
+    count = len(with_size)
+    rect_stock[:count] = with_size
+    rect_w[:count] = widths[with_size]
+    rect_h[:count] = heights[with_size]
+    valid[:count] = True
+
+    placements: List[Optional[Tuple[int, float, float, bool]]] = [None] * len(sizes)
+    for piece in order:
+        w, h = sizes[piece]
+        a = w * h
+        best_cost = np.inf
+        choice = None
+
+        # Estoques só com área
+        fits = area_only & (remaining >= a - _EPS)
+        if fits.any():
+            costs = np.where(opened, 0.0, open_costs) + _FIT_WEIGHT * (remaining - a)
+            costs[~fits] = np.inf
+            index = int(np.argmin(costs))
+            best_cost = costs[index]
+            choice = ('area', index)
+
+        # Retângulos livres, nas duas orientações
+        rects = np.flatnonzero(valid)
+        if len(rects):
+            owner = rect_stock[rects]
+            free_w, free_h = rect_w[rects], rect_h[rects]
+            fit_normal = (free_w >= w - _EPS) & (free_h >= h - _EPS)
+            fit_rotated = (free_w >= h - _EPS) & (free_h >= w - _EPS)
+            fits = (fit_normal | fit_rotated) & (remaining[owner] >= a - _EPS)
+            if fits.any():
+                costs = np.where(opened[owner], 0.0, open_costs[owner]) + _FIT_WEIGHT * (free_w * free_h - a)
+                costs[~fits] = np.inf
+                index = int(np.argmin(costs))
+                if costs[index] < best_cost:
+                    # Orientação que deixa a menor folga no lado mais justo
+                    slack_normal = min(free_w[index] - w, free_h[index] - h) if fit_normal[index] else np.inf
+                    slack_rotated = min(free_w[index] - h, free_h[index] - w) if fit_rotated[index] else np.inf
+                    choice = ('rect', rects[index], slack_rotated < slack_normal)
+
+        if choice is None:
+            continue
+        if choice[0] == 'area':
+            stock = choice[1]
+            placements[piece] = (stock, None, None, False)
+        else:
+            _, rect, rotated = choice
+            stock = int(rect_stock[rect])
+            pw, ph = (h, w) if rotated else (w, h)
+            x, y, fw, fh = rect_x[rect], rect_y[rect], rect_w[rect], rect_h[rect]
+            valid[rect] = False
+            # Corte guilhotina que preserva o maior retângulo livre
+            if (fw - pw) * fh >= fw * (fh - ph):
+                splits = ((x + pw, y, fw - pw, fh), (x, y + ph, pw, fh - ph))
+            else:
+                splits = ((x + pw, y, fw - pw, ph), (x, y + ph, fw, fh - ph))
+            for sx, sy, sw, sh in splits:
+                if sw > _EPS and sh > _EPS:
+                    rect_stock[count], rect_x[count], rect_y[count] = stock, sx, sy
+                    rect_w[count], rect_h[count] = sw, sh
+                    valid[count] = True
+                    count += 1
+            placements[piece] = (stock, float(x), float(y), bool(rotated))
+        remaining[stock] -= a
+        opened[stock] = True
+
+    # Maior retângulo livre de cada retalho usado: a sobra aproveitável
+    leftovers: Dict[int, Tuple[float, float]] = {}
+    for rect in np.flatnonzero(valid):
+        stock = int(rect_stock[rect])
+        if opened[stock]:
+            size = (float(rect_w[rect]), float(rect_h[rect]))
+            if stock not in leftovers or size[0] * size[1] > leftovers[stock][0] * leftovers[stock][1]:
+                leftovers[stock] = size
+
+    unplaced = sum(1 for placement in placements if placement is None)
+    key = (unplaced, float(open_costs[opened].sum()), int(opened.sum()))
+    return _Result(key, placements, leftovers)
+
+
+def _search(sizes: np.ndarray, areas: np.ndarray, widths: np.ndarray, heights: np.ndarray,
+            open_costs: np.ndarray, time_budget: float, seed: int) -> Tuple[_Result, int]:
+    """Repete o posicionamento com ordens perturbadas até o fim do prazo
+
+    A primeira tentativa da semente 0 usa a ordem clássica (maiores peças
+    primeiro); as demais multiplicam a área por um ruído aleatório.
+    """
+    rng = np.random.default_rng(seed)
+    piece_areas = sizes[:, 0] * sizes[:, 1]
+    deadline = time.monotonic() + time_budget
+    best = None
+    attempts = 0
+    while True:
+        if seed == 0 and attempts == 0:
+            order = np.argsort(-piece_areas, kind='stable')
+        else:
+            order = np.argsort(-piece_areas * rng.uniform(0.6, 1.4, len(piece_areas)))
+        result = _pack(sizes, order, areas, widths, heights, open_costs)
+        attempts += 1
+        if best is None or result.key < best.key:
+            best = result
+        if time.monotonic() >= deadline or attempts >= _MAX_ATTEMPTS:
+            return best, attempts
+
+
+def _refit_remnant(sizes: np.ndarray, area: float, width: float,
+                   height: float) -> Optional[Tuple[float, float]]:
+    """Refaz o encaixe das peças em um único retalho com medidas
+
+    Retorna o maior retângulo livre que sobra (``(0.0, 0.0)`` se nenhum) ou
+    None quando nenhuma das ordens tentadas acomoda todas as peças.
+    """
+    rng = np.random.default_rng(0)
+    piece_areas = sizes[:, 0] * sizes[:, 1]
+    stock = (np.array([area]), np.array([width]), np.array([height]), np.ones(1))
+    for attempt in range(_REFIT_ATTEMPTS):
+        if attempt == 0:
+            order = np.argsort(-piece_areas, kind='stable')
+        else:
+            order = np.argsort(-piece_areas * rng.uniform(0.6, 1.4, len(piece_areas)))
+        result = _pack(sizes, order, *stock)
+        if result.key[0] == 0:
+            return result.leftovers.get(0, (0.0, 0.0))
+    return None
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Pool de processos auxiliares deste processo do servidor
+
+    Os auxiliares são criados por ``spawn``: um fork de um processo com
+    várias threads poderia herdar travas ocupadas.
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=ServerConfig.get_cut_plan_processes(),
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def shutdown():
+    """Encerra os processos auxiliares, se foram criados"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def plan_cuts(material: str, pieces: List[Piece], stock: List[Stock],
+              time_budget: Optional[float] = None) -> Dict[str, Any]:
+    """Procura o plano de menor custo para ``pieces`` em ``stock``"""
+    if time_budget is None:
+        time_budget = ServerConfig.get_cut_plan_time_budget()
+    kerf = ServerConfig.get_cut_kerf()
+    weight = ServerConfig.get_cut_remnant_weight()
+
+    sizes = np.array([(piece.width + kerf, piece.height + kerf) for piece in pieces], dtype=float).reshape(-1, 2)
+    areas = np.array([item.area for item in stock], dtype=float)
+    widths = np.array([np.nan if item.width is None or item.height is None else item.width
+                       for item in stock], dtype=float)
+    heights = np.array([np.nan if item.width is None or item.height is None else item.height
+                        for item in stock], dtype=float)
+    open_costs = areas * np.array([weight if item.kind == RETALHO else 1.0 for item in stock], dtype=float)
+
+    started = time.monotonic()
+    processes = ServerConfig.get_cut_plan_processes()
+    if stock and len(pieces) >= ServerConfig.get_cut_parallel_min_pieces() and processes > 1:
+        futures = [_get_executor().submit(_search, sizes, areas, widths, heights, open_costs, time_budget, seed)
+                   for seed in range(processes)]
+        results = [future.result() for future in futures]
+        best = min((result for result, _ in results), key=lambda result: result.key)
+        attempts = sum(count for _, count in results)
+    elif stock:
+        best, attempts = _search(sizes, areas, widths, heights, open_costs, time_budget, 0)
+    else:
+        best, attempts = _Result((len(pieces), 0.0, 0), [None] * len(pieces), {}), 0
+
+    return _build_plan(material, pieces, stock, best, sizes, attempts, time.monotonic() - started)
+
+
+def _build_plan(material: str, pieces: List[Piece], stock: List[Stock], result: _Result,
+                sizes: np.ndarray, attempts: int, elapsed: float) -> Dict[str, Any]:
+    """Converte o resultado da busca na resposta da API"""
+    allocations: Dict[int, Dict[str, Any]] = {}
+    unplaced = []
+    for piece, placement, size in zip(pieces, result.placements, sizes):
+        item = {'ref': piece.ref, 'largura': piece.width, 'comprimento': piece.height}
+        if placement is None:
+            unplaced.append(item)
+            continue
+        index, x, y, rotated = placement
+        if x is not None:
+            item.update(x=round(x, 6), y=round(y, 6), girada=rotated)
+        source = stock[index]
+        allocation = allocations.setdefault(index, {
+            'tipo': source.kind, 'id': source.id, 'id_chapa': source.id_chapa,
+            'area_disponivel': source.area, 'area_consumida': 0.0, 'pecas': [],
+        })
+        allocation['area_consumida'] += float(size[0] * size[1])
+        allocation['pecas'].append(item)
+
+    # Retalhos primeiro, na ordem do estoque
+    plan_allocations = []
+    for index in sorted(allocations):
+        allocation = allocations[index]
+        allocation['area_consumida'] = round(allocation['area_consumida'], 6)
+        allocation['area_restante'] = round(max(allocation['area_disponivel'] - allocation['area_consumida'], 0.0), 6)
+        if index in result.leftovers:
+            width, height = result.leftovers[index]
+            allocation['sobra'] = {'largura': round(width, 6), 'comprimento': round(height, 6)}
+        plan_allocations.append(allocation)
+
+    return {
+        'material': material,
+        'alocacoes': plan_allocations,
+        'nao_alocadas': unplaced,
+        'area_pecas': round(float((sizes[:, 0] * sizes[:, 1]).sum()), 6),
+        'custo': round(result.key[1], 6),
+        'tentativas': attempts,
+        'tempo': round(elapsed, 3),
+    }
+
+
+# ----------------------------------------------------------------------
+# Confirmação
+# ----------------------------------------------------------------------
+
+def commit_plan(db_manager, plan: Dict[str, Any], os_number: str = '') -> Dict[str, Any]:
+    """Registra o plano: uma ``SAÍDA`` por chapa/retalho e as áreas restantes
+
+    Tudo em uma única transação do escritor. A área consumida é recalculada
+    a partir das peças; se o estoque mudou desde o planejamento e alguma
+    chapa ou retalho não comporta mais a sua parte, nada é gravado (409).
+    A ``sobra`` enviada pelo cliente é ignorada: em retalhos com medidas o
+    encaixe é refeito aqui, com as medidas gravadas, e a sobra sai dele.
+    """
+    try:
+        material = plan['material']
+        kerf = ServerConfig.get_cut_kerf()
+        allocations = []
+        for allocation in plan['alocacoes']:
+            sizes = np.array([(float(piece['largura']) + kerf, float(piece['comprimento']) + kerf)
+                              for piece in allocation['pecas']], dtype=float).reshape(-1, 2)
+            if len(sizes) == 0 or (sizes <= kerf).any():
+                raise ValueError('peças inválidas')
+            allocations.append((allocation['tipo'], int(allocation['id']),
+                                float((sizes[:, 0] * sizes[:, 1]).sum()), sizes))
+    except (KeyError, TypeError, ValueError):
+        raise WriteRejected('Plano de corte inválido')
+    if not allocations or any(kind not in (CHAPA, RETALHO) for kind, _, _, _ in allocations):
+        raise WriteRejected('Plano de corte inválido')
+
+    def op(conn):
+        slabs = []
+        for kind, stock_id, consumed, sizes in allocations:
+            if kind == CHAPA:
+                row = conn.execute('''
+                    SELECT area_disponivel FROM chapas
+                    WHERE id_chapa = ? AND nome_material = ? AND status = 'Disponível'
+                ''', (stock_id, material)).fetchone()
+                if row is None or row[0] < consumed - 1e-6:
+                    raise WriteRejected(f'Chapa {stock_id} não comporta mais o plano; planeje novamente', 409)
+                new_area = max(row[0] - consumed, 0.0)
+                conn.execute('''
+                    INSERT INTO movimentacoes (id_chapa, tipo_movimentacao, quantidade_m2, os_associada)
+                    VALUES (?, 'SAÍDA', ?, ?)
+                ''', (stock_id, consumed, os_number))
+                conn.execute('UPDATE chapas SET area_disponivel = ?, status = ? WHERE id_chapa = ?',
+                             (new_area, 'Consumida' if new_area <= 1e-6 else 'Disponível', stock_id))
+                events.record_event(conn, events.AREA_ATUALIZADA, stock_id, tamanho=new_area)
+                slabs.append(stock_id)
+            else:
+                row = conn.execute('''
+                    SELECT id_chapa_original, area_retalho, largura, comprimento FROM retalhos
+                    WHERE id_retalho = ? AND nome_material = ?
+                ''', (stock_id, material)).fetchone()
+                if row is None or row[1] < consumed - 1e-6:
+                    raise WriteRejected(f'Retalho {stock_id} não comporta mais o plano; planeje novamente', 409)
+                new_area = max(row[1] - consumed, 0.0)
+                width, height = row[2], row[3]
+                if width is not None and height is not None:
+                    leftover = _refit_remnant(sizes, row[1], width, height)
+                    if leftover is None:
+                        raise WriteRejected(f'Peças não cabem no retalho {stock_id}; planeje novamente', 409)
+                    # Só o maior retângulo livre continua aproveitável: a área
+                    # passa a ser a dele, coerente com largura e comprimento
+                    width, height = leftover
+                    new_area = min(new_area, width * height)
+                if new_area <= 1e-6:
+                    new_area = 0.0
+                # Movimentação antes de alterar o retalho, para o resumo de
+                # consumo ainda encontrar o material; inclui o que foi descartado
+                conn.execute('''
+                    INSERT INTO movimentacoes (id_chapa, tipo_movimentacao, quantidade_m2, os_associada)
+                    VALUES (?, 'SAÍDA', ?, ?)
+                ''', (row[0], row[1] - new_area, os_number))
+                if new_area == 0.0:
+                    conn.execute('DELETE FROM retalhos WHERE id_retalho = ?', (stock_id,))
+                    events.record_event(conn, events.RETALHO_REMOVIDO, row[0])
+                else:
+                    conn.execute('''
+                        UPDATE retalhos SET area_retalho = ?, largura = ?, comprimento = ?
+                        WHERE id_retalho = ?
+                    ''', (new_area, width, height, stock_id))
+                    events.record_event(conn, events.RETALHO_ATUALIZADO, row[0], tamanho=new_area,
+                                        largura=width, comprimento=height)
+        return slabs
+
+    slabs = db_manager.write(op)
+    for slab_id in slabs:
+        db_manager.invalidate_slab(slab_id)
+    return {'chapas': len(slabs), 'retalhos': len(allocations) - len(slabs),
+            'area_consumida': round(sum(consumed for _, _, consumed, _ in allocations), 6)}
@@ -4,74 +4,223 @@
 Gerenciamento do banco de dados SQLite
 """
 
+import os
 import sqlite3
 import random
+import threading
 import time
-from typing import Optional, List, Dict, Any
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Iterator
 from config import ServerConfig
+from cache import LRUCache
+from migrations import apply_migrations, rebuild_material_summary, rebuild_consumption_rollup
+from write_queue import WriteQueue
+import events
+import metrics
+from archive import first_unarchived_month
+from sql_profiler import SqlProfiler, ProfilingConnection
+
+# Quantidade de parâmetros por consulta ``IN (...)``, abaixo do limite
+# histórico de 999 variáveis do SQLite
+SQLITE_IN_CHUNK = 500
+
+# Protege a reinicialização dos pools após um fork (várias threads podem notar ao mesmo tempo)
+_fork_lock = threading.Lock()
+
+# Expressão do período de ``consumo_diario.dia`` para cada granularidade
+# (semanas começam na segunda-feira)
+CONSUMPTION_PERIODS = {
+    'dia': 'dia',
+    'semana': "date(dia, '-6 days', 'weekday 1')",
+    'mes': 'substr(dia, 1, 7)',
+}
+
+
+class ConnectionPool:
+    """Pool limitado de conexões SQLite de longa duração
+    
+    Cada conexão pertence a uma única thread enquanto está emprestada;
+    chamadas aninhadas na mesma thread reutilizam a mesma conexão.
+    Conexões ociosas são verificadas antes do reuso e recicladas após
+    ``max_age`` segundos. Threads de fundo usam ``dedicated()`` e não
+    disputam as vagas com as threads das requisições.
+    """
+    
+    def __init__(self, db_path: str, max_size: int, timeout: float,
+                 max_age: float, pragmas: Dict[str, Any], profiler: Optional[SqlProfiler] = None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.pragmas = pragmas
+        self.profiler = profiler
+        self._reset()
+    
+    def _reset(self):
+        """(Re)inicializa o estado interno - usado também após um fork"""
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle: List[tuple] = []
+        self._local = threading.local()
+        self._pid = os.getpid()
+    
+    def _check_fork(self):
+        """Processo filho após fork: nunca reutilizar conexões herdadas"""
+        if self._pid != os.getpid():
+            with _fork_lock:
+                if self._pid != os.getpid():
+                    self._reset()
+    
+    def _open(self) -> sqlite3.Connection:
+        """Abre uma conexão nova já configurada"""
+        conn = sqlite3.connect(self.db_path, timeout=self.pragmas.get('busy_timeout', 5000) / 1000,
+                               check_same_thread=False,
+                               factory=ProfilingConnection if self.profiler else sqlite3.Connection)
+        if self.profiler:
+            self.profiler.attach(conn)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        return conn
+    
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        """Verifica se a conexão ainda responde"""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def _checkout(self) -> tuple:
+        """Retira uma conexão ociosa saudável ou abre uma nova"""
+        started = time.perf_counter()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        metrics.POOL_WAIT.observe(time.perf_counter() - started)
+        if not acquired:
+            metrics.POOL_TIMEOUTS.inc()
+            raise sqlite3.OperationalError('Tempo esgotado aguardando conexão do pool')
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._open(), time.monotonic()
+                conn, created_at = entry
+                if time.monotonic() - created_at < self.max_age and self._is_healthy(conn):
+                    return entry
+                conn.close()
+        except BaseException:
+            self._slots.release()
+            raise
+    
+    def _checkin(self, entry: tuple):
+        """Devolve a conexão ao pool, descartando transações pendentes"""
+        conn = entry[0]
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self._idle.append(entry)
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Empresta uma conexão do pool durante o bloco ``with``"""
+        self._check_fork()
+        
+        held = getattr(self._local, 'entry', None)
+        if held is not None:
+            yield held[0]
+            return
+        
+        entry = self._checkout()
+        self._local.entry = entry
+        metrics.POOL_IN_USE.inc()
+        try:
+            yield entry[0]
+        finally:
+            self._local.entry = None
+            metrics.POOL_IN_USE.dec()
+            self._checkin(entry)
+    
+    @contextmanager
+    def dedicated(self) -> Iterator[sqlite3.Connection]:
+        """Conexão própria da thread atual, fora do limite do pool
+        
+        Para threads de fundo (escritor, feed de eventos, impressão): dentro
+        do bloco, ``connection()`` nessa thread devolve esta conexão sem
+        ocupar vaga, então elas nunca esperam pelas threads das requisições.
+        """
+        self._check_fork()
+        conn = self._open()
+        self._local.entry = (conn, time.monotonic())
+        try:
+            yield conn
+        finally:
+            self._local.entry = None
+            conn.close()
+    
+    def close_all(self):
+        """Fecha todas as conexões ociosas"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
 
 class DatabaseManager:
     """Gerenciador do banco de dados"""
     
     def __init__(self):
         self.db_path = ServerConfig.get_database_path()
+        # Perfil das consultas (opcional): ver /debug/sql
+        self.sql_profiler = SqlProfiler() if ServerConfig.get_sql_profiling() else None
+        self.pool = ConnectionPool(
+            self.db_path,
+            max_size=ServerConfig.get_pool_size(),
+            timeout=ServerConfig.get_pool_timeout(),
+            max_age=ServerConfig.get_pool_max_age(),
+            pragmas=ServerConfig.get_sqlite_pragmas(),
+            profiler=self.sql_profiler,
+        )
+        self.slab_cache = LRUCache(ServerConfig.get_slab_cache_size(), ServerConfig.get_slab_cache_ttl())
+        self.writer = WriteQueue(self)
         self._create_tables()
     
     def _create_tables(self):
-        """Cria as tabelas necessárias no banco de dados"""
+        """Cria ou atualiza as tabelas aplicando as migrações pendentes"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Tabela chapas
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS chapas (
-                    id_chapa INTEGER PRIMARY KEY,
-                    nome_material TEXT NOT NULL,
-                    fornecedor TEXT NOT NULL,
-                    preco_compra_m2 REAL NOT NULL,
-                    area_liquida_inicial REAL NOT NULL,
-                    area_disponivel REAL NOT NULL,
-                    localizacao TEXT NOT NULL,
-                    status TEXT DEFAULT 'Disponível',
-                    data_entrada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Tabela movimentacoes
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS movimentacoes (
-                    id_movimentacao INTEGER PRIMARY KEY AUTOINCREMENT,
-                    id_chapa INTEGER NOT NULL,
-                    tipo_movimentacao TEXT NOT NULL,
-                    quantidade_m2 REAL NOT NULL,
-                    os_associada TEXT,
-                    data_movimentacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (id_chapa) REFERENCES chapas (id_chapa)
-                )
-            ''')
-            
-            # Tabela retalhos
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS retalhos (
-                    id_retalho INTEGER PRIMARY KEY AUTOINCREMENT,
-                    id_chapa_original INTEGER NOT NULL,
-                    nome_material TEXT NOT NULL,
-                    fornecedor TEXT NOT NULL,
-                    area_retalho REAL NOT NULL,
-                    localizacao TEXT NOT NULL,
-                    data_transformacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (id_chapa_original) REFERENCES chapas (id_chapa)
-                )
-            ''')
-            
-            conn.commit()
+            apply_migrations(conn)
     
-    def get_connection(self) -> sqlite3.Connection:
-        """Retorna uma conexão com o banco de dados"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+    def get_connection(self):
+        """Empresta uma conexão do pool (usar com ``with``)"""
+        return self.pool.connection()
     
+    def dedicated_connection(self):
+        """Conexão própria para a thread de fundo atual (usar com ``with``)"""
+        return self.pool.dedicated()
+    
+    def write(self, op, *args):
+        """Aplica ``op(conn, *args)`` pelo escritor único e retorna o resultado
+        
+        ``op`` não deve chamar ``commit``: a escrita é confirmada junto com
+        o lote do escritor antes de esta chamada retornar.
+        """
+        return self.writer.execute(op, *args)
+    
+    def get_table_versions(self, tables) -> Dict[str, int]:
+        """Retorna a versão atual (contador de escritas) de cada tabela"""
+        placeholders = ', '.join('?' for _ in tables)
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                f'SELECT tabela, versao FROM versoes_tabelas WHERE tabela IN ({placeholders})',
+                tuple(tables)
+            ).fetchall()
+        return {row['tabela']: row['versao'] for row in rows}
     
     def get_available_slabs(self) -> List[Dict[str, Any]]:
         """Retorna lista de chapas disponíveis"""
@@ -88,9 +237,43 @@ class DatabaseManager:
             
             return [dict(row) for row in cursor.fetchall()]
     
+    @staticmethod
+    def _slab_key(slab_id) -> Any:
+        """Normaliza o ID vindo da URL (texto) para a chave do cache"""
+        try:
+            return int(slab_id)
+        except (TypeError, ValueError):
+            return slab_id
+    
+    def get_slab(self, slab_id) -> Optional[Dict[str, Any]]:
+        """Busca uma chapa pelo ID passando pelo cache LRU"""
+        key = self._slab_key(slab_id)
+        
+        def load():
+            with self.get_connection() as conn:
+                row = conn.execute('SELECT * FROM chapas WHERE id_chapa = ?', (key,)).fetchone()
+            return dict(row) if row else None
+        
+        return self.slab_cache.get_or_load(key, load)
+    
+    def invalidate_slab(self, slab_id):
+        """Descarta a chapa do cache - chamar após toda escrita confirmada"""
+        self.slab_cache.invalidate(self._slab_key(slab_id))
+    
+    def get_slabs_by_ids(self, ids: List[int]) -> Dict[int, sqlite3.Row]:
+        """Busca várias chapas pelo ID com consultas ``IN (...)`` em blocos"""
+        found: Dict[int, sqlite3.Row] = {}
+        with self.get_connection() as conn:
+            for start in range(0, len(ids), SQLITE_IN_CHUNK):
+                chunk = ids[start:start + SQLITE_IN_CHUNK]
+                placeholders = ', '.join('?' for _ in chunk)
+                for row in conn.execute(f'SELECT * FROM chapas WHERE id_chapa IN ({placeholders})', chunk):
+                    found[row['id_chapa']] = row
+        return found
+    
     def add_slab(self, slab_data: Dict[str, Any]) -> int:
         """Adiciona uma nova chapa ao estoque"""
-        with self.get_connection() as conn:
+        def op(conn):
             cursor = conn.cursor()
             
             # Usar ID fornecido pelo usuário (NÃO gerar automaticamente)
@@ -111,13 +294,111 @@ class DatabaseManager:
                 VALUES (?, 'ENTRADA', ?)
             ''', (id_chapa, slab_data['area_liquida_inicial']))
             
-            conn.commit()
+            events.record_event(conn, events.CHAPA_CRIADA, id_chapa, **events.slab_fields(
+                slab_data['nome_material'], slab_data['fornecedor'], slab_data['area_liquida_inicial'],
+                slab_data['preco_compra_m2'], slab_data['localizacao']))
+            
             return id_chapa
+        
+        return self.write(op)
+    
+    def add_slabs_bulk(self, slabs: List[Dict[str, Any]]) -> List[str]:
+        """Adiciona várias chapas em uma única transação
+        
+        Registra também as movimentações de ENTRADA. Retorna, na mesma ordem
+        de ``slabs``, ``'created'`` ou ``'duplicate'`` (já existia no banco ou
+        repetida na própria carga).
+        """
+        results: List[str] = []
+        if not slabs:
+            return results
+        
+        def op(conn):
+            existing = set()
+            ids = [slab['id_chapa'] for slab in slabs]
+            for start in range(0, len(ids), SQLITE_IN_CHUNK):
+                chunk = ids[start:start + SQLITE_IN_CHUNK]
+                placeholders = ', '.join('?' for _ in chunk)
+                existing.update(row[0] for row in conn.execute(
+                    f'SELECT id_chapa FROM chapas WHERE id_chapa IN ({placeholders})', chunk))
+            
+            to_insert = []
+            for slab in slabs:
+                id_chapa = slab['id_chapa']
+                if id_chapa in existing:
+                    results.append('duplicate')
+                    continue
+                existing.add(id_chapa)
+                results.append('created')
+                to_insert.append(slab)
+            
+            conn.executemany('''
+                INSERT INTO chapas (id_chapa, nome_material, fornecedor, preco_compra_m2, 
+                                  area_liquida_inicial, area_disponivel, localizacao)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(s['id_chapa'], s['nome_material'], s['fornecedor'], s['preco_compra_m2'],
+                   s['area_liquida_inicial'], s['area_liquida_inicial'], s['localizacao'])
+                  for s in to_insert])
+            
+            conn.executemany('''
+                INSERT INTO movimentacoes (id_chapa, tipo_movimentacao, quantidade_m2)
+                VALUES (?, 'ENTRADA', ?)
+            ''', [(s['id_chapa'], s['area_liquida_inicial']) for s in to_insert])
+            
+            events.record_events(conn, events.CHAPA_CRIADA, [
+                (s['id_chapa'], events.slab_fields(s['nome_material'], s['fornecedor'],
+                                                   s['area_liquida_inicial'], s['preco_compra_m2'],
+                                                   s['localizacao']))
+                for s in to_insert])
+        
+        self.write(op)
+        return results
+    
+    def reserve_label_ids(self, count: int) -> List[int]:
+        """Reserva ``count`` IDs de etiqueta ainda não usados
+        
+        Consome o início da lista livre embaralhada com uma única consulta
+        indexada, então o custo é O(count) independentemente de quantos IDs
+        já foram usados. Os IDs reservados ficam registrados até que uma
+        chapa seja cadastrada com eles.
+        """
+        if count < 1:
+            raise ValueError('Quantidade de IDs deve ser maior que zero')
+        if count > ServerConfig.get_label_max_ids():
+            raise ValueError(f'Quantidade de IDs deve ser no máximo {ServerConfig.get_label_max_ids()}')
+        
+        def op(conn):
+            rows = conn.execute('''
+                SELECT posicao, id_etiqueta FROM etiquetas_livres
+                ORDER BY posicao
+                LIMIT ?
+            ''', (count,)).fetchall()
+            
+            if len(rows) < count:
+                raise ValueError(f'Apenas {len(rows)} IDs de etiqueta disponíveis')
+            
+            conn.execute('DELETE FROM etiquetas_livres WHERE posicao <= ?', (rows[-1]['posicao'],))
+            ids = [row['id_etiqueta'] for row in rows]
+            conn.executemany('INSERT OR IGNORE INTO etiquetas_reservadas (id_etiqueta) VALUES (?)',
+                             [(i,) for i in ids])
+            return ids
+        
+        return self.write(op)
+    
+    def get_pending_label_ids(self) -> List[Dict[str, Any]]:
+        """Retorna IDs reservados (impressos) que ainda não viraram chapa"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT id_etiqueta, data_reserva FROM etiquetas_reservadas
+                WHERE data_uso IS NULL
+                ORDER BY data_reserva
+            ''').fetchall()
+        return [dict(row) for row in rows]
     
     def update_slab_area(self, slab_id: int, new_area: Optional[float], 
                         new_location: Optional[str], os_number: str = "") -> Dict[str, Any]:
         """Atualiza área disponível da chapa"""
-        with self.get_connection() as conn:
+        def op(conn):
             cursor = conn.cursor()
             
             # Verificar se a chapa existe
@@ -170,7 +451,10 @@ class DatabaseManager:
                 query = f"UPDATE chapas SET {', '.join(updates)} WHERE id_chapa = ?"
                 cursor.execute(query, params)
             
-            conn.commit()
+            if new_area is not None:
+                events.record_event(conn, events.AREA_ATUALIZADA, slab_id, tamanho=new_area)
+            if new_location:
+                events.record_event(conn, events.CHAPA_MOVIDA, slab_id, localizacao=new_location)
             
             return {
                 'id_chapa': slab_id,
@@ -179,30 +463,117 @@ class DatabaseManager:
                 'localizacao_anterior': current_location,
                 'localizacao_atual': new_location if new_location else current_location
             }
+        
+        result = self.write(op)
+        self.invalidate_slab(slab_id)
+        return result
     
     def get_material_summary(self) -> List[Dict[str, Any]]:
-        """Retorna resumo de metragem por material"""
+        """Retorna resumo de metragem por material
+        
+        Lê a tabela ``material_summary``, mantida pelos triggers de
+        ``chapas``, em vez de agregar todas as chapas a cada chamada.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
                 SELECT nome_material, 
-                       SUM(area_liquida_inicial) as area_total_inicial,
-                       SUM(area_disponivel) as area_total_disponivel,
-                       COUNT(*) as quantidade_chapas,
-                       AVG(preco_compra_m2) as preco_medio_m2
-                FROM chapas 
-                GROUP BY nome_material
+                       area_total_inicial,
+                       area_total_disponivel,
+                       quantidade_chapas,
+                       soma_preco_m2 / quantidade_chapas as preco_medio_m2
+                FROM material_summary 
                 ORDER BY nome_material
             ''')
-            
-            materials = []
-            for row in cursor.fetchall():
-                material = dict(row)
-                material['percentual_disponivel'] = (
-                    material['area_total_disponivel'] / material['area_total_inicial'] * 100
-                    if material['area_total_inicial'] > 0 else 0
-                )
-                materials.append(material)
-            
-            return materials
+            rows = cursor.fetchall()
+        
+        materials = []
+        for row in rows:
+            material = dict(row)
+            material['percentual_disponivel'] = (
+                material['area_total_disponivel'] / material['area_total_inicial'] * 100
+                if material['area_total_inicial'] > 0 else 0
+            )
+            materials.append(material)
+        
+        return materials
+    
+    def rebuild_material_summary(self):
+        """Reconstrói ``material_summary`` do zero a partir de ``chapas``"""
+        self.write(rebuild_material_summary)
+    
+    def get_consumption(self, start: str, end: str, granularity: str = 'dia',
+                        material: Optional[str] = None, supplier: Optional[str] = None,
+                        movement_type: Optional[str] = None,
+                        by_supplier: bool = False) -> List[Dict[str, Any]]:
+        """Soma as movimentações entre ``start`` e ``end`` (datas inclusivas)
+        
+        Lê apenas ``consumo_diario`` e agrupa por período, material e tipo
+        de movimentação (e fornecedor, se ``by_supplier``).
+        """
+        period = CONSUMPTION_PERIODS[granularity]
+        columns = ['nome_material', 'tipo_movimentacao'] + (['fornecedor'] if by_supplier else [])
+        conditions = ['dia BETWEEN ? AND ?']
+        params: List[Any] = [start, end]
+        for column, value in (('nome_material', material), ('fornecedor', supplier),
+                              ('tipo_movimentacao', movement_type)):
+            if value:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        
+        group = ', '.join(['periodo'] + columns)
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {period} AS periodo, {', '.join(columns)},
+                       SUM(quantidade_m2) AS quantidade_m2, SUM(movimentacoes) AS movimentacoes
+                FROM consumo_diario
+                WHERE {' AND '.join(conditions)}
+                GROUP BY {group}
+                ORDER BY {group}
+            ''', params).fetchall()
+        return [dict(row) for row in rows]
+    
+    def rebuild_consumption_rollup(self, since: Optional[str] = None) -> Optional[str]:
+        """Recalcula ``consumo_diario`` a partir das movimentações ainda no banco
+        
+        Os meses já arquivados não estão mais em ``movimentacoes``: o
+        recálculo começa no máximo no primeiro mês não arquivado, para não
+        apagar o consumo deles. Retorna o primeiro dia recalculado.
+        """
+        floor = first_unarchived_month()
+        if floor is not None and (since is None or since < floor):
+            since = floor
+        return self.write(rebuild_consumption_rollup, since)
+    
+    def verify_material_summary(self, tolerance: float = 1e-6) -> List[Dict[str, Any]]:
+        """Compara ``material_summary`` com a agregação real de ``chapas``
+        
+        Retorna a lista de materiais divergentes (vazia quando está correto).
+        """
+        with self.get_connection() as conn:
+            expected = {
+                row['nome_material']: tuple(row)[1:]
+                for row in conn.execute('''
+                    SELECT nome_material, SUM(area_liquida_inicial), SUM(area_disponivel),
+                           COUNT(*), SUM(preco_compra_m2)
+                    FROM chapas
+                    GROUP BY nome_material
+                ''')
+            }
+            actual = {
+                row['nome_material']: tuple(row)[1:]
+                for row in conn.execute('''
+                    SELECT nome_material, area_total_inicial, area_total_disponivel,
+                           quantidade_chapas, soma_preco_m2
+                    FROM material_summary
+                ''')
+            }
+        
+        divergences = []
+        for material in sorted(set(expected) | set(actual)):
+            exp = expected.get(material)
+            act = actual.get(material)
+            if exp is None or act is None or any(abs(e - a) > tolerance for e, a in zip(exp, act)):
+                divergences.append({'nome_material': material, 'esperado': exp, 'atual': act})
+        return divergences
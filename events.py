@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Feed de alterações em tempo real (Server-Sent Events)
+
+As escritas gravam um evento compacto na tabela ``eventos`` dentro da
+própria transação (``record_event``), então só eventos confirmados são
+publicados e nenhum se perde entre processos do servidor.
+
+Em cada processo uma única thread (``EventBroker``) lê os eventos novos
+do banco e guarda os mais recentes em memória; os clientes conectados em
+``GET /events`` apenas aguardam uma ``threading.Condition`` e leem desse
+buffer. O custo no SQLite é uma consulta indexada por intervalo de
+polling, independentemente de quantos clientes estão conectados.
+
+Tipos de evento: ``chapa_criada``, ``chapa_atualizada``,
+``area_atualizada``, ``chapa_movida``, ``transformada_retalho``,
+``chapa_removida``, ``retalho_criado``, ``retalho_atualizado`` e
+``retalho_removido``. Eventos de retalho usam o ID da chapa original,
+como o app.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from config import ServerConfig
+
+CHAPA_CRIADA = 'chapa_criada'
+CHAPA_ATUALIZADA = 'chapa_atualizada'
+AREA_ATUALIZADA = 'area_atualizada'
+CHAPA_MOVIDA = 'chapa_movida'
+TRANSFORMADA_RETALHO = 'transformada_retalho'
+CHAPA_REMOVIDA = 'chapa_removida'
+RETALHO_CRIADO = 'retalho_criado'
+RETALHO_ATUALIZADO = 'retalho_atualizado'
+RETALHO_REMOVIDO = 'retalho_removido'
+
+# Limpeza dos eventos antigos (s)
+_PRUNE_INTERVAL = 60.0
+
+
+def _encode(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def slab_fields(nome_material: str, fornecedor: str, area: float, preco: float,
+                localizacao: str) -> Dict[str, Any]:
+    """Campos de uma chapa no evento, com os nomes usados pelo app"""
+    return {'nomeMaterial': nome_material, 'fornecedor': fornecedor, 'tamanho': area,
+            'preco': preco, 'localizacao': localizacao}
+
+
+def record_event(conn, tipo: str, id_chapa: int, **dados: Any):
+    """Grava um evento na transação da escrita em andamento"""
+    conn.execute('INSERT INTO eventos (tipo, id_chapa, dados) VALUES (?, ?, ?)',
+                 (tipo, id_chapa, _encode({'id': id_chapa, **dados})))
+
+
+def record_events(conn, tipo: str, items: Iterable[Tuple[int, Dict[str, Any]]]):
+    """Grava vários eventos do mesmo tipo (carga em lote)"""
+    conn.executemany('INSERT INTO eventos (tipo, id_chapa, dados) VALUES (?, ?, ?)',
+                     [(tipo, id_chapa, _encode({'id': id_chapa, **dados})) for id_chapa, dados in items])
+
+
+class Event(NamedTuple):
+    """Evento já formatado para o fluxo SSE"""
+    id: int
+    message: str
+
+
+def _format(row) -> Event:
+    return Event(row[0], f'id: {row[0]}\nevent: {row[1]}\ndata: {row[2]}\n\n')
+
+
+class EventBroker:
+    """Distribui os eventos do banco para os clientes SSE deste processo"""
+
+    def __init__(self, db_manager, poll_interval: float = None, heartbeat: float = None,
+                 buffer_size: int = None, max_clients: int = None):
+        self.db_manager = db_manager
+        self.poll_interval = poll_interval or ServerConfig.get_sse_poll_interval()
+        self.heartbeat = heartbeat or ServerConfig.get_sse_heartbeat()
+        self.buffer_size = buffer_size or ServerConfig.get_sse_buffer_size()
+        self.max_clients = max_clients or ServerConfig.get_sse_max_clients()
+        self.clients = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._buffer: deque = deque(maxlen=self.buffer_size)
+        self._last_id = 0
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Clientes
+    # ------------------------------------------------------------------
+
+    def try_acquire(self) -> bool:
+        """Reserva a vaga de um cliente; ``False`` se o limite do processo foi atingido
+
+        A vaga é liberada quando o fluxo de ``stream`` termina.
+        """
+        self.start()
+        with self._lock:
+            if self.clients >= self.max_clients:
+                return False
+            self.clients += 1
+            return True
+
+    def stream(self, last_event_id: Optional[int] = None) -> Iterator[str]:
+        """Gera o fluxo SSE a partir do evento seguinte a ``last_event_id``
+
+        Sem ``last_event_id`` o cliente recebe apenas os eventos novos. A
+        vaga do cliente deve ter sido reservada antes com ``try_acquire``.
+        """
+        try:
+            yield f'retry: {int(self.poll_interval * 4000)}\n\n'
+            last = self._last_id if last_event_id is None else last_event_id
+            while not self._stopping.is_set():
+                events = self._events_after(last)
+                if events:
+                    yield ''.join(event.message for event in events)
+                    last = events[-1].id
+                    continue
+
+                with self._cond:
+                    changed = self._cond.wait_for(
+                        lambda: self._last_id > last or self._stopping.is_set(), self.heartbeat)
+                if not changed:
+                    yield ': ping\n\n'
+        finally:
+            with self._lock:
+                self.clients -= 1
+
+    def _events_after(self, last: int) -> List[Event]:
+        """Eventos posteriores a ``last``, do buffer ou do banco se forem antigos"""
+        with self._cond:
+            if last >= self._last_id:
+                return []
+            if self._buffer and self._buffer[0].id <= last + 1:
+                buffered = list(self._buffer)
+                start = bisect.bisect_right([event.id for event in buffered], last)
+                return buffered[start:]
+
+        # Cliente retomando de um ponto que já saiu do buffer
+        with self.db_manager.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT id_evento, tipo, dados FROM eventos
+                WHERE id_evento > ?
+                ORDER BY id_evento
+                LIMIT ?
+            ''', (last, self.buffer_size)).fetchall()
+        return [_format(row) for row in rows]
+
+    # ------------------------------------------------------------------
+    # Thread de leitura
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Inicia a thread que lê os eventos novos (uma vez por processo)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            with self.db_manager.get_connection() as conn:
+                row = conn.execute('SELECT MAX(id_evento) FROM eventos').fetchone()
+            self._buffer.clear()
+            self._last_id = row[0] or 0
+            self.clients = 0
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout: float = 5.0):
+        """Encerra a thread e os fluxos abertos"""
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._pid = None
+
+    def _run(self):
+        """Thread de leitura: traz os eventos novos para o buffer e apaga os que passaram da retenção"""
+        with self.db_manager.dedicated_connection():
+            self._loop()
+
+    def _loop(self):
+        """Laço da thread: busca eventos novos e acorda os clientes"""
+        next_prune = time.monotonic() + _PRUNE_INTERVAL
+        while not self._stopping.is_set():
+            try:
+                self._poll()
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + _PRUNE_INTERVAL
+                    self._prune()
+            except Exception as e:
+                print(f"ERRO no feed de eventos: {str(e)}")
+            self._stopping.wait(self.poll_interval)
+
+    def _poll(self):
+        """Lê os eventos gravados desde a última leitura"""
+        with self.db_manager.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT id_evento, tipo, dados FROM eventos
+                WHERE id_evento > ?
+                ORDER BY id_evento
+            ''', (self._last_id,)).fetchall()
+        if not rows:
+            return
+        with self._cond:
+            self._buffer.extend(_format(row) for row in rows)
+            self._last_id = rows[-1][0]
+            self._cond.notify_all()
+
+    def _prune(self):
+        """Apaga os eventos além da retenção configurada"""
+        floor = self._last_id - ServerConfig.get_event_retention()
+        if floor > 0:
+            self.db_manager.write(lambda conn: conn.execute('DELETE FROM eventos WHERE id_evento <= ?', (floor,)))
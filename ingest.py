@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Leitura e validação das cargas em lote de chapas (NDJSON ou array JSON)
+
+O corpo NDJSON é lido linha a linha direto do stream da requisição, então
+cada registro é validado assim que chega, sem montar o documento inteiro
+em memória.
+"""
+
+import json
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+from config import ServerConfig
+
+APP_SLAB_FIELDS = ['id', 'nomeMaterial', 'fornecedor', 'tamanho', 'preco', 'localizacao']
+
+
+class InvalidJson(NamedTuple):
+    """Linha NDJSON que não pôde ser lida, com o erro do parser"""
+    error: str
+
+
+def iter_records(req) -> Iterator[Tuple[int, Any]]:
+    """Gera (número da linha, objeto) a partir do corpo da requisição
+    
+    Aceita ``application/x-ndjson`` (um objeto por linha) ou um array JSON.
+    Linhas que não são JSON válido geram ``(linha, InvalidJson)``.
+    """
+    max_rows = ServerConfig.get_bulk_max_rows()
+    
+    if req.mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        count = 0
+        for line_no, raw in enumerate(req.stream, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            count += 1
+            if count > max_rows:
+                raise ValueError(f'Carga excede o limite de {max_rows} chapas')
+            try:
+                yield line_no, json.loads(raw)
+            except ValueError as e:
+                # JSONDecodeError traz a mensagem sem a posição; UnicodeDecodeError não
+                yield line_no, InvalidJson(f'JSON inválido na linha {line_no}: {getattr(e, "msg", e)}')
+        return
+    
+    data = req.get_json(silent=True)
+    if not isinstance(data, list):
+        raise ValueError('Envie um array JSON ou NDJSON (application/x-ndjson)')
+    if len(data) > max_rows:
+        raise ValueError(f'Carga excede o limite de {max_rows} chapas')
+    for line_no, item in enumerate(data, start=1):
+        yield line_no, item
+
+
+def validate_app_slab(item: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Valida um registro no formato do app e o converte para as colunas do banco
+    
+    Retorna (chapa, None) quando válido ou (None, mensagem de erro).
+    """
+    if isinstance(item, InvalidJson):
+        return None, item.error
+    if not isinstance(item, dict):
+        return None, 'Registro não é um objeto JSON'
+    for field in APP_SLAB_FIELDS:
+        if field not in item or item[field] in (None, ''):
+            return None, f'Campo obrigatório: {field}'
+    
+    try:
+        id_chapa = int(item['id'])
+        area = float(item['tamanho'])
+        preco = float(item['preco'])
+    except (TypeError, ValueError):
+        return None, 'Campos id, tamanho e preco devem ser numéricos'
+    if area <= 0:
+        return None, 'Tamanho deve ser maior que zero'
+    if preco < 0:
+        return None, 'Preço não pode ser negativo'
+    
+    return {
+        'id_chapa': id_chapa,
+        'nome_material': str(item['nomeMaterial']),
+        'fornecedor': str(item['fornecedor']),
+        'preco_compra_m2': preco,
+        'area_liquida_inicial': area,
+        'localizacao': str(item['localizacao']),
+    }, None
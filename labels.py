@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gabarito ZPL compilado para impressão de etiquetas em lote
+
+O gabarito é lido e dividido uma única vez em trechos fixos e campos
+nomeados. Renderizar uma etiqueta vira um ``join`` de strings, e um lote
+inteiro sai como um único fluxo ZPL em memória, com ``^PQ`` indicando
+quantas cópias a impressora deve fazer de cada etiqueta.
+
+Campos aceitos no gabarito: ``${id}``, ``${material}``, ``${area}`` e
+``${data}``. O número ``12345`` do gabarito oficial antigo continua sendo
+tratado como ``${id}``.
+"""
+
+import re
+from datetime import date
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Union
+
+SLOTS = ('id', 'material', 'area', 'data')
+LEGACY_ID_PLACEHOLDER = '12345'
+
+_SLOT_PATTERN = re.compile(r'\$\{(' + '|'.join(SLOTS) + r')\}|' + LEGACY_ID_PLACEHOLDER)
+# Comando de quantidade já existente no gabarito (substituído pelo nosso)
+_PQ_PATTERN = re.compile(r'\^PQ[^\^~]*')
+_END_FORMAT = '^XZ'
+
+
+class _Slot(NamedTuple):
+    """Posição de um campo no gabarito compilado"""
+    name: str
+
+
+# Ponto onde entra o ^PQ com o número de cópias
+_COPIES = _Slot('copias')
+
+
+class ZplTemplate:
+    """Gabarito ZPL pré-compilado com campos nomeados"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts = self._compile(source)
+
+    @classmethod
+    def load(cls, path: str) -> 'ZplTemplate':
+        """Lê e compila o gabarito de um arquivo"""
+        with open(path, 'r') as f:
+            return cls(f.read())
+
+    @staticmethod
+    def _compile(source: str) -> List[Union[str, _Slot]]:
+        """Divide o gabarito em trechos fixos, nomes de campo e o ponto do ^PQ"""
+        body = _PQ_PATTERN.sub('', source)
+        end = body.rfind(_END_FORMAT)
+        if end < 0:
+            raise ValueError('Gabarito ZPL sem ^XZ')
+
+        parts: List[Union[str, _Slot]] = []
+        position = 0
+        for match in _SLOT_PATTERN.finditer(body, 0, end):
+            parts.append(body[position:match.start()])
+            parts.append(_Slot(match.group(1) or 'id'))
+            position = match.end()
+        parts.append(body[position:end])
+        parts.append(_COPIES)
+        parts.append(body[end:])
+        return [p for p in parts if p != '']
+
+    def render(self, copies: int = 1, **values: Any) -> str:
+        """Renderiza uma etiqueta, pedindo ``copies`` cópias à impressora"""
+        out = []
+        for part in self._parts:
+            if part is _COPIES:
+                out.append(f'^PQ{int(copies)}')
+            elif isinstance(part, _Slot):
+                out.append(_format_value(part.name, values.get(part.name)))
+            else:
+                out.append(part)
+        return ''.join(out)
+
+    def render_batch(self, labels: Iterable[Dict[str, Any]]) -> str:
+        """Renderiza um lote em um único fluxo ZPL
+
+        Cada item de ``labels`` traz os valores dos campos e ``copias``.
+        """
+        return ''.join(self.render(label.get('copias', 1), **label) for label in labels)
+
+
+def _format_value(slot: str, value: Optional[Any]) -> str:
+    """Formata o valor de um campo para o ZPL"""
+    if value is None:
+        return date.today().strftime('%d/%m/%Y') if slot == 'data' else ''
+    if slot == 'area' and isinstance(value, (int, float)):
+        return f'{value:.2f}'
+    return str(value)
@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste de carga HTTP simulando o pátio cheio de leitores
+
+Sobe o servidor de produção (``serve.py``) contra um banco descartável
+semeado com chapas e retalhos realistas, com uma impressora falsa na
+porta TCP, e repete em paralelo a mistura de fluxos dos celulares e do
+escritório: consulta por código (``lookup``), cadastro (``create``),
+baixa de área (``update_area``), transformação em retalho
+(``transform``), listagem (``list``), metragem (``metragem``),
+etiquetas (``labels``) e busca textual (``search``).
+
+Ao final mostra, por rota, a vazão, as latências p50/p95/p99 e as taxas
+de erro, de recusa (4xx) e de travamento do banco. O resultado pode ser
+salvo como base e comparado nas próximas execuções; a comparação termina
+com código 1 quando alguma rota piora além da tolerância.
+
+Uso:
+    python3 loadtest.py [--clientes 10] [--duracao 30] [--chapas 5000]
+                        [--mix lookup=40,create=10,update_area=15,...]
+                        [--salvar-base base.json] [--comparar base.json]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+from typing import Any, Dict, List, Optional, Tuple
+from config import ServerConfig
+
+DEFAULT_MIX = {
+    'lookup': 40,
+    'create': 10,
+    'update_area': 15,
+    'transform': 5,
+    'list': 10,
+    'metragem': 10,
+    'labels': 5,
+    'search': 5,
+}
+
+MATERIALS = [
+    'Mármore Branco Carrara', 'Mármore Travertino', 'Granito Preto São Gabriel',
+    'Granito Branco Itaúnas', 'Granito Verde Ubatuba', 'Quartzo Branco Prime',
+    'Quartzito Taj Mahal', 'Ônix Mel', 'Granito Cinza Andorinha', 'Mármore Crema Marfil',
+]
+SUPPLIERS = ['Pedras Vitória', 'Marmoraria Central', 'Granitos do Sul', 'Stone Import', 'Rochas ES']
+
+# Gabarito mínimo com os campos aceitos pelo servidor
+LABEL_TEMPLATE = '^XA^FO40,40^A0N,50,50^FD${id}^FS^FO40,110^A0N,30,30^FD${material}^FS^XZ'
+
+# Trechos de resposta que indicam travamento do banco ou fila de escrita esgotada
+LOCK_MARKERS = (b'database is locked', b'database table is locked', b'busy', b'Tempo esgotado')
+
+
+# ----------------------------------------------------------------------
+# Impressora falsa
+# ----------------------------------------------------------------------
+
+class _PrinterHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        size = 0
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                break
+            size += len(data)
+        with self.server.lock:
+            self.server.jobs += 1
+            self.server.bytes += size
+
+
+class FakePrinter(socketserver.ThreadingTCPServer):
+    """Porta RAW (9100) que aceita e descarta os trabalhos de impressão"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _PrinterHandler)
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.bytes = 0
+
+    @property
+    def uri(self) -> str:
+        return f'tcp://127.0.0.1:{self.server_address[1]}'
+
+
+# ----------------------------------------------------------------------
+# Servidor
+# ----------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir: str, port: int, printer_uri: str, workers: Optional[int]) -> subprocess.Popen:
+    """Sobe o ``serve.py`` com banco, porta, impressora e gabarito próprios"""
+    template = os.path.join(workdir, 'gabarito.zpl')
+    with open(template, 'w') as f:
+        f.write(LABEL_TEMPLATE)
+    env = dict(os.environ,
+               QUALICAM_DB_PATH=os.path.join(workdir, 'qualicam.db'),
+               QUALICAM_PORT=str(port),
+               QUALICAM_PRINTER_URI=printer_uri,
+               QUALICAM_LABEL_TEMPLATE=template)
+    if workers:
+        env['QUALICAM_WORKERS'] = str(workers)
+    log = open(os.path.join(workdir, 'servidor.log'), 'w')
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')],
+                              env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'Servidor encerrou ao iniciar; veja {log.name}')
+        try:
+            status, _ = request(http.client.HTTPConnection('127.0.0.1', port, timeout=2), 'GET', '/health')
+            if status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('Servidor não respondeu em 30 s')
+
+
+def stop_server(server: subprocess.Popen):
+    """Encerra o servidor como em produção (SIGTERM, aguardando as requisições)"""
+    server.terminate()
+    try:
+        server.wait(ServerConfig.get_graceful_timeout() + 5)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def request(conn: http.client.HTTPConnection, method: str, path: str,
+            body: Any = None) -> Tuple[int, bytes]:
+    """Envia uma requisição pela conexão (keep-alive) e lê a resposta inteira"""
+    headers = {}
+    payload = None
+    if body is not None:
+        payload = json.dumps(body).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    conn.request(method, path, body=payload, headers=headers)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+# ----------------------------------------------------------------------
+# Estoque simulado
+# ----------------------------------------------------------------------
+
+class Inventory:
+    """IDs conhecidos pelos leitores e seus dados, compartilhados entre os clientes"""
+
+    def __init__(self, first_id: int):
+        self.lock = threading.Lock()
+        self.slabs: Dict[int, float] = {}
+        self.ids: List[int] = []
+        self.next_id = first_id
+
+    def new_slab(self, rng: random.Random) -> Dict[str, Any]:
+        with self.lock:
+            slab_id = self.next_id
+            self.next_id += 1
+        return {
+            'id': str(slab_id),
+            'nomeMaterial': rng.choice(MATERIALS),
+            'fornecedor': rng.choice(SUPPLIERS),
+            'tamanho': round(rng.uniform(2.5, 6.0), 2),
+            'preco': round(rng.uniform(150, 900), 2),
+            'localizacao': f'Prateleira {rng.choice("ABCDEFGH")}{rng.randint(1, 12)}',
+        }
+
+    def add(self, slab: Dict[str, Any]):
+        with self.lock:
+            self.slabs[int(slab['id'])] = slab['tamanho']
+            self.ids.append(int(slab['id']))
+
+    def pick(self, rng: random.Random) -> Tuple[int, float]:
+        with self.lock:
+            slab_id = rng.choice(self.ids)
+            return slab_id, self.slabs[slab_id]
+
+    def take(self, rng: random.Random) -> Optional[int]:
+        """Retira uma chapa do estoque simulado (transformação em retalho)"""
+        with self.lock:
+            if len(self.ids) < 2:
+                return None
+            index = rng.randrange(len(self.ids))
+            self.ids[index], self.ids[-1] = self.ids[-1], self.ids[index]
+            slab_id = self.ids.pop()
+            del self.slabs[slab_id]
+            return slab_id
+
+
+def seed(port: int, inventory: Inventory, slabs: int, remnants: int, rng: random.Random):
+    """Cadastra o estoque inicial pelas rotas de carga em lote e de retalhos"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    chunk = ServerConfig.get_bulk_max_rows()
+    created = [inventory.new_slab(rng) for _ in range(slabs)]
+    for start in range(0, len(created), chunk):
+        status, body = request(conn, 'POST', '/app/chapas/bulk', created[start:start + chunk])
+        if status >= 300:
+            raise RuntimeError(f'Falha ao semear chapas: {status} {body[:200]!r}')
+    for slab in created:
+        inventory.add(slab)
+
+    for _ in range(remnants):
+        remnant = inventory.new_slab(rng)
+        width, length = round(rng.uniform(0.3, 1.2), 2), round(rng.uniform(0.5, 2.0), 2)
+        remnant.update(tamanho=round(width * length, 3), largura=width, comprimento=length)
+        request(conn, 'POST', '/app/retalhos', remnant)
+    conn.close()
+
+
+# ----------------------------------------------------------------------
+# Fluxos
+# ----------------------------------------------------------------------
+
+def flow_lookup(conn, inventory, rng):
+    slab_id, _ = inventory.pick(rng)
+    return ROUTES['lookup'], request(conn, 'GET', f'/app/chapas/{slab_id}')
+
+
+def flow_create(conn, inventory, rng):
+    slab = inventory.new_slab(rng)
+    result = request(conn, 'POST', '/app/chapas', slab)
+    if result[0] < 300:
+        inventory.add(slab)
+    return ROUTES['create'], result
+
+
+def flow_update_area(conn, inventory, rng):
+    slab_id, area = inventory.pick(rng)
+    body = {'id_chapa': slab_id, 'nova_area_disponivel': round(area * rng.uniform(0.2, 0.95), 3)}
+    return ROUTES['update_area'], request(conn, 'POST', '/chapas/update-area', body)
+
+
+def flow_transform(conn, inventory, rng):
+    slab_id = inventory.take(rng)
+    if slab_id is None:
+        return flow_lookup(conn, inventory, rng)
+    body = {'id_chapa': slab_id, 'largura': round(rng.uniform(0.3, 1.0), 2),
+            'comprimento': round(rng.uniform(0.5, 1.5), 2)}
+    return ROUTES['transform'], request(conn, 'POST', '/chapas/transformar-retalho', body)
+
+
+def flow_list(conn, inventory, rng):
+    return ROUTES['list'], request(conn, 'GET', '/chapas')
+
+
+def flow_metragem(conn, inventory, rng):
+    return ROUTES['metragem'], request(conn, 'GET', '/chapas/metragem-total')
+
+
+def flow_labels(conn, inventory, rng):
+    body = {'quantidade_ids': rng.randint(1, 5), 'quantidade_por_id': rng.randint(1, 2)}
+    return ROUTES['labels'], request(conn, 'POST', '/etiquetas/gerar', body)
+
+
+def flow_search(conn, inventory, rng):
+    term = rng.choice(MATERIALS).split()[-1][:4].lower()
+    return ROUTES['search'], request(conn, 'GET', f'/app/search?q={quote(term)}&limit=20')
+
+
+FLOWS = {
+    'lookup': flow_lookup,
+    'create': flow_create,
+    'update_area': flow_update_area,
+    'transform': flow_transform,
+    'list': flow_list,
+    'metragem': flow_metragem,
+    'labels': flow_labels,
+    'search': flow_search,
+}
+
+# Rota de cada fluxo no relatório (usada também quando a requisição falha)
+ROUTES = {
+    'lookup': 'GET /app/chapas/<id>',
+    'create': 'POST /app/chapas',
+    'update_area': 'POST /chapas/update-area',
+    'transform': 'POST /chapas/transformar-retalho',
+    'list': 'GET /chapas',
+    'metragem': 'GET /chapas/metragem-total',
+    'labels': 'POST /etiquetas/gerar',
+    'search': 'GET /app/search',
+}
+
+
+class RouteStats:
+    """Latências e contadores de uma rota"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.rejected = 0
+        self.locks = 0
+        self.timeouts = 0
+
+    def merge(self, other: 'RouteStats'):
+        self.latencies.extend(other.latencies)
+        self.errors += other.errors
+        self.rejected += other.rejected
+        self.locks += other.locks
+        self.timeouts += other.timeouts
+
+
+def client(port: int, inventory: Inventory, mix: Dict[str, int], deadline: float, seed_value: int,
+           timeout: float) -> Dict[str, RouteStats]:
+    """Um leitor: conexão keep-alive própria, fluxos sorteados conforme a mistura"""
+    rng = random.Random(seed_value)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stats: Dict[str, RouteStats] = {}
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            route, (status, body) = FLOWS[name](conn, inventory, rng)
+        except socket.timeout:
+            route, status, body = ROUTES[name], -1, b''
+        except (OSError, http.client.HTTPException):
+            route, status, body = ROUTES[name], 0, b''
+        elapsed = time.perf_counter() - started
+
+        route_stats = stats.setdefault(route, RouteStats())
+        route_stats.latencies.append(elapsed)
+        if status == -1:
+            route_stats.timeouts += 1
+        if status <= 0 or status >= 500:
+            route_stats.errors += 1
+        elif status >= 400:
+            route_stats.rejected += 1
+        if any(marker in body for marker in LOCK_MARKERS):
+            route_stats.locks += 1
+        if status <= 0:
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    conn.close()
+    return stats
+
+
+# ----------------------------------------------------------------------
+# Relatório
+# ----------------------------------------------------------------------
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentil por posição mais próxima (lista já ordenada)"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+def summarize(stats: RouteStats, duration: float) -> Dict[str, float]:
+    latencies = sorted(stats.latencies)
+    count = len(latencies)
+    return {
+        'requisicoes': count,
+        'vazao': round(count / duration, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'erros': round(stats.errors / count, 4) if count else 0.0,
+        'recusas': round(stats.rejected / count, 4) if count else 0.0,
+        'travas': round(stats.locks / count, 4) if count else 0.0,
+        'timeouts': stats.timeouts,
+    }
+
+
+def print_report(result: Dict[str, Any]):
+    header = f"{'rota':36} {'req':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>7} {'4xx':>7} {'travas':>7}"
+    print(header)
+    print('-' * len(header))
+    rows = sorted(result['rotas'].items()) + [('TOTAL', result['total'])]
+    for route, item in rows:
+        print(f"{route:36} {item['requisicoes']:>7} {item['vazao']:>8.1f} {item['p50_ms']:>8.1f} "
+              f"{item['p95_ms']:>8.1f} {item['p99_ms']:>8.1f} {item['erros']:>7.2%} {item['recusas']:>7.2%} "
+              f"{item['travas']:>7.2%}")
+    printer = result['impressora']
+    print(f"Impressora: {printer['trabalhos']} trabalhos, {printer['bytes']} bytes")
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Lista as rotas que pioraram em relação à base além da tolerância"""
+    regressions = []
+    routes = dict(result['rotas'], TOTAL=result['total'])
+    base_routes = dict(baseline['rotas'], TOTAL=baseline['total'])
+    print(f"\nComparação com a base ({baseline.get('data', '?')}), tolerância {tolerance:.0%}:")
+    for route in sorted(set(routes) & set(base_routes)):
+        item, base = routes[route], base_routes[route]
+        changes = []
+        for key in ('p95_ms', 'p99_ms'):
+            if base[key] and item[key] > base[key] * (1 + tolerance):
+                changes.append(f"{key} {base[key]:.1f} -> {item[key]:.1f}")
+        if base['vazao'] and item['vazao'] < base['vazao'] * (1 - tolerance):
+            changes.append(f"vazão {base['vazao']:.1f} -> {item['vazao']:.1f}")
+        for key in ('erros', 'travas'):
+            if item[key] > base[key] + 0.01:
+                changes.append(f"{key} {base[key]:.2%} -> {item[key]:.2%}")
+        p95_delta = (item['p95_ms'] / base['p95_ms'] - 1) if base['p95_ms'] else 0.0
+        status = 'PIOROU ' + '; '.join(changes) if changes else 'ok'
+        print(f"  {route:36} p95 {p95_delta:+7.1%}  {status}")
+        if changes:
+            regressions.append(route)
+    return regressions
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f'Fluxo desconhecido: {name} (use {", ".join(FLOWS)})')
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Teste de carga do servidor QualiCam')
+    parser.add_argument('--clientes', type=int, default=10, help='leitores simultâneos (padrão 10)')
+    parser.add_argument('--duracao', type=float, default=30.0, help='duração da medição em segundos')
+    parser.add_argument('--chapas', type=int, default=5000, help='chapas no estoque inicial')
+    parser.add_argument('--retalhos', type=int, default=300, help='retalhos no estoque inicial')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='pesos dos fluxos, ex.: lookup=40,create=10,list=5')
+    parser.add_argument('--processos', type=int, default=None, help='processos do servidor (padrão do ServerConfig)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='tempo limite de cada requisição (s)')
+    parser.add_argument('--semente', type=int, default=1, help='semente dos sorteios')
+    parser.add_argument('--salvar-base', metavar='ARQUIVO', help='grava o resultado como base de comparação')
+    parser.add_argument('--comparar', metavar='ARQUIVO', help='compara com uma base gravada antes')
+    parser.add_argument('--tolerancia', type=float, default=0.15, help='piora aceita na comparação (padrão 0.15)')
+    parser.add_argument('--manter', action='store_true', help='não apaga o banco e o log do servidor ao final')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='qualicam-carga-')
+    printer = FakePrinter()
+    threading.Thread(target=printer.serve_forever, daemon=True).start()
+    port = _free_port()
+    rng = random.Random(args.semente)
+    server = None
+    try:
+        print(f"Subindo servidor em 127.0.0.1:{port} (banco em {workdir})")
+        server = start_server(workdir, port, printer.uri, args.processos)
+        inventory = Inventory(first_id=100000)
+        print(f"Semeando {args.chapas} chapas e {args.retalhos} retalhos")
+        seed(port, inventory, args.chapas, args.retalhos, rng)
+
+        print(f"Medindo por {args.duracao:.0f} s com {args.clientes} clientes: "
+              + ', '.join(f'{name}={weight}' for name, weight in args.mix.items()))
+        results: List[Dict[str, RouteStats]] = []
+        deadline = time.monotonic() + args.duracao
+        started = time.monotonic()
+        threads = []
+        for index in range(args.clientes):
+            thread = threading.Thread(target=lambda i=index: results.append(
+                client(port, inventory, args.mix, deadline, args.semente * 1000 + i, args.timeout)))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - started
+    finally:
+        if server is not None:
+            stop_server(server)
+        printer.shutdown()
+        if not args.manter:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    routes: Dict[str, RouteStats] = {}
+    total = RouteStats()
+    for stats in results:
+        for route, item in stats.items():
+            routes.setdefault(route, RouteStats()).merge(item)
+            total.merge(item)
+
+    result = {
+        'data': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'config': {'clientes': args.clientes, 'duracao': args.duracao, 'chapas': args.chapas,
+                   'retalhos': args.retalhos, 'mix': args.mix, 'processos': args.processos},
+        'rotas': {route: summarize(item, duration) for route, item in routes.items()},
+        'total': summarize(total, duration),
+        'impressora': {'trabalhos': printer.jobs, 'bytes': printer.bytes},
+    }
+    print()
+    print_report(result)
+
+    if args.salvar_base:
+        with open(args.salvar_base, 'w') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nBase gravada em {args.salvar_base}")
+    if args.comparar:
+        with open(args.comparar) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != result['config']:
+            print("AVISO: a base foi medida com outra configuração")
+        if compare(result, baseline, args.tolerancia):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
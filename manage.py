@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Comandos de manutenção do servidor
+
+Uso:
+    python3 manage.py verify-summary
+    python3 manage.py rebuild-summary
+    python3 manage.py compact-sync [--dias N]
+    python3 manage.py rebuild-consumo [--desde AAAA-MM-DD]
+    python3 manage.py archive-movimentacoes [--meses N] [--vacuum]
+"""
+
+import argparse
+import sys
+from database import DatabaseManager
+from sync import compact_change_log
+from archive import archive_closed_months
+
+
+def cmd_verify_summary(db_manager, args):
+    """Confere o resumo de metragem por material contra a tabela chapas"""
+    divergences = db_manager.verify_material_summary()
+    if not divergences:
+        print("Resumo de materiais consistente")
+        return 0
+    for item in divergences:
+        print(f"DIVERGENTE {item['nome_material']}: esperado={item['esperado']} atual={item['atual']}")
+    return 1
+
+
+def cmd_rebuild_summary(db_manager, args):
+    """Recalcula o resumo de metragem por material do zero"""
+    db_manager.rebuild_material_summary()
+    print("Resumo de materiais reconstruído")
+    return 0
+
+
+def cmd_compact_sync(db_manager, args):
+    """Compacta o log de alterações usado por /app/sync"""
+    result = compact_change_log(db_manager, args.dias)
+    print(f"Log de alterações compactado: {result['substituidas']} entradas substituídas, "
+          f"{result['tombstones']} exclusões antigas removidas, piso {result['piso']}")
+    return 0
+
+
+def cmd_rebuild_consumo(db_manager, args):
+    """Recalcula o consumo diário a partir das movimentações"""
+    since = db_manager.rebuild_consumption_rollup(args.desde)
+    if since is None:
+        print("Nenhuma movimentação para recalcular")
+    else:
+        if args.desde and since > args.desde:
+            print(f"AVISO: meses anteriores a {since} estão arquivados e foram mantidos")
+        print(f"Consumo diário reconstruído desde {since}")
+    return 0
+
+
+def cmd_archive_movimentacoes(db_manager, args):
+    """Move os meses fechados antigos de movimentações para arquivos mensais"""
+    months = archive_closed_months(db_manager, args.meses)
+    if not months:
+        print("Nenhum mês para arquivar")
+        return 0
+    if args.vacuum:
+        # Devolve ao sistema o espaço liberado no banco principal
+        with db_manager.get_connection() as conn:
+            conn.execute('VACUUM')
+    print(f"{len(months)} meses arquivados, {sum(item['removidas'] for item in months)} movimentações movidas")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manutenção do servidor QualiCam')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    subparsers.add_parser('verify-summary', help=cmd_verify_summary.__doc__).set_defaults(func=cmd_verify_summary)
+    subparsers.add_parser('rebuild-summary', help=cmd_rebuild_summary.__doc__).set_defaults(func=cmd_rebuild_summary)
+    
+    compact = subparsers.add_parser('compact-sync', help=cmd_compact_sync.__doc__)
+    compact.add_argument('--dias', type=int, default=None,
+                         help='idade mínima (dias) das exclusões removidas; padrão do ServerConfig')
+    compact.set_defaults(func=cmd_compact_sync)
+    
+    consumo = subparsers.add_parser('rebuild-consumo', help=cmd_rebuild_consumo.__doc__)
+    consumo.add_argument('--desde', default=None,
+                         help='primeiro dia recalculado (AAAA-MM-DD); padrão a movimentação mais antiga '
+                              'ainda no banco. Meses arquivados nunca são recalculados')
+    consumo.set_defaults(func=cmd_rebuild_consumo)
+    
+    archive = subparsers.add_parser('archive-movimentacoes', help=cmd_archive_movimentacoes.__doc__)
+    archive.add_argument('--meses', type=int, default=None,
+                         help='meses fechados mantidos no banco principal; padrão do ServerConfig')
+    archive.add_argument('--vacuum', action='store_true',
+                         help='compacta o banco principal depois de arquivar')
+    archive.set_defaults(func=cmd_archive_movimentacoes)
+    
+    args = parser.parse_args(argv)
+    return args.func(DatabaseManager(), args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
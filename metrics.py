@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas do servidor no formato texto do Prometheus (``GET /metrics``)
+
+Medidas registradas:
+
+- latência por rota e método (histograma) e requisições por código de
+  status, pelos ganchos ``before_request``/``after_request`` do Flask;
+- requisições em andamento;
+- espera por uma conexão do pool, tempo limite esgotado e conexões
+  emprestadas;
+- espera das escritas pelo escritor único (fila + commit do lote);
+- duração do envio de cada trabalho à impressora (``lpr`` ou TCP).
+
+Os valores ficam na memória do processo, cada métrica com um lock curto:
+registrar uma requisição custa poucos microssegundos. Como o ``serve.py``
+roda vários processos e cada coleta cai em um deles, cada processo grava
+periodicamente um retrato (``<pid>.json``) em ``get_metrics_dir()`` e o
+``/metrics`` soma os retratos de todos. Contadores e histogramas de
+processos encerrados continuam somados, para que os totais nunca
+diminuam; medidores (gauges) só contam processos vivos.
+
+Ao encerrar, o processo soma seus contadores e histogramas a um único
+``retired.json`` e apaga o próprio retrato, então o diretório não cresce
+com o rodízio de workers. Retratos de processos que morreram sem
+encerrar (``SIGKILL``) são somados da mesma forma na coleta seguinte.
+"""
+
+import bisect
+import fcntl
+import json
+import math
+import os
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+from config import ServerConfig
+
+# Limites dos histogramas (s)
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+PRINT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+
+
+class _Metric:
+    """Base das métricas: valores por combinação de rótulos"""
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, Any] = {}
+        REGISTRY.append(self)
+
+    def snapshot(self) -> List[list]:
+        """Valores atuais como lista ``[[rótulos], valor]`` (serializável)"""
+        with self._lock:
+            return [[list(key), _copy(value)] for key, value in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _copy(value):
+    return [list(value[0]), value[1]] if isinstance(value, list) else value
+
+
+class Counter(_Metric):
+    """Total que só cresce"""
+    kind = 'counter'
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valor que sobe e desce"""
+    kind = 'gauge'
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Labels = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels: Labels = ()):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Distribuição em faixas fixas, com soma e contagem"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = REQUEST_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: Labels = ()):
+        # Contagem por faixa (não acumulada) + soma; acumulada só na coleta
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+
+REGISTRY: List[_Metric] = []
+
+REQUEST_SECONDS = Histogram('qualicam_http_request_duration_seconds',
+                            'Tempo de resposta por rota (até o início do corpo nas respostas em fluxo)',
+                            ('method', 'route'))
+REQUESTS = Counter('qualicam_http_requests_total', 'Requisições atendidas por rota e código de status',
+                   ('method', 'route', 'status'))
+IN_FLIGHT = Gauge('qualicam_http_requests_in_flight', 'Requisições em andamento')
+POOL_WAIT = Histogram('qualicam_db_pool_wait_seconds', 'Espera por uma conexão livre do pool',
+                      buckets=WAIT_BUCKETS)
+POOL_TIMEOUTS = Counter('qualicam_db_pool_timeouts_total', 'Esperas pelo pool que esgotaram o tempo limite')
+POOL_IN_USE = Gauge('qualicam_db_pool_connections_in_use', 'Conexões do pool emprestadas')
+WRITE_WAIT = Histogram('qualicam_db_write_wait_seconds', 'Espera de uma escrita pelo escritor único até o commit',
+                       buckets=WAIT_BUCKETS)
+PRINT_SECONDS = Histogram('qualicam_print_send_seconds', 'Duração do envio de um trabalho à impressora',
+                          ('sink', 'result'), buckets=PRINT_BUCKETS)
+
+
+# ----------------------------------------------------------------------
+# Retratos por processo
+# ----------------------------------------------------------------------
+
+_state = {'pid': None, 'directory': None, 'thread': None}
+_stopping = threading.Event()
+
+# Soma dos processos encerrados; o lock (flock) é exclusivo para quem a
+# altera e compartilhado na coleta, que assim nunca vê um processo
+# ao mesmo tempo no próprio retrato e no retired.json
+RETIRED = 'retired.json'
+_LOCK = 'retired.lock'
+
+
+def start(directory: str = None, interval: float = None):
+    """Passa a gravar o retrato deste processo a cada ``interval`` segundos"""
+    if _state['pid'] == os.getpid():
+        return
+    # Após o fork, valores herdados do processo mestre seriam somados em dobro
+    for metric in REGISTRY:
+        metric.reset()
+    directory = directory or ServerConfig.get_metrics_dir()
+    interval = interval or ServerConfig.get_metrics_flush_interval()
+    os.makedirs(directory, exist_ok=True)
+    _stopping.clear()
+    thread = threading.Thread(target=_run, args=(interval,), name='metrics-writer', daemon=True)
+    _state.update(pid=os.getpid(), directory=directory, thread=thread)
+    thread.start()
+
+
+def stop(timeout: float = 5.0):
+    """Para a thread e soma os valores deste processo ao ``retired.json``"""
+    if _state['pid'] != os.getpid():
+        return
+    _stopping.set()
+    # Uma gravação em andamento recriaria o retrato depois de apagado
+    _state['thread'].join(timeout)
+    metricas = {metric.name: metric.snapshot() for metric in REGISTRY}
+    _retire(_state['directory'], os.path.join(_state['directory'], f'{os.getpid()}.json'), metricas)
+    _state['pid'] = None
+
+
+def _run(interval: float):
+    while not _stopping.wait(interval):
+        try:
+            write_snapshot()
+        except OSError as e:
+            print(f"ERRO ao gravar métricas: {str(e)}")
+
+
+def write_snapshot():
+    """Grava os valores atuais deste processo em ``<pid>.json``"""
+    path = os.path.join(_state['directory'], f'{os.getpid()}.json')
+    _write_json(path, {'pid': os.getpid(), 'ativo': True,
+                       'metricas': {metric.name: metric.snapshot() for metric in REGISTRY}})
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+
+
+def _lock(directory: str, exclusive: bool):
+    """Abre e trava o arquivo de lock; fechar o arquivo solta o lock"""
+    lock = open(os.path.join(directory, _LOCK), 'a')
+    fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    return lock
+
+
+def _retire(directory: str, path: str, metricas: Dict[str, list] = None):
+    """Soma contadores e histogramas de um processo ao ``retired.json`` e apaga ``path``
+
+    Sem ``metricas``, os valores são lidos de ``path`` (processo que morreu
+    sem encerrar); se outro processo já o somou, não há nada a fazer.
+    """
+    kinds = {metric.name: metric.kind for metric in REGISTRY}
+    with _lock(directory, exclusive=True):
+        if metricas is None:
+            try:
+                with open(path) as f:
+                    metricas = json.load(f)['metricas']
+            except (OSError, ValueError, KeyError):
+                return
+        retired_path = os.path.join(directory, RETIRED)
+        try:
+            with open(retired_path) as f:
+                retired = json.load(f)['metricas']
+        except (OSError, ValueError, KeyError):
+            retired = {}
+
+        merged: Dict[str, Dict[Labels, Any]] = {}
+        for source in (retired, metricas):
+            for name, values in source.items():
+                if kinds.get(name, 'gauge') != 'gauge':
+                    _merge_values(kinds[name], merged.setdefault(name, {}), values)
+        _write_json(retired_path, {'pid': None, 'ativo': False, 'metricas': {
+            name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()}})
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def clear_snapshots(directory: str = None):
+    """Apaga os retratos de uma execução anterior do servidor"""
+    directory = directory or ServerConfig.get_metrics_dir()
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp', '.lock')):
+            os.remove(os.path.join(directory, name))
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _load_snapshots() -> List[Dict[str, Any]]:
+    """Retratos de todos os processos; o deste processo é lido da memória"""
+    own = {'pid': os.getpid(), 'ativo': True,
+           'metricas': {metric.name: metric.snapshot() for metric in REGISTRY}}
+    directory = _state['directory']
+    if _state['pid'] != os.getpid() or not os.path.isdir(directory):
+        return [own]
+
+    snapshots = [own]
+    dead = []
+    with _lock(directory, exclusive=False):
+        for name in os.listdir(directory):
+            if not name.endswith('.json') or name == f'{os.getpid()}.json':
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if name != RETIRED and not _is_alive(data['pid']):
+                data['ativo'] = False
+                dead.append(path)
+            snapshots.append(data)
+
+    # Morreram sem encerrar (SIGKILL): daqui em diante contam pelo retired.json
+    for path in dead:
+        _retire(directory, path)
+    return snapshots
+
+
+def collect() -> Dict[str, Dict[Labels, Any]]:
+    """Soma os valores de cada métrica em todos os processos"""
+    merged: Dict[str, Dict[Labels, Any]] = {metric.name: {} for metric in REGISTRY}
+    kinds = {metric.name: metric.kind for metric in REGISTRY}
+    for snapshot in _load_snapshots():
+        for name, values in snapshot['metricas'].items():
+            if name not in merged or (kinds[name] == 'gauge' and not snapshot['ativo']):
+                continue
+            _merge_values(kinds[name], merged[name], values)
+    return merged
+
+
+def _merge_values(kind: str, target: Dict[Labels, Any], values: List[list]):
+    """Soma os valores ``[[rótulos], valor]`` de um retrato em ``target``"""
+    for labels, value in values:
+        key = tuple(labels)
+        if kind == 'histogram':
+            entry = target.setdefault(key, [[0] * len(value[0]), 0.0])
+            entry[0] = [a + b for a, b in zip(entry[0], value[0])]
+            entry[1] += value[1]
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+# ----------------------------------------------------------------------
+# Formato texto do Prometheus
+# ----------------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def render() -> str:
+    """Todas as métricas, somadas entre os processos, no formato texto"""
+    merged = collect()
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for key, value in sorted(merged[metric.name].items()):
+            if metric.kind != 'histogram':
+                lines.append(f'{metric.name}{_format_labels(metric.labels, key)} {_format_value(value)}')
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + ('+Inf' if math.isinf(bound) else repr(bound)) + '"'
+                lines.append(f'{metric.name}_bucket{_format_labels(metric.labels, key, le)} {cumulative}')
+            lines.append(f'{metric.name}_sum{_format_labels(metric.labels, key)} {_format_value(total)}')
+            lines.append(f'{metric.name}_count{_format_labels(metric.labels, key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
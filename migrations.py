@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migrações versionadas do esquema do banco de dados
+
+A versão aplicada fica em ``PRAGMA user_version``. Cada migração roda em
+sua própria transação junto com a atualização da versão, então um
+``qualicam.db`` existente é levado até a versão atual passo a passo e
+nunca fica com uma migração aplicada pela metade.
+
+Para alterar o esquema, acrescente uma nova entrada ao final de
+``MIGRATIONS`` - nunca edite uma migração já publicada.
+"""
+
+import sqlite3
+from typing import Callable, List, Optional, Tuple, Union
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+# Material e fornecedor de uma movimentação: a chapa ainda em estoque ou,
+# se já virou retalho, o retalho originado dela
+_MATERIAL_OF = """COALESCE(
+                (SELECT nome_material FROM chapas WHERE id_chapa = {m}.id_chapa),
+                (SELECT nome_material FROM retalhos WHERE id_chapa_original = {m}.id_chapa LIMIT 1),
+                'Desconhecido')"""
+_SUPPLIER_OF = """COALESCE(
+                (SELECT fornecedor FROM chapas WHERE id_chapa = {m}.id_chapa),
+                (SELECT fornecedor FROM retalhos WHERE id_chapa_original = {m}.id_chapa LIMIT 1),
+                'Desconhecido')"""
+
+# Colunas indexadas pela busca textual (migração 11)
+_FTS_COLUMNS = 'nome_material, fornecedor, localizacao'
+
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, 'Tabelas iniciais', [
+        '''
+        CREATE TABLE IF NOT EXISTS chapas (
+            id_chapa INTEGER PRIMARY KEY,
+            nome_material TEXT NOT NULL,
+            fornecedor TEXT NOT NULL,
+            preco_compra_m2 REAL NOT NULL,
+            area_liquida_inicial REAL NOT NULL,
+            area_disponivel REAL NOT NULL,
+            localizacao TEXT NOT NULL,
+            status TEXT DEFAULT 'Disponível',
+            data_entrada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS movimentacoes (
+            id_movimentacao INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_chapa INTEGER NOT NULL,
+            tipo_movimentacao TEXT NOT NULL,
+            quantidade_m2 REAL NOT NULL,
+            os_associada TEXT,
+            data_movimentacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (id_chapa) REFERENCES chapas (id_chapa)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS retalhos (
+            id_retalho INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_chapa_original INTEGER NOT NULL,
+            nome_material TEXT NOT NULL,
+            fornecedor TEXT NOT NULL,
+            area_retalho REAL NOT NULL,
+            localizacao TEXT NOT NULL,
+            data_transformacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (id_chapa_original) REFERENCES chapas (id_chapa)
+        )
+        ''',
+    ]),
+    (2, 'Índices das consultas mais frequentes', [
+        # /chapas e get_available_slabs: filtro por status ordenado por data
+        'CREATE INDEX IF NOT EXISTS idx_chapas_status_data ON chapas (status, data_entrada)',
+        # /app/chapas: todas as chapas ordenadas por data
+        'CREATE INDEX IF NOT EXISTS idx_chapas_data ON chapas (data_entrada)',
+        # /retalhos e /app/retalhos
+        'CREATE INDEX IF NOT EXISTS idx_retalhos_data ON retalhos (data_transformacao)',
+        # Verificação de duplicidade em app_create_retalho
+        'CREATE INDEX IF NOT EXISTS idx_retalhos_chapa_original ON retalhos (id_chapa_original)',
+        # Histórico de movimentações de uma chapa
+        'CREATE INDEX IF NOT EXISTS idx_movimentacoes_chapa_data ON movimentacoes (id_chapa, data_movimentacao)',
+    ]),
+    (3, 'Contador de versões por tabela (ETag)', [
+        '''
+        CREATE TABLE IF NOT EXISTS versoes_tabelas (
+            tabela TEXT PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        lambda conn: _create_version_triggers(conn, ('chapas', 'retalhos', 'movimentacoes')),
+    ]),
+    (4, 'Resumo de metragem por material mantido por triggers', [
+        '''
+        CREATE TABLE IF NOT EXISTS material_summary (
+            nome_material TEXT PRIMARY KEY,
+            area_total_inicial REAL NOT NULL DEFAULT 0,
+            area_total_disponivel REAL NOT NULL DEFAULT 0,
+            quantidade_chapas INTEGER NOT NULL DEFAULT 0,
+            soma_preco_m2 REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_material_summary_insert
+        AFTER INSERT ON chapas
+        BEGIN
+            INSERT INTO material_summary (nome_material, area_total_inicial, area_total_disponivel,
+                                          quantidade_chapas, soma_preco_m2)
+            VALUES (NEW.nome_material, NEW.area_liquida_inicial, NEW.area_disponivel, 1, NEW.preco_compra_m2)
+            ON CONFLICT (nome_material) DO UPDATE SET
+                area_total_inicial = area_total_inicial + excluded.area_total_inicial,
+                area_total_disponivel = area_total_disponivel + excluded.area_total_disponivel,
+                quantidade_chapas = quantidade_chapas + 1,
+                soma_preco_m2 = soma_preco_m2 + excluded.soma_preco_m2;
+        END
+        ''',
+        # Exclusão direta e transformação em retalho (que remove de chapas)
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_material_summary_delete
+        AFTER DELETE ON chapas
+        BEGIN
+            UPDATE material_summary SET
+                area_total_inicial = area_total_inicial - OLD.area_liquida_inicial,
+                area_total_disponivel = area_total_disponivel - OLD.area_disponivel,
+                quantidade_chapas = quantidade_chapas - 1,
+                soma_preco_m2 = soma_preco_m2 - OLD.preco_compra_m2
+            WHERE nome_material = OLD.nome_material;
+            DELETE FROM material_summary
+            WHERE nome_material = OLD.nome_material AND quantidade_chapas <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_material_summary_update
+        AFTER UPDATE OF nome_material, area_liquida_inicial, area_disponivel, preco_compra_m2 ON chapas
+        BEGIN
+            UPDATE material_summary SET
+                area_total_inicial = area_total_inicial - OLD.area_liquida_inicial,
+                area_total_disponivel = area_total_disponivel - OLD.area_disponivel,
+                quantidade_chapas = quantidade_chapas - 1,
+                soma_preco_m2 = soma_preco_m2 - OLD.preco_compra_m2
+            WHERE nome_material = OLD.nome_material;
+            DELETE FROM material_summary
+            WHERE nome_material = OLD.nome_material AND quantidade_chapas <= 0;
+            INSERT INTO material_summary (nome_material, area_total_inicial, area_total_disponivel,
+                                          quantidade_chapas, soma_preco_m2)
+            VALUES (NEW.nome_material, NEW.area_liquida_inicial, NEW.area_disponivel, 1, NEW.preco_compra_m2)
+            ON CONFLICT (nome_material) DO UPDATE SET
+                area_total_inicial = area_total_inicial + excluded.area_total_inicial,
+                area_total_disponivel = area_total_disponivel + excluded.area_total_disponivel,
+                quantidade_chapas = quantidade_chapas + 1,
+                soma_preco_m2 = soma_preco_m2 + excluded.soma_preco_m2;
+        END
+        ''',
+        lambda conn: rebuild_material_summary(conn),
+    ]),
+    (5, 'Reserva de IDs de etiqueta (lista livre embaralhada)', [
+        # Todos os IDs de 5 dígitos ainda não usados, em ordem aleatória
+        # fixa; a alocação consome sempre o início da lista
+        '''
+        CREATE TABLE IF NOT EXISTS etiquetas_livres (
+            posicao INTEGER PRIMARY KEY,
+            id_etiqueta INTEGER NOT NULL UNIQUE
+        )
+        ''',
+        '''
+        INSERT OR IGNORE INTO etiquetas_livres (id_etiqueta)
+        WITH RECURSIVE seq(n) AS (
+            SELECT 10000 UNION ALL SELECT n + 1 FROM seq WHERE n < 99999
+        )
+        SELECT n FROM seq
+        WHERE n NOT IN (SELECT id_chapa FROM chapas)
+        ORDER BY random()
+        ''',
+        # IDs já entregues para impressão; data_uso fica nula até a chapa
+        # com aquele ID ser cadastrada
+        '''
+        CREATE TABLE IF NOT EXISTS etiquetas_reservadas (
+            id_etiqueta INTEGER PRIMARY KEY,
+            data_reserva TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_uso TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_etiquetas_reservadas_pendentes
+        ON etiquetas_reservadas (data_reserva) WHERE data_uso IS NULL
+        ''',
+        # IDs digitados manualmente no cadastro saem da lista livre
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_etiquetas_uso
+        AFTER INSERT ON chapas
+        BEGIN
+            DELETE FROM etiquetas_livres WHERE id_etiqueta = NEW.id_chapa;
+            UPDATE etiquetas_reservadas SET data_uso = CURRENT_TIMESTAMP
+            WHERE id_etiqueta = NEW.id_chapa AND data_uso IS NULL;
+        END
+        ''',
+    ]),
+    (6, 'Fila persistente de impressão de etiquetas', [
+        '''
+        CREATE TABLE IF NOT EXISTS impressao_jobs (
+            id_job INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL DEFAULT 'PENDENTE',
+            quantidade_por_id INTEGER NOT NULL,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_conclusao TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS impressao_itens (
+            id_item INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_job INTEGER NOT NULL,
+            id_etiqueta INTEGER NOT NULL,
+            copias INTEGER NOT NULL,
+            copias_impressas INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'PENDENTE',
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            disponivel_em REAL NOT NULL DEFAULT 0,
+            erro TEXT,
+            FOREIGN KEY (id_job) REFERENCES impressao_jobs (id_job)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_impressao_itens_fila ON impressao_itens (status, disponivel_em)',
+        'CREATE INDEX IF NOT EXISTS idx_impressao_itens_job ON impressao_itens (id_job)',
+    ]),
+    (7, 'Eventos de alteração para o feed SSE (/events)', [
+        # Gravados pelas próprias escritas, na mesma transação; o ID
+        # crescente é o Last-Event-ID usado para retomar o feed
+        '''
+        CREATE TABLE IF NOT EXISTS eventos (
+            id_evento INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            id_chapa INTEGER,
+            dados TEXT NOT NULL,
+            data_evento TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (8, 'Log de alterações para sincronização incremental (/app/sync)', [
+        # Uma linha por escrita em chapas/retalhos, inclusive exclusões
+        # (tombstones); seq é o número de sequência usado pelo cliente
+        '''
+        CREATE TABLE IF NOT EXISTS alteracoes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabela TEXT NOT NULL,
+            id_registro INTEGER NOT NULL,
+            operacao TEXT NOT NULL,
+            data_alteracao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_alteracoes_registro ON alteracoes (tabela, id_registro)',
+        # Abaixo do piso o log foi compactado e o cliente precisa ressincronizar
+        '''
+        CREATE TABLE IF NOT EXISTS alteracoes_estado (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        "INSERT OR IGNORE INTO alteracoes_estado (chave, valor) VALUES ('piso', 0)",
+        # Retalhos são identificados pelo app pelo ID da chapa original
+        lambda conn: _create_change_log_triggers(conn, {'chapas': 'id_chapa', 'retalhos': 'id_chapa_original'}),
+        # Registros já existentes entram no log como inclusões
+        '''
+        INSERT INTO alteracoes (tabela, id_registro, operacao)
+        SELECT 'chapas', id_chapa, 'upsert' FROM chapas
+        ''',
+        '''
+        INSERT INTO alteracoes (tabela, id_registro, operacao)
+        SELECT 'retalhos', id_chapa_original, 'upsert' FROM retalhos
+        ''',
+    ]),
+    (9, 'Consumo diário por material, fornecedor e tipo de movimentação', [
+        '''
+        CREATE TABLE IF NOT EXISTS consumo_diario (
+            dia TEXT NOT NULL,
+            nome_material TEXT NOT NULL,
+            fornecedor TEXT NOT NULL,
+            tipo_movimentacao TEXT NOT NULL,
+            quantidade_m2 REAL NOT NULL DEFAULT 0,
+            movimentacoes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, nome_material, fornecedor, tipo_movimentacao)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_consumo_diario_material ON consumo_diario (nome_material, dia)',
+        # Só inserções: apagar movimentações antigas não altera o histórico
+        # já consolidado
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_consumo_diario_insert
+        AFTER INSERT ON movimentacoes
+        BEGIN
+            INSERT INTO consumo_diario (dia, nome_material, fornecedor, tipo_movimentacao,
+                                        quantidade_m2, movimentacoes)
+            SELECT date(NEW.data_movimentacao), {_MATERIAL_OF.format(m='NEW')}, {_SUPPLIER_OF.format(m='NEW')},
+                   NEW.tipo_movimentacao, NEW.quantidade_m2, 1
+            WHERE true
+            ON CONFLICT (dia, nome_material, fornecedor, tipo_movimentacao) DO UPDATE SET
+                quantidade_m2 = quantidade_m2 + excluded.quantidade_m2,
+                movimentacoes = movimentacoes + 1;
+        END
+        ''',
+        lambda conn: rebuild_consumption_rollup(conn),
+    ]),
+    (10, 'Índice por data das movimentações (arquivamento mensal)', [
+        'CREATE INDEX IF NOT EXISTS idx_movimentacoes_data ON movimentacoes (data_movimentacao)',
+    ]),
+    (11, 'Busca textual (FTS5) em chapas e retalhos', [
+        # Índices externos: o texto fica só nas tabelas originais; acentos
+        # ignorados e prefixos de 2 e 3 letras pré-indexados
+        f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS chapas_fts USING fts5(
+            {_FTS_COLUMNS}, content='chapas', content_rowid='id_chapa',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS retalhos_fts USING fts5(
+            {_FTS_COLUMNS}, content='retalhos', content_rowid='id_retalho',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        lambda conn: _create_fts_triggers(conn, {'chapas': 'id_chapa', 'retalhos': 'id_retalho'}),
+        "INSERT INTO chapas_fts (chapas_fts) VALUES ('rebuild')",
+        "INSERT INTO retalhos_fts (retalhos_fts) VALUES ('rebuild')",
+    ]),
+    (12, 'Medidas dos retalhos e índices de busca por tamanho', [
+        'ALTER TABLE retalhos ADD COLUMN largura REAL',
+        'ALTER TABLE retalhos ADD COLUMN comprimento REAL',
+        # /retalhos/match: menor retalho do material com área suficiente
+        'CREATE INDEX IF NOT EXISTS idx_retalhos_material_area ON retalhos (nome_material, area_retalho)',
+        # Lados do retalho como ponto (menor lado, maior lado), para que a
+        # peça caiba em qualquer orientação
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS retalhos_medidas USING rtree(
+            id_retalho, lado_menor_min, lado_menor_max, lado_maior_min, lado_maior_max
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_retalhos_medidas_insert
+        AFTER INSERT ON retalhos
+        WHEN NEW.largura IS NOT NULL AND NEW.comprimento IS NOT NULL
+        BEGIN
+            INSERT INTO retalhos_medidas VALUES (
+                NEW.id_retalho,
+                MIN(NEW.largura, NEW.comprimento), MIN(NEW.largura, NEW.comprimento),
+                MAX(NEW.largura, NEW.comprimento), MAX(NEW.largura, NEW.comprimento));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_retalhos_medidas_delete
+        AFTER DELETE ON retalhos
+        BEGIN
+            DELETE FROM retalhos_medidas WHERE id_retalho = OLD.id_retalho;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_retalhos_medidas_update
+        AFTER UPDATE OF largura, comprimento ON retalhos
+        BEGIN
+            DELETE FROM retalhos_medidas WHERE id_retalho = OLD.id_retalho;
+            INSERT INTO retalhos_medidas
+            SELECT NEW.id_retalho,
+                   MIN(NEW.largura, NEW.comprimento), MIN(NEW.largura, NEW.comprimento),
+                   MAX(NEW.largura, NEW.comprimento), MAX(NEW.largura, NEW.comprimento)
+            WHERE NEW.largura IS NOT NULL AND NEW.comprimento IS NOT NULL;
+        END
+        ''',
+    ]),
+    # A R*Tree não separa por material: a faixa de lados trazia retalhos de
+    # todos os materiais. /retalhos/match percorre idx_retalhos_material_area
+    (13, 'Remove a R*Tree de medidas dos retalhos', [
+        'DROP TRIGGER IF EXISTS trg_retalhos_medidas_insert',
+        'DROP TRIGGER IF EXISTS trg_retalhos_medidas_delete',
+        'DROP TRIGGER IF EXISTS trg_retalhos_medidas_update',
+        'DROP TABLE IF EXISTS retalhos_medidas',
+    ]),
+]
+
+
+def rebuild_material_summary(conn: sqlite3.Connection) -> None:
+    """Recalcula ``material_summary`` do zero a partir de ``chapas``
+    
+    Deve ser chamada dentro de uma transação aberta pelo chamador.
+    """
+    conn.execute('DELETE FROM material_summary')
+    conn.execute('''
+        INSERT INTO material_summary (nome_material, area_total_inicial, area_total_disponivel,
+                                      quantidade_chapas, soma_preco_m2)
+        SELECT nome_material, SUM(area_liquida_inicial), SUM(area_disponivel),
+               COUNT(*), SUM(preco_compra_m2)
+        FROM chapas
+        GROUP BY nome_material
+    ''')
+
+
+def rebuild_consumption_rollup(conn: sqlite3.Connection, since: Optional[str] = None) -> Optional[str]:
+    """Recalcula ``consumo_diario`` a partir de ``movimentacoes``
+    
+    Refaz apenas os dias a partir de ``since`` (padrão: o dia da
+    movimentação mais antiga ainda na tabela), preservando o histórico de
+    movimentações que já saíram da tabela. ``since`` não pode ser anterior
+    a um mês já arquivado (ver ``DatabaseManager.rebuild_consumption_rollup``).
+    Deve ser chamada dentro de uma transação aberta pelo chamador.
+    Retorna o primeiro dia recalculado (None se não há movimentações).
+    """
+    if since is None:
+        since = conn.execute('SELECT date(MIN(data_movimentacao)) FROM movimentacoes').fetchone()[0]
+        if since is None:
+            return None
+    conn.execute('DELETE FROM consumo_diario WHERE dia >= ?', (since,))
+    conn.execute(f'''
+        INSERT INTO consumo_diario (dia, nome_material, fornecedor, tipo_movimentacao,
+                                    quantidade_m2, movimentacoes)
+        SELECT dia, nome_material, fornecedor, tipo_movimentacao, SUM(quantidade_m2), COUNT(*)
+        FROM (
+            SELECT date(m.data_movimentacao) AS dia, {_MATERIAL_OF.format(m='m')} AS nome_material,
+                   {_SUPPLIER_OF.format(m='m')} AS fornecedor, m.tipo_movimentacao, m.quantidade_m2
+            FROM movimentacoes m
+            WHERE m.data_movimentacao >= ?
+        )
+        GROUP BY dia, nome_material, fornecedor, tipo_movimentacao
+    ''', (since,))
+    return since
+
+
+def _create_version_triggers(conn: sqlite3.Connection, tables) -> None:
+    """Cria os triggers que incrementam a versão da tabela a cada escrita
+    
+    Por rodarem dentro da própria instrução, o incremento acontece na mesma
+    transação da escrita, qualquer que seja o caminho que a fez.
+    """
+    for table in tables:
+        conn.execute('INSERT OR IGNORE INTO versoes_tabelas (tabela, versao) VALUES (?, 0)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_versao_{table}_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = '{table}';
+                END
+            ''')
+
+
+def _create_fts_triggers(conn: sqlite3.Connection, tables) -> None:
+    """Cria os triggers que mantêm ``<tabela>_fts`` igual à tabela de origem
+    
+    ``tables`` mapeia a tabela para a coluna usada como rowid do índice.
+    Atualizações só reindexam quando uma coluna de texto muda.
+    """
+    old_values = ', '.join(f'OLD.{column}' for column in _FTS_COLUMNS.split(', '))
+    new_values = ', '.join(f'NEW.{column}' for column in _FTS_COLUMNS.split(', '))
+    for table, key in tables.items():
+        remove = f'''
+            INSERT INTO {table}_fts ({table}_fts, rowid, {_FTS_COLUMNS})
+            VALUES ('delete', OLD.{key}, {old_values});'''
+        add = f'''
+            INSERT INTO {table}_fts (rowid, {_FTS_COLUMNS}) VALUES (NEW.{key}, {new_values});'''
+        for name, event, body in (('insert', 'INSERT', add),
+                                  ('delete', 'DELETE', remove),
+                                  ('update', f'UPDATE OF {_FTS_COLUMNS}', remove + add)):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_{name}
+                AFTER {event} ON {table}
+                BEGIN{body}
+                END
+            ''')
+
+
+def _create_change_log_triggers(conn: sqlite3.Connection, tables) -> None:
+    """Cria os triggers que registram cada escrita de ``tables`` em ``alteracoes``
+    
+    ``tables`` mapeia a tabela para a coluna que identifica o registro no
+    cliente. Exclusões ficam registradas como ``delete`` (tombstone).
+    """
+    for table, key in tables.items():
+        for event, row, operation in (('INSERT', 'NEW', 'upsert'), ('UPDATE', 'NEW', 'upsert'),
+                                      ('DELETE', 'OLD', 'delete')):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_alteracoes_{table}_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO alteracoes (tabela, id_registro, operacao)
+                    VALUES ('{table}', {row}.{key}, '{operation}');
+                END
+            ''')
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Retorna a versão de esquema registrada no banco"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """Aplica as migrações pendentes e retorna a versão final do esquema"""
+    for version, description, steps in MIGRATIONS:
+        if get_schema_version(conn) >= version:
+            continue
+        
+        # BEGIN IMMEDIATE serializa processos que iniciam ao mesmo tempo;
+        # a versão é conferida de novo já com o lock de escrita
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Migração {version} aplicada: {description}")
+    
+    return get_schema_version(conn)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paginação por cursor (keyset) para as rotas de listagem
+
+As listagens são ordenadas por (timestamp DESC, id DESC). O cursor é a
+posição da última linha entregue, codificada de forma opaca; a próxima
+página começa estritamente depois dela, então o custo de cada página não
+depende da profundidade da rolagem.
+"""
+
+import base64
+import json
+import sqlite3
+from typing import Any, List, Mapping, Optional, Tuple
+from config import ServerConfig
+
+Page = Tuple[int, Optional[Tuple[Any, int]]]
+
+
+def encode_cursor(timestamp: Any, row_id: int) -> str:
+    """Codifica a posição (timestamp, id) em um cursor opaco"""
+    raw = json.dumps([timestamp, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Decodifica um cursor gerado por ``encode_cursor``"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw.decode('utf-8'))
+        return timestamp, int(row_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError('Cursor inválido')
+
+
+def parse_page_args(args: Mapping[str, str]) -> Optional[Page]:
+    """Lê ``limit``/``cursor`` da query string
+    
+    Retorna None quando nenhum dos dois foi informado, indicando que o
+    cliente espera a resposta antiga sem paginação.
+    """
+    if 'limit' not in args and 'cursor' not in args:
+        return None
+    
+    try:
+        limit = int(args.get('limit', ServerConfig.get_default_page_size()))
+    except ValueError:
+        raise ValueError('Parâmetro limit deve ser um número inteiro')
+    if limit < 1:
+        raise ValueError('Parâmetro limit deve ser maior que zero')
+    limit = min(limit, ServerConfig.get_max_page_size())
+    
+    cursor = args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def fetch_page(conn: sqlite3.Connection, select_sql: str, ts_column: str, id_column: str,
+               page: Page, where: str = '', params: tuple = ()) -> Tuple[List[tuple], Optional[str]]:
+    """Executa uma consulta paginada e retorna (linhas, próximo cursor)
+    
+    ``select_sql`` é o SELECT sem WHERE/ORDER BY e precisa incluir as
+    colunas ``ts_column`` e ``id_column``. As linhas vêm como tuplas, na
+    ordem das colunas do SELECT (ver ``serializers.RowSchema``).
+    """
+    limit, position = page
+    conditions = [where] if where else []
+    params = list(params)
+    if position is not None:
+        conditions.append(f'({ts_column}, {id_column}) < (?, ?)')
+        params.extend(position)
+    
+    query = select_sql
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(f'({c})' for c in conditions)
+    query += f' ORDER BY {ts_column} DESC, {id_column} DESC LIMIT ?'
+    params.append(limit + 1)
+    
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(query, params).fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        columns = [d[0] for d in cursor.description]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[columns.index(ts_column)], last[columns.index(id_column)])
+    return rows, next_cursor
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fila persistente de impressão de etiquetas
+
+``/etiquetas/gerar`` apenas grava o job no banco e responde na hora; as
+threads de impressão consomem a fila em segundo plano, com novas
+tentativas e espera crescente entre elas. Como o estado fica no SQLite,
+um lote impresso pela metade continua de onde parou após reiniciar o
+servidor: as etiquetas em impressão têm um prazo (lease) e voltam para a
+fila se o processo que as pegou morrer.
+
+As etiquetas pendentes de um job são renderizadas juntas pelo gabarito
+compilado (``labels.ZplTemplate``) e enviadas à impressora como um único
+trabalho de spool, pelo ``lpr`` (stdin) ou direto na porta RAW 9100.
+"""
+
+import os
+import socket
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from config import ServerConfig
+from labels import ZplTemplate
+import metrics
+
+# Estados de um item (etiqueta) e de um job
+PENDENTE = 'PENDENTE'
+IMPRIMINDO = 'IMPRIMINDO'
+IMPRESSO = 'IMPRESSO'
+FALHOU = 'FALHOU'
+CONCLUIDO = 'CONCLUIDO'
+CONCLUIDO_COM_ERROS = 'CONCLUIDO_COM_ERROS'
+
+
+class PrintError(Exception):
+    """Falha ao enviar uma etiqueta para a impressora"""
+
+
+class LprSink:
+    """Envia o fluxo ZPL para uma fila CUPS via ``lpr``, lendo do stdin"""
+    kind = 'lpr'
+
+    def __init__(self, printer_name: str, timeout: float = 30):
+        self.printer_name = printer_name
+        self.timeout = timeout
+
+    def send(self, data: bytes):
+        """Envia um trabalho de spool"""
+        comando = ['lpr', '-P', self.printer_name, '-o', 'raw']
+        try:
+            resultado = subprocess.run(comando, input=data, capture_output=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise PrintError(str(e))
+        if resultado.returncode != 0:
+            erro = resultado.stderr.decode('utf-8', 'replace').strip()
+            raise PrintError(erro or f'lpr retornou {resultado.returncode}')
+
+    def __repr__(self):
+        return f'lpr://{self.printer_name}'
+
+
+class RawTcpSink:
+    """Envia o fluxo ZPL direto para a porta RAW (JetDirect) da impressora"""
+    kind = 'tcp'
+
+    def __init__(self, host: str, port: int = 9100, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def send(self, data: bytes):
+        """Envia um trabalho de spool"""
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+                sock.sendall(data)
+        except OSError as e:
+            raise PrintError(f'{self.host}:{self.port}: {e}')
+
+    def __repr__(self):
+        return f'tcp://{self.host}:{self.port}'
+
+
+def make_sink(uri: str):
+    """Cria o destino de impressão a partir de ``lpr://fila`` ou ``tcp://host:porta``"""
+    parsed = urlparse(uri)
+    if parsed.scheme == 'lpr':
+        return LprSink(parsed.netloc or parsed.path)
+    if parsed.scheme == 'tcp':
+        return RawTcpSink(parsed.hostname, parsed.port or 9100)
+    raise ValueError(f'Destino de impressão inválido: {uri}')
+
+
+class PrintQueue:
+    """Fila de impressão gravada no banco e consumida por threads de fundo"""
+
+    def __init__(self, db_manager, sink=None, template_path: str = None, workers: int = None,
+                 max_attempts: int = None, retry_delay: float = None, lease: float = None,
+                 batch_size: int = None):
+        self.db_manager = db_manager
+        self.sink = sink or make_sink(ServerConfig.get_printer_uri())
+        self.template_path = template_path or ServerConfig.get_label_template_path()
+        self.template: Optional[ZplTemplate] = None
+        self.batch_size = batch_size or ServerConfig.get_print_batch_size()
+        self.workers = workers or ServerConfig.get_print_workers()
+        self.max_attempts = max_attempts or ServerConfig.get_print_max_attempts()
+        self.retry_delay = retry_delay or ServerConfig.get_print_retry_delay()
+        self.lease = lease or ServerConfig.get_print_lease()
+        self._pid = None
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    # ------------------------------------------------------------------
+    # API usada pelas rotas
+    # ------------------------------------------------------------------
+
+    def get_template(self) -> ZplTemplate:
+        """Retorna o gabarito compilado, lendo o arquivo apenas na primeira vez"""
+        if self.template is None:
+            self.template = ZplTemplate.load(self.template_path)
+        return self.template
+
+    def enqueue(self, label_ids: List[int], copies: int) -> int:
+        """Grava um job com uma etiqueta por ID e retorna o ID do job"""
+        job_id = self.db_manager.write(self._insert_job, label_ids, copies)
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def enqueue_new_labels(self, count: int, copies: int) -> Tuple[int, List[int]]:
+        """Reserva ``count`` IDs novos e grava o job deles na mesma transação
+
+        Se a gravação do job falhar, a reserva é desfeita junto e os IDs
+        voltam para a lista livre. Retorna (ID do job, IDs reservados).
+        """
+        def op(conn):
+            # Dentro de uma escrita, a reserva roda direto nesta transação
+            label_ids = self.db_manager.reserve_label_ids(count)
+            return self._insert_job(conn, label_ids, copies), label_ids
+
+        job_id, label_ids = self.db_manager.write(op)
+        self.start()
+        self._wakeup.set()
+        return job_id, label_ids
+
+    @staticmethod
+    def _insert_job(conn, label_ids: List[int], copies: int) -> int:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO impressao_jobs (quantidade_por_id) VALUES (?)', (copies,))
+        job_id = cursor.lastrowid
+        cursor.executemany('''
+            INSERT INTO impressao_itens (id_job, id_etiqueta, copias)
+            VALUES (?, ?, ?)
+        ''', [(job_id, label_id, copies) for label_id in label_ids])
+        return job_id
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Retorna o progresso de um job e o estado de cada etiqueta"""
+        with self.db_manager.get_connection() as conn:
+            job = conn.execute('SELECT * FROM impressao_jobs WHERE id_job = ?', (job_id,)).fetchone()
+            if not job:
+                return None
+            itens = conn.execute('''
+                SELECT id_etiqueta, copias, copias_impressas, status, tentativas, erro
+                FROM impressao_itens
+                WHERE id_job = ?
+                ORDER BY id_item
+            ''', (job_id,)).fetchall()
+
+        itens = [dict(item) for item in itens]
+        return {
+            'id_job': job['id_job'],
+            'status': job['status'],
+            'data_criacao': job['data_criacao'],
+            'data_conclusao': job['data_conclusao'],
+            'quantidade_ids': len(itens),
+            'quantidade_por_id': job['quantidade_por_id'],
+            'total_solicitado': sum(item['copias'] for item in itens),
+            'total_impresso': sum(item['copias_impressas'] for item in itens),
+            'ids_gerados': [item['id_etiqueta'] for item in itens],
+            'erros': [f"ID {item['id_etiqueta']}: {item['erro']}" for item in itens if item['status'] == FALHOU],
+            'itens': itens,
+        }
+
+    # ------------------------------------------------------------------
+    # Threads de impressão
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Inicia as threads de impressão (uma vez por processo)"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stopping.clear()
+        self._threads = []
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'print-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Pede às threads que terminem após a etiqueta em andamento"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def _run(self):
+        """Thread de impressão: reserva etiquetas prontas e as envia à impressora"""
+        with self.db_manager.dedicated_connection():
+            self._loop()
+
+    def _loop(self):
+        """Laço de uma thread de impressão"""
+        while not self._stopping.is_set():
+            try:
+                items = self._claim()
+            except Exception as e:
+                print(f"ERRO na fila de impressão: {str(e)}")
+                items = []
+
+            if not items:
+                self._wakeup.wait(1.0)
+                self._wakeup.clear()
+                continue
+
+            self._process(items)
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        """Reserva as próximas etiquetas prontas de um mesmo job"""
+        now = time.time()
+
+        # Consulta barata de leitura antes de ocupar o escritor com a fila vazia
+        with self.db_manager.get_connection() as conn:
+            ready = conn.execute('''
+                SELECT 1 FROM impressao_itens
+                WHERE status IN (?, ?) AND disponivel_em <= ?
+                LIMIT 1
+            ''', (PENDENTE, IMPRIMINDO, now)).fetchone()
+        if not ready:
+            return []
+
+        def op(conn):
+            first = conn.execute('''
+                SELECT id_job FROM impressao_itens
+                WHERE status IN (?, ?) AND disponivel_em <= ?
+                ORDER BY id_item
+                LIMIT 1
+            ''', (PENDENTE, IMPRIMINDO, now)).fetchone()
+            if not first:
+                return []
+
+            items = conn.execute('''
+                SELECT id_item, id_job, id_etiqueta, copias, copias_impressas, tentativas
+                FROM impressao_itens
+                WHERE id_job = ? AND status IN (?, ?) AND disponivel_em <= ?
+                ORDER BY id_item
+                LIMIT ?
+            ''', (first['id_job'], PENDENTE, IMPRIMINDO, now, self.batch_size)).fetchall()
+
+            conn.executemany('''
+                UPDATE impressao_itens
+                SET status = ?, tentativas = tentativas + 1, disponivel_em = ?
+                WHERE id_item = ?
+            ''', [(IMPRIMINDO, now + self.lease, item['id_item']) for item in items])
+            conn.execute('UPDATE impressao_jobs SET status = ? WHERE id_job = ? AND status = ?',
+                         (IMPRIMINDO, first['id_job'], PENDENTE))
+            return items
+
+        claimed = []
+        for item in self.db_manager.write(op):
+            item = dict(item)
+            item['tentativas'] += 1
+            claimed.append(item)
+        return claimed
+
+    def _render(self, items: List[Dict[str, Any]]) -> bytes:
+        """Renderiza as cópias que faltam de cada etiqueta em um só fluxo ZPL"""
+        # Em reimpressões a chapa já existe e preenche os demais campos
+        slabs = self.db_manager.get_slabs_by_ids([item['id_etiqueta'] for item in items])
+        labels = []
+        for item in items:
+            slab = slabs.get(item['id_etiqueta'])
+            labels.append({
+                'id': item['id_etiqueta'],
+                'material': slab['nome_material'] if slab else None,
+                'area': slab['area_disponivel'] if slab else None,
+                'copias': item['copias'] - item['copias_impressas'],
+            })
+        return self.get_template().render_batch(labels).encode('utf-8')
+
+    def _process(self, items: List[Dict[str, Any]]):
+        """Imprime um lote como um único trabalho de spool e grava o resultado"""
+        error = None
+        try:
+            data = self._render(items)
+            started = time.perf_counter()
+            result = 'erro'
+            try:
+                self.sink.send(data)
+                result = 'ok'
+            finally:
+                metrics.PRINT_SECONDS.observe(time.perf_counter() - started,
+                                              (getattr(self.sink, 'kind', 'outro'), result))
+        except (PrintError, OSError, ValueError) as e:
+            error = str(e)
+
+        self._finish(items, error)
+
+    def _finish(self, items: List[Dict[str, Any]], error: Optional[str]):
+        """Marca as etiquetas como impressas, reagendadas ou falhas e fecha o job"""
+        updates = []
+        for item in items:
+            if error is None:
+                updates.append((IMPRESSO, 0, None, item['copias'], item['id_item']))
+            elif item['tentativas'] >= self.max_attempts:
+                updates.append((FALHOU, 0, error, item['copias_impressas'], item['id_item']))
+            else:
+                available_at = time.time() + self.retry_delay * 2 ** (item['tentativas'] - 1)
+                updates.append((PENDENTE, available_at, error, item['copias_impressas'], item['id_item']))
+
+        def op(conn):
+            conn.executemany('''
+                UPDATE impressao_itens
+                SET status = ?, disponivel_em = ?, erro = ?, copias_impressas = ?
+                WHERE id_item = ?
+            ''', updates)
+
+            # Fecha o job quando nenhuma etiqueta está mais pendente
+            conn.execute('''
+                UPDATE impressao_jobs
+                SET status = CASE
+                        WHEN NOT EXISTS (SELECT 1 FROM impressao_itens
+                                         WHERE id_job = :job AND status = :falhou) THEN :concluido
+                        WHEN EXISTS (SELECT 1 FROM impressao_itens
+                                     WHERE id_job = :job AND copias_impressas > 0) THEN :com_erros
+                        ELSE :falhou
+                    END,
+                    data_conclusao = CURRENT_TIMESTAMP
+                WHERE id_job = :job
+                  AND NOT EXISTS (SELECT 1 FROM impressao_itens
+                                  WHERE id_job = :job AND status IN (:pendente, :imprimindo))
+            ''', {'job': items[0]['id_job'], 'falhou': FALHOU, 'concluido': CONCLUIDO,
+                  'com_erros': CONCLUIDO_COM_ERROS, 'pendente': PENDENTE, 'imprimindo': IMPRIMINDO})
+
+        self.db_manager.write(op)
+
+        if error:
+            ids = ', '.join(str(item['id_etiqueta']) for item in items)
+            print(f"ERRO ao imprimir etiquetas {ids} via {self.sink!r} "
+                  f"(tentativa {items[0]['tentativas']}): {error}")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Busca do menor retalho que atende uma peça (``GET /retalhos/match``)
+
+Antes de cortar uma chapa nova para uma OS, a marmoraria procura um
+retalho do mesmo material que comporte a peça. O índice
+``idx_retalhos_material_area`` (material, área), da migração 12 e
+atualizado pelo próprio SQLite a cada escrita, mantém os retalhos de
+cada material ordenados por área: a busca desce na B-tree até o primeiro
+retalho com área suficiente e segue em ordem crescente, já na ordem da
+resposta, até juntar ``limit`` retalhos.
+
+Com largura e comprimento, a área da peça vira a área mínima e os lados
+(em qualquer orientação) são conferidos em cada retalho percorrido; os
+que têm área mas não o formato são pulados.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from config import ServerConfig
+from serializers import RowSchema, fetch_tuples
+
+RETALHO_MATCH = RowSchema('retalhos', [
+    ('id_retalho', 'id_retalho'),
+    ('id_chapa_original', 'id_chapa_original'),
+    ('nome_material', 'nome_material'),
+    ('fornecedor', 'fornecedor'),
+    ('area_retalho', 'area_retalho'),
+    ('largura', 'largura'),
+    ('comprimento', 'comprimento'),
+    ('localizacao', 'localizacao'),
+    ('data_transformacao', 'data_transformacao'),
+])
+
+
+def parse_dimensions(largura: Any, comprimento: Any) -> Tuple[Optional[float], Optional[float]]:
+    """Valida largura e comprimento opcionais (metros)
+
+    Os dois vêm juntos ou nenhum deles; valores precisam ser positivos.
+    """
+    if largura is None and comprimento is None:
+        return None, None
+    if largura is None or comprimento is None:
+        raise ValueError('Informe largura e comprimento juntos')
+    largura, comprimento = float(largura), float(comprimento)
+    if largura <= 0 or comprimento <= 0:
+        raise ValueError('Largura e comprimento devem ser maiores que zero')
+    return largura, comprimento
+
+
+def find_fitting_remnants(db_manager, material: str, min_area: float = 0.0,
+                          width: Optional[float] = None, height: Optional[float] = None,
+                          limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Retalhos de ``material`` que comportam a peça, do menor para o maior
+
+    Sem ``width``/``height`` considera só a área; com eles, apenas
+    retalhos com medidas cadastradas em que a peça cabe (girada ou não).
+    """
+    query, params = _match_query(material, min_area, width, height, limit or ServerConfig.get_remnant_match_limit())
+    with db_manager.get_connection() as conn:
+        return RETALHO_MATCH.to_dicts(fetch_tuples(conn, query, params))
+
+
+def _match_query(material: str, min_area: float, width: Optional[float], height: Optional[float],
+                 limit: int) -> Tuple[str, Tuple[Any, ...]]:
+    """SELECT e parâmetros de ``find_fitting_remnants``"""
+    where = 'nome_material = ? AND area_retalho >= ?'
+    params: Tuple[Any, ...] = (material, min_area)
+    if width is not None:
+        # Retalhos sem medidas ficam de fora (MIN/MAX de NULL é NULL)
+        where += ' AND MIN(largura, comprimento) >= ? AND MAX(largura, comprimento) >= ?'
+        params = (material, max(min_area, width * height), min(width, height), max(width, height))
+
+    # O índice já entrega (área, rowid) em ordem: sem ordenação temporária
+    query = RETALHO_MATCH.select(where=where, order_by='area_retalho, id_retalho') + ' LIMIT ?'
+    return query, params + (limit,)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Busca textual em chapas e retalhos (``GET /app/search``)
+
+``chapas_fts`` e ``retalhos_fts`` (migração 11) indexam material,
+fornecedor e localização com acentos removidos e são mantidos por
+triggers na mesma transação de cada escrita. Cada palavra digitada vira
+um prefixo (``"bran"*``) e todas precisam aparecer no registro.
+
+Os resultados das duas tabelas são ordenados juntos pelo ``bm25``
+(material pesa mais que fornecedor, que pesa mais que localização). O
+cursor guarda a posição (pontuação, tipo, id) do último resultado, como
+na paginação das listagens.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from pagination import encode_cursor
+from serializers import CHAPA_APP, RETALHO_APP, fetch_tuples
+
+# Tipo -> (formato de saída, índice FTS, coluna usada como rowid do índice)
+_SOURCES = {
+    'chapa': (CHAPA_APP, 'chapas_fts', 'id_chapa'),
+    'retalho': (RETALHO_APP, 'retalhos_fts', 'id_retalho'),
+}
+
+# Ordem de desempate entre tipos com a mesma pontuação
+_KIND_ORDER = {'chapa': 0, 'retalho': 1}
+
+# Pesos de nome_material, fornecedor e localizacao no bm25
+_WEIGHTS = '10.0, 4.0, 2.0'
+
+_WORD = re.compile(r'\w+')
+
+Position = Tuple[float, str, int]
+
+
+def build_match_query(text: str) -> str:
+    """Converte o texto digitado em uma consulta FTS5 de prefixos
+
+    Só letras e dígitos são aproveitados, então a sintaxe do FTS5 (aspas,
+    ``OR``, ``NEAR``, ``-``) digitada pelo usuário nunca é interpretada.
+    """
+    words = _WORD.findall(text or '')
+    if not words:
+        raise ValueError('Parâmetro q deve conter ao menos uma letra ou número')
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def parse_position(position) -> Optional[Position]:
+    """Valida a posição decodificada de um cursor de busca"""
+    if position is None:
+        return None
+    try:
+        (score, kind), row_id = position
+    except (TypeError, ValueError):
+        raise ValueError('Cursor inválido')
+    if kind not in _SOURCES or not isinstance(score, (int, float)):
+        raise ValueError('Cursor inválido')
+    return float(score), kind, row_id
+
+
+def search(db_manager, text: str, limit: int, position: Optional[Position] = None,
+           kinds=None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Busca ``text`` e retorna (resultados, próximo cursor)
+
+    Cada resultado traz os campos do app e ``tipo`` (``chapa`` ou ``retalho``).
+    """
+    match = build_match_query(text)
+    kinds = kinds or list(_SOURCES)
+
+    found = []
+    with db_manager.get_connection() as conn:
+        for kind in kinds:
+            found.extend(_search_source(conn, kind, match, limit + 1, position))
+    found.sort(key=lambda item: (item[0], _KIND_ORDER[item[1]], item[2]))
+
+    next_cursor = None
+    if len(found) > limit:
+        found = found[:limit]
+        score, kind, row_id, _ = found[-1]
+        next_cursor = encode_cursor([score, kind], row_id)
+
+    results = []
+    for _, kind, _, row in found:
+        item = _SOURCES[kind][0].to_dict(row)
+        item['tipo'] = kind
+        results.append(item)
+    return results, next_cursor
+
+
+def _search_source(conn, kind: str, match: str, limit: int,
+                   position: Optional[Position]) -> List[Tuple[float, str, int, tuple]]:
+    """Melhores resultados de uma tabela depois de ``position``"""
+    schema, fts, key = _SOURCES[kind]
+    params: List[Any] = [match]
+    after = ''
+    if position is not None:
+        score, last_kind, last_id = position
+        # Mesma pontuação: o tipo e depois o id decidem quem vem antes
+        if _KIND_ORDER[kind] > _KIND_ORDER[last_kind]:
+            after = 'WHERE score >= ?'
+            params.append(score)
+        elif kind == last_kind:
+            after = 'WHERE (score, chave) > (?, ?)'
+            params.extend((score, last_id))
+        else:
+            after = 'WHERE score > ?'
+            params.append(score)
+    params.append(limit)
+
+    columns = ', '.join(f't.{column}' for column in schema.db_columns)
+    rows = fetch_tuples(conn, f'''
+        SELECT * FROM (
+            SELECT {columns}, bm25({fts}, {_WEIGHTS}) AS score, t.{key} AS chave
+            FROM {fts}
+            JOIN {schema.table} t ON t.{key} = {fts}.rowid
+            WHERE {fts} MATCH ?
+        )
+        {after}
+        ORDER BY score, chave
+        LIMIT ?
+    ''', params)
+    return [(row[-2], kind, row[-1], row) for row in rows]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Serialização das linhas do banco para os formatos enviados aos clientes
+
+Cada formato (cliente existente em snake_case e app QualiCam em
+camelCase) é descrito uma única vez como a lista ordenada de pares
+(coluna do banco, chave JSON). A consulta seleciona exatamente essas
+colunas nessa ordem, então cada linha (tupla) vira um dicionário com um
+simples ``dict(zip(chaves, linha))``, sem acesso campo a campo em Python.
+
+Se o pacote ``orjson`` estiver instalado ele é usado para codificar o
+JSON; caso contrário usa-se o ``json`` da biblioteca padrão.
+"""
+
+import json
+import sqlite3
+from typing import Any, Dict, Iterable, List, Mapping, Sequence, Tuple
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # dependência opcional
+    orjson = None
+
+
+class RowSchema:
+    """Mapeamento pré-compilado entre colunas do banco e chaves JSON
+
+    ``extra_columns`` são selecionadas depois das colunas publicadas (por
+    exemplo, o ID interno usado no cursor de paginação) e não aparecem no
+    JSON.
+    """
+
+    def __init__(self, table: str, fields: Sequence[Tuple[str, str]], extra_columns: Sequence[str] = ()):
+        self.table = table
+        self.db_columns = tuple(column for column, _ in fields) + tuple(extra_columns)
+        self.keys = tuple(key for _, key in fields)
+        self.columns = ', '.join(self.db_columns)
+        self._field_columns = tuple(column for column, _ in fields)
+
+    def select(self, where: str = '', order_by: str = '') -> str:
+        """Monta o SELECT das colunas deste formato"""
+        query = f'SELECT {self.columns} FROM {self.table}'
+        if where:
+            query += f' WHERE {where}'
+        if order_by:
+            query += f' ORDER BY {order_by}'
+        return query
+
+    def to_dict(self, row: Sequence[Any]) -> Dict[str, Any]:
+        """Converte uma linha selecionada por ``select`` em dicionário"""
+        return dict(zip(self.keys, row))
+
+    def to_dicts(self, rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+        """Converte várias linhas selecionadas por ``select``"""
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in rows]
+
+    def from_mapping(self, mapping: Mapping[str, Any]) -> Dict[str, Any]:
+        """Converte um registro completo (``sqlite3.Row`` ou dict por coluna)"""
+        return {key: mapping[column] for key, column in zip(self.keys, self._field_columns)}
+
+
+CHAPA_LEGACY = RowSchema('chapas', [
+    ('id_chapa', 'id_chapa'),
+    ('nome_material', 'nome_material'),
+    ('fornecedor', 'fornecedor'),
+    ('preco_compra_m2', 'preco_compra_m2'),
+    ('area_liquida_inicial', 'area_liquida_inicial'),
+    ('area_disponivel', 'area_disponivel'),
+    ('localizacao', 'localizacao'),
+    ('status', 'status'),
+    ('data_entrada', 'data_entrada'),
+])
+
+CHAPA_APP = RowSchema('chapas', [
+    ('id_chapa', 'id'),
+    ('nome_material', 'nomeMaterial'),
+    ('fornecedor', 'fornecedor'),
+    ('area_disponivel', 'tamanho'),
+    ('preco_compra_m2', 'preco'),
+    ('localizacao', 'localizacao'),
+    ('data_entrada', 'dataCriacao'),
+])
+
+# GET /app/chapas/<id> sempre respondeu sem ``dataCriacao``
+CHAPA_APP_DETAIL = RowSchema('chapas', [
+    ('id_chapa', 'id'),
+    ('nome_material', 'nomeMaterial'),
+    ('fornecedor', 'fornecedor'),
+    ('area_disponivel', 'tamanho'),
+    ('preco_compra_m2', 'preco'),
+    ('localizacao', 'localizacao'),
+])
+
+RETALHO_LEGACY = RowSchema('retalhos', [
+    ('id_retalho', 'id_retalho'),
+    ('id_chapa_original', 'id_chapa_original'),
+    ('nome_material', 'nome_material'),
+    ('fornecedor', 'fornecedor'),
+    ('area_retalho', 'area_retalho'),
+    ('localizacao', 'localizacao'),
+    ('data_transformacao', 'data_transformacao'),
+])
+
+RETALHO_APP = RowSchema('retalhos', [
+    ('id_chapa_original', 'id'),
+    ('nome_material', 'nomeMaterial'),
+    ('fornecedor', 'fornecedor'),
+    ('area_retalho', 'tamanho'),
+    ('localizacao', 'localizacao'),
+    ('data_transformacao', 'dataCriacao'),
+], extra_columns=('id_retalho',))
+
+
+def fetch_tuples(conn: sqlite3.Connection, query: str, params: Sequence[Any] = ()) -> List[tuple]:
+    """Executa a consulta devolvendo tuplas simples em vez de ``sqlite3.Row``"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor.execute(query, params).fetchall()
+
+
+def dumps(obj: Any) -> bytes:
+    """Codifica ``obj`` em JSON (UTF-8)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(obj: Any, status: int = 200) -> Response:
+    """Resposta JSON codificada pelo encoder mais rápido disponível"""
+    return Response(dumps(obj), status=status, mimetype='application/json')
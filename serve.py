@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor de produção (pré-fork) para o QualiCam
+
+Sobe o app Flask no Gunicorn com vários processos de trabalho, cada um
+com várias threads (``gthread``), keep-alive e tempo limite por
+requisição, tudo lido do ``ServerConfig``.
+
+O app é carregado uma vez no processo mestre (migrações aplicadas uma só
+vez) e os processos de trabalho são criados por fork. O mestre fecha suas
+conexões antes do fork e cada processo inicia as próprias threads de
+fundo (escritor do banco, fila de impressão) logo depois dele.
+
+Sinais tratados pelo mestre:
+    SIGHUP   troca os processos: sobe processos novos e encerra os
+             antigos após concluírem as requisições em andamento. Os
+             novos são forks do app já carregado no mestre, então o
+             código não é recarregado; publicar código novo exige parar
+             e iniciar o servidor
+    SIGTERM  para o servidor aguardando as requisições em andamento
+             (até ``get_graceful_timeout()`` segundos)
+
+Uso:
+    python3 serve.py
+"""
+
+from gunicorn.app.base import BaseApplication
+from config import ServerConfig
+
+
+def when_ready(server):
+    """Mestre pronto: não levar conexões abertas para os processos filhos"""
+    import Server
+    Server.db_manager.pool.close_all()
+    Server.metrics.clear_snapshots()
+    server.log.info("QualiCam: %s processos x %s threads", server.cfg.workers, server.cfg.threads)
+
+
+def post_fork(server, worker):
+    """Processo de trabalho recém-criado: inicia as threads de fundo"""
+    import Server
+    Server.init_process()
+
+
+def worker_exit(server, worker):
+    """Processo de trabalho encerrando: grava as escritas que ainda estão na fila"""
+    import Server
+    Server.shutdown_process()
+
+
+class QualiCamServer(BaseApplication):
+    """Aplicação Gunicorn configurada pelo ``ServerConfig``"""
+
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        options = {
+            'bind': f'{ServerConfig.get_server_host()}:{ServerConfig.get_server_port()}',
+            'workers': ServerConfig.get_server_workers(),
+            'worker_class': 'gthread',
+            'threads': ServerConfig.get_server_threads(),
+            'keepalive': ServerConfig.get_keepalive(),
+            'timeout': ServerConfig.get_request_timeout(),
+            'graceful_timeout': ServerConfig.get_graceful_timeout(),
+            'preload_app': True,
+            'when_ready': when_ready,
+            'post_fork': post_fork,
+            'worker_exit': worker_exit,
+        }
+        options.update(self.options)
+        for key, value in options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from Server import app
+        return app
+
+
+if __name__ == '__main__':
+    print("SERVIDOR DE CONTROLE DE ESTOQUE - MARMORARIA")
+    print(f"Servidor rodando em: http://{ServerConfig.get_server_host()}:{ServerConfig.get_server_port()}")
+    print("Para parar o servidor, pressione Ctrl+C")
+    QualiCamServer().run()
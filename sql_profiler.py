@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Perfil das consultas SQL (opcional, ``QUALICAM_SQL_PROFILE=1``)
+
+Com o perfil ligado, as conexões do pool são abertas como
+``ProfilingConnection``: cada ``execute``/``executemany`` e as leituras
+seguintes do cursor (``fetch*`` e iteração) são cronometradas e somadas à
+impressão digital da consulta, o SQL com literais trocados por ``?`` e
+listas ``IN (?, ?, ...)`` reduzidas, para que a mesma consulta com outros
+valores caia na mesma linha. Um progress handler do SQLite conta as
+instruções da máquina virtual de cada consulta (inclusive as dos
+triggers), medida de trabalho que não depende de espera por lock.
+
+Na primeira execução de cada impressão digital o ``EXPLAIN QUERY PLAN``
+é capturado com os mesmos parâmetros; planos com ``SCAN`` de tabela
+inteira ou ``USE TEMP B-TREE`` ficam marcados. Execuções acima de
+``get_sql_slow_threshold()`` vão para o log com o plano.
+
+``GET /debug/sql`` mostra o resumo do processo que respondeu.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from config import ServerConfig
+
+# Instruções da VM entre duas chamadas do progress handler
+PROGRESS_STEPS = 1000
+
+# Impressão digital usada quando o limite de consultas distintas é atingido
+OVERFLOW = '<outras consultas>'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+_PARAM_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ROW_LIST = re.compile(r'(\(\?(?:, \?)*\))(?:\s*,\s*\1)+')
+_SPACE = re.compile(r'\s+')
+_TABLE_SCAN = re.compile(r'^SCAN \w+$')
+
+# Comandos cujo plano interessa (os demais, como BEGIN/SAVEPOINT/PRAGMA, não têm plano útil)
+_PLANNED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """Normaliza o SQL: espaços, literais e listas de parâmetros"""
+    sql = _SPACE.sub(' ', sql).strip()
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PARAM_LIST.sub('(...)', sql)
+    return _ROW_LIST.sub(r'\1, ...', sql)
+
+
+def _plan_flags(plan: List[str]) -> Dict[str, bool]:
+    """Marca varredura completa de tabela e ordenação em B-tree temporária"""
+    # "SCAN chapas" sem índice; "SCAN ... USING INDEX", tabelas virtuais e CTEs não contam
+    details = [line.strip() for line in plan]
+    ctes = {line.split()[-1] for line in details if line.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    full_scan = any(_TABLE_SCAN.match(line) and line.split()[1] not in ctes for line in details)
+    return {'full_scan': full_scan, 'temp_btree': any('TEMP B-TREE' in line for line in plan)}
+
+
+class SqlProfiler:
+    """Estatísticas por impressão digital e log das consultas lentas"""
+
+    def __init__(self, slow_threshold: float = None, max_statements: int = None, slow_log_size: int = None):
+        self.slow_threshold = slow_threshold or ServerConfig.get_sql_slow_threshold()
+        self.max_statements = max_statements or ServerConfig.get_sql_profile_max_statements()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._slow = deque(maxlen=slow_log_size or ServerConfig.get_sql_slow_log_size())
+
+    def attach(self, conn: 'ProfilingConnection'):
+        """Liga uma conexão recém-aberta a este perfil"""
+        conn.profiler = self
+        conn.steps = 0
+        conn.set_progress_handler(conn.count_steps, PROGRESS_STEPS)
+
+    def _entry(self, key: str) -> Dict[str, Any]:
+        """Linha de uma impressão digital (chamar com o lock)"""
+        if self._pid != os.getpid():
+            # Processo filho após fork: não herdar os números do processo mestre
+            self._pid = os.getpid()
+            self._stats.clear()
+            self._slow.clear()
+        entry = self._stats.get(key)
+        if entry is None:
+            if len(self._stats) >= self.max_statements:
+                key = OVERFLOW
+                entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'rows': 0, 'vm_steps': 0,
+                                            'slow': 0, 'plan': None}
+        return entry
+
+    def needs_plan(self, key: str) -> bool:
+        """Se o plano desta consulta ainda não foi capturado"""
+        with self._lock:
+            entry = self._stats.get(key)
+            return entry is None or entry['plan'] is None
+
+    def record(self, key: str, elapsed: float, call_elapsed: float, steps: int, rows: int,
+               new_call: bool, plan: Optional[List[str]]):
+        """Soma uma etapa (execução ou leitura) à impressão digital
+
+        ``call_elapsed`` é o tempo acumulado da execução até aqui (para o máximo).
+        """
+        with self._lock:
+            entry = self._entry(key)
+            if new_call:
+                entry['calls'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], call_elapsed)
+            entry['rows'] += rows
+            entry['vm_steps'] += steps
+            if plan is not None and entry['plan'] is None:
+                entry['plan'] = plan
+
+    def record_slow(self, key: str, sql: str, elapsed: float, plan: Optional[List[str]]):
+        """Registra e imprime uma execução acima do limite"""
+        with self._lock:
+            entry = self._entry(key)
+            entry['slow'] += 1
+            plan = plan or entry['plan']
+            self._slow.append({'fingerprint': key, 'ms': round(elapsed * 1000, 2),
+                               'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'plan': plan})
+        print(f"SQL LENTO ({elapsed * 1000:.1f} ms): {_SPACE.sub(' ', sql).strip()}")
+        for line in plan or []:
+            print(f"    {line}")
+
+    def reset(self):
+        """Zera as estatísticas e o log de lentas"""
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+    def summary(self, order: str = 'total', limit: int = 50) -> Dict[str, Any]:
+        """Consultas ordenadas por ``total``, ``max``, ``calls`` ou ``vm_steps``"""
+        with self._lock:
+            rows = []
+            for key, entry in self._stats.items():
+                plan = entry['plan'] or []
+                rows.append({
+                    'fingerprint': key,
+                    'calls': entry['calls'],
+                    'total_ms': round(entry['total'] * 1000, 2),
+                    'avg_ms': round(entry['total'] * 1000 / entry['calls'], 3) if entry['calls'] else 0,
+                    'max_ms': round(entry['max'] * 1000, 2),
+                    'rows': entry['rows'],
+                    'vm_steps': entry['vm_steps'],
+                    'slow': entry['slow'],
+                    'plan': entry['plan'],
+                    **_plan_flags(plan),
+                })
+            slow = list(self._slow)
+
+        sort_key = {'total': 'total_ms', 'max': 'max_ms', 'calls': 'calls', 'vm_steps': 'vm_steps'}[order]
+        rows.sort(key=lambda row: row[sort_key], reverse=True)
+        return {
+            'pid': os.getpid(),
+            'slow_threshold_ms': self.slow_threshold * 1000,
+            'statements': len(rows),
+            'full_scans': [row['fingerprint'] for row in rows if row['full_scan']],
+            'queries': rows[:limit],
+            'recent_slow': slow[::-1],
+        }
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Cursor que cronometra a execução e as leituras da consulta atual"""
+
+    _key: Optional[str] = None
+
+    def _begin(self, sql: str, params: Any, many: bool):
+        conn = self.connection
+        self._key = key = fingerprint(sql)
+        self._sql = sql
+        self._elapsed = 0.0
+        self._reported = False
+        self._plan = None
+        if not many and sql.lstrip()[:7].upper().startswith(_PLANNED) and conn.profiler.needs_plan(key):
+            self._plan = conn.explain(sql, params)
+        conn.steps = 0
+        return time.perf_counter()
+
+    def _end(self, started: float, rows: int = 0, new_call: bool = False):
+        """Soma a etapa ao perfil e reporta a execução quando passa do limite"""
+        elapsed = time.perf_counter() - started
+        conn = self.connection
+        profiler = conn.profiler
+        self._elapsed += elapsed
+        profiler.record(self._key, elapsed, self._elapsed, conn.steps, rows, new_call, self._plan)
+        conn.steps = 0
+        if self._elapsed >= profiler.slow_threshold and not self._reported:
+            self._reported = True
+            profiler.record_slow(self._key, self._sql, self._elapsed, self._plan)
+
+    def execute(self, sql, parameters=()):
+        started = self._begin(sql, parameters, False)
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            # Linhas alteradas por INSERT/UPDATE/DELETE; as lidas contam no fetch
+            self._end(started, max(self.rowcount, 0) if self.description is None else 0, True)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = self._begin(sql, None, True)
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._end(started, max(self.rowcount, 0), True)
+
+    def fetchone(self):
+        if self._key is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._end(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        if self._key is None:
+            return super().fetchmany(size or self.arraysize)
+        started = time.perf_counter()
+        rows = super().fetchmany(size or self.arraysize)
+        self._end(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        if self._key is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._end(started, len(rows))
+        return rows
+
+    def __next__(self):
+        if self._key is None:
+            return super().__next__()
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._end(started)
+            raise
+        self._end(started, 1)
+        return row
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os de ``conn.execute``) são perfilados"""
+
+    profiler: SqlProfiler = None
+    steps = 0
+
+    def count_steps(self):
+        self.steps += PROGRESS_STEPS
+        return 0
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def explain(self, sql: str, params: Any) -> Optional[List[str]]:
+        """``EXPLAIN QUERY PLAN`` da consulta, sem passar pelo perfil"""
+        cursor = super().cursor()
+        cursor.row_factory = None
+        try:
+            rows = sqlite3.Cursor.execute(cursor, f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        except sqlite3.Error:
+            return None
+        finally:
+            cursor.close()
+        # Cada linha: (id, pai, _, detalhe); a hierarquia vira recuo
+        depth = {0: -1}
+        plan = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            plan.append('  ' * depth[node_id] + detail)
+        return plan
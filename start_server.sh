@@ -29,6 +29,7 @@ echo "Para acessar, use o IP desta máquina na rede local"
 echo "Exemplo: http://192.168.15.7:5000"
 echo ""
 echo "Pressione Ctrl+C para parar o servidor"
+echo "(kill -HUP no processo mestre recarrega sem derrubar conexões)"
 echo ""
 
-python3 Server.py
+python3 serve.py
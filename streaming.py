@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Respostas JSON em streaming para exportações completas das listagens
+
+Em vez de materializar todas as linhas e o corpo JSON inteiro em memória,
+o gerador lê a listagem em páginas (keyset, como ``pagination``) e emite
+os elementos do array em blocos. O consumo de memória fica constante e o
+primeiro byte chega ao cliente antes de a consulta terminar.
+
+Cada página empresta e devolve uma conexão do pool, então um cliente
+lento (Wi-Fi do pátio) não segura uma conexão durante o download inteiro.
+"""
+
+from typing import Iterator
+from flask import Response
+from config import ServerConfig
+from pagination import decode_cursor, fetch_page
+from serializers import RowSchema, dumps
+
+
+def is_stream_requested(args) -> bool:
+    """Indica se o cliente pediu a resposta em streaming (``?stream=1``)"""
+    return args.get('stream', '').lower() in ('1', 'true', 'sim')
+
+
+def iter_json_array(db_manager, schema: RowSchema, ts_column: str, id_column: str,
+                    where: str = '', params: tuple = (),
+                    prefix: str = '[', suffix: str = ']') -> Iterator[bytes]:
+    """Gera o JSON ``prefix + [linhas...] + suffix`` em blocos
+    
+    As linhas de ``schema`` saem ordenadas por (``ts_column`` DESC,
+    ``id_column`` DESC). A conexão só fica emprestada durante a leitura de
+    cada página, nunca enquanto o bloco é enviado ao cliente.
+    """
+    page_rows = ServerConfig.get_stream_chunk_rows()
+    select_sql = schema.select()
+    
+    yield prefix.encode('utf-8')
+    
+    position = None
+    first = True
+    while True:
+        with db_manager.get_connection() as conn:
+            rows, next_cursor = fetch_page(conn, select_sql, ts_column, id_column,
+                                           (page_rows, position), where, params)
+        if rows:
+            # Cada bloco é codificado de uma vez como array e só os
+            # colchetes externos são removidos
+            chunk = dumps(schema.to_dicts(rows))[1:-1]
+            yield chunk if first else b',' + chunk
+            first = False
+        if next_cursor is None:
+            break
+        position = decode_cursor(next_cursor)
+    
+    yield suffix.encode('utf-8')
+
+
+def stream_json_array(db_manager, schema: RowSchema, ts_column: str, id_column: str,
+                      where: str = '', params: tuple = (),
+                      prefix: str = '[', suffix: str = ']') -> Response:
+    """Monta a ``Response`` em streaming para uma listagem completa"""
+    body = iter_json_array(db_manager, schema, ts_column, id_column, where, params, prefix, suffix)
+    return Response(body, mimetype='application/json')
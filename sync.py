@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sincronização incremental para clientes offline (``GET /app/sync``)
+
+Toda escrita em ``chapas`` e ``retalhos`` registra, por trigger e na
+mesma transação, uma linha em ``alteracoes`` com um número de sequência
+crescente (ver migração 8). O cliente guarda o maior ``seq`` já recebido
+(``highWaterMark``) e pede apenas o que mudou depois dele: registros
+incluídos/alterados vêm completos e exclusões vêm como tombstones (só o ID).
+
+A compactação remove entradas substituídas por outra mais nova do mesmo
+registro (sem efeito para nenhum cliente) e tombstones antigos. Remover
+um tombstone eleva o "piso" do log; clientes abaixo do piso recebem
+``resync: true`` e precisam baixar as listas completas de novo.
+"""
+
+from typing import Any, Dict
+from config import ServerConfig
+from database import SQLITE_IN_CHUNK
+from serializers import CHAPA_APP, RETALHO_APP, fetch_tuples
+
+# Tabela -> (formato de saída, coluna que identifica o registro no app)
+_TABLES = {
+    'chapas': (CHAPA_APP, 'id_chapa'),
+    'retalhos': (RETALHO_APP, 'id_chapa_original'),
+}
+
+
+def get_changes(db_manager, since: int, limit: int = None) -> Dict[str, Any]:
+    """Retorna as alterações com ``seq`` maior que ``since``
+
+    Resposta: ``upserts`` e ``deletes`` por tabela, ``highWaterMark`` (o
+    ``since`` da próxima chamada), ``hasMore`` quando há mais páginas e
+    ``resync`` quando o cliente precisa de uma carga completa.
+    """
+    limit = limit or ServerConfig.get_sync_max_changes()
+    upserts = {table: [] for table in _TABLES}
+    deletes = {table: [] for table in _TABLES}
+
+    with db_manager.get_connection() as conn:
+        # Log e registros lidos do mesmo snapshot
+        conn.execute('BEGIN')
+        try:
+            floor = conn.execute("SELECT valor FROM alteracoes_estado WHERE chave = 'piso'").fetchone()[0]
+            head = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM alteracoes').fetchone()[0]
+            if since < floor or since > head:
+                return {'upserts': upserts, 'deletes': deletes, 'highWaterMark': head,
+                        'hasMore': False, 'resync': True}
+
+            entries = conn.execute('''
+                SELECT seq, tabela, id_registro, operacao FROM alteracoes
+                WHERE seq > ?
+                ORDER BY seq
+                LIMIT ?
+            ''', (since, limit + 1)).fetchall()
+            has_more = len(entries) > limit
+            entries = entries[:limit]
+
+            # Só a última operação de cada registro importa
+            latest = {}
+            for _, table, record_id, operation in entries:
+                latest[(table, record_id)] = operation
+
+            wanted = {table: [] for table in _TABLES}
+            for (table, record_id), operation in latest.items():
+                if table not in _TABLES:
+                    continue
+                if operation == 'delete':
+                    deletes[table].append(record_id)
+                else:
+                    wanted[table].append(record_id)
+
+            for table, ids in wanted.items():
+                schema, key = _TABLES[table]
+                found = set()
+                for start in range(0, len(ids), SQLITE_IN_CHUNK):
+                    chunk = ids[start:start + SQLITE_IN_CHUNK]
+                    placeholders = ', '.join('?' for _ in chunk)
+                    rows = schema.to_dicts(fetch_tuples(conn, schema.select(where=f'{key} IN ({placeholders})'), chunk))
+                    upserts[table].extend(rows)
+                    found.update(row['id'] for row in rows)
+                # Registro apagado depois desta página: já vai como exclusão
+                deletes[table].extend(record_id for record_id in ids if record_id not in found)
+        finally:
+            conn.rollback()
+
+    return {
+        'upserts': upserts,
+        'deletes': deletes,
+        'highWaterMark': entries[-1][0] if has_more else head,
+        'hasMore': has_more,
+        'resync': False,
+    }
+
+
+def compact_change_log(db_manager, tombstone_days: int = None) -> Dict[str, int]:
+    """Compacta o log de alterações
+
+    Mantém apenas a entrada mais recente de cada registro e descarta
+    tombstones com mais de ``tombstone_days`` dias, elevando o piso. A
+    última linha do log nunca é removida: ``MAX(seq)`` é o ``highWaterMark``
+    dos clientes em dia e não pode recuar.
+    """
+    if tombstone_days is None:
+        tombstone_days = ServerConfig.get_sync_tombstone_days()
+
+    def op(conn):
+        superseded = conn.execute('''
+            DELETE FROM alteracoes
+            WHERE seq NOT IN (SELECT MAX(seq) FROM alteracoes GROUP BY tabela, id_registro)
+        ''').rowcount
+
+        newest_old = conn.execute('''
+            SELECT MAX(seq) FROM alteracoes
+            WHERE operacao = 'delete' AND data_alteracao < datetime('now', ?)
+        ''', (f'-{int(tombstone_days)} days',)).fetchone()[0]
+        tombstones = 0
+        if newest_old is not None:
+            tombstones = conn.execute('''
+                DELETE FROM alteracoes
+                WHERE operacao = 'delete' AND seq <= ? AND seq < (SELECT MAX(seq) FROM alteracoes)
+            ''', (newest_old,)).rowcount
+            conn.execute("UPDATE alteracoes_estado SET valor = MAX(valor, ?) WHERE chave = 'piso'",
+                         (newest_old,))
+
+        floor = conn.execute("SELECT valor FROM alteracoes_estado WHERE chave = 'piso'").fetchone()[0]
+        return {'substituidas': superseded, 'tombstones': tombstones, 'piso': floor}
+
+    return db_manager.write(op)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fixtures compartilhadas: banco temporário com todas as migrações aplicadas
+"""
+
+import pytest
+from database import DatabaseManager
+
+
+@pytest.fixture
+def db_manager(tmp_path, monkeypatch):
+    monkeypatch.setenv('QUALICAM_DB_PATH', str(tmp_path / 'qualicam.db'))
+    manager = DatabaseManager()
+    yield manager
+    manager.writer.stop()
+    manager.pool.close_all()
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    """Módulo ``Server`` importado com um banco descartável"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('QUALICAM_DB_PATH', str(tmp_path_factory.mktemp('server') / 'qualicam.db'))
+        import Server
+    return Server
+
+
+@pytest.fixture
+def client(server, db_manager, monkeypatch):
+    """Cliente de teste do Flask; as rotas usam o banco de ``db_manager``"""
+    monkeypatch.setattr(server, 'db_manager', db_manager)
+    return server.app.test_client()
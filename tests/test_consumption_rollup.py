@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes do consumo diário: o trigger incremental e o recálculo completo
+precisam chegar ao mesmo resultado, sem apagar meses já arquivados
+"""
+
+import pytest
+from archive import archive_closed_months, first_unarchived_month
+
+
+def _add_slab(db_manager, id_chapa, material, fornecedor):
+    db_manager.add_slab({'id_chapa': id_chapa, 'nome_material': material, 'fornecedor': fornecedor,
+                         'preco_compra_m2': 100.0, 'area_liquida_inicial': 5.0, 'localizacao': 'P'})
+
+
+def _add_movements(db_manager, rows):
+    db_manager.write(lambda conn: conn.executemany('''
+        INSERT INTO movimentacoes (id_chapa, tipo_movimentacao, quantidade_m2, data_movimentacao)
+        VALUES (?, ?, ?, ?)
+    ''', rows))
+
+
+def _rollup(db_manager):
+    with db_manager.get_connection() as conn:
+        return {tuple(row[:4]): (row[4], row[5]) for row in conn.execute('''
+            SELECT dia, nome_material, fornecedor, tipo_movimentacao, quantidade_m2, movimentacoes
+            FROM consumo_diario
+        ''')}
+
+
+def _assert_same(actual, expected):
+    assert sorted(actual) == sorted(expected)
+    for key, (area, count) in expected.items():
+        assert actual[key] == (pytest.approx(area), count)
+
+
+@pytest.fixture
+def history(db_manager):
+    _add_slab(db_manager, 1, 'Branco', 'F1')
+    _add_slab(db_manager, 2, 'Preto', 'F2')
+    _add_movements(db_manager, [
+        (1, 'SAÍDA', 0.5, '2024-01-15 10:00:00'),
+        (1, 'SAÍDA', 0.25, '2024-01-15 16:30:00'),
+        (2, 'SAÍDA', 1.0, '2024-01-31 23:59:59'),
+        (2, 'SAÍDA', 0.75, '2024-02-01 00:00:00'),
+        (1, 'AJUSTE', 0.1, '2024-02-10 08:00:00'),
+        (99, 'SAÍDA', 2.0, '2024-02-11 09:00:00'),  # chapa desconhecida
+    ])
+    # Retalho: a movimentação da chapa original continua no mesmo material
+    db_manager.write(lambda conn: conn.execute('''
+        INSERT INTO retalhos (id_chapa_original, nome_material, fornecedor, area_retalho, localizacao)
+        VALUES (3, 'Verde', 'F3', 1.0, 'P')
+    '''))
+    _add_movements(db_manager, [(3, 'TRANSFORMAR_RETALHO', 1.0, '2024-02-12 12:00:00')])
+    return db_manager
+
+
+def test_incremental_rollup_matches_full_rebuild(history):
+    incremental = _rollup(history)
+    assert incremental[('2024-01-15', 'Branco', 'F1', 'SAÍDA')] == (pytest.approx(0.75), 2)
+    assert incremental[('2024-02-11', 'Desconhecido', 'Desconhecido', 'SAÍDA')] == (2.0, 1)
+    assert incremental[('2024-02-12', 'Verde', 'F3', 'TRANSFORMAR_RETALHO')] == (1.0, 1)
+
+    assert history.rebuild_consumption_rollup() == '2024-01-15'
+    _assert_same(_rollup(history), incremental)
+
+    # Recálculo parcial só refaz os dias a partir de ``since``
+    assert history.rebuild_consumption_rollup('2024-02-01') == '2024-02-01'
+    _assert_same(_rollup(history), incremental)
+
+
+def test_rebuild_never_goes_before_archived_months(history):
+    before = _rollup(history)
+    archived = archive_closed_months(history, keep_months=1)
+    assert [month['mes'] for month in archived] == ['2024-01', '2024-02']
+    assert first_unarchived_month() == '2024-03-01'
+
+    # As movimentações de 2024 saíram da tabela; o consumo delas fica
+    assert history.rebuild_consumption_rollup('2000-01-01') == '2024-03-01'
+    _assert_same(_rollup(history), before)
+    assert history.rebuild_consumption_rollup() == '2024-03-01'
+    _assert_same(_rollup(history), before)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes da confirmação do plano de corte: a sobra de um retalho é
+recalculada no servidor a partir das medidas gravadas
+"""
+
+import pytest
+import cut_planner
+from remnants import find_fitting_remnants
+from write_queue import WriteRejected
+
+
+def _add_remnant(db_manager, area, largura=None, comprimento=None):
+    def op(conn):
+        return conn.execute('''
+            INSERT INTO retalhos (id_chapa_original, nome_material, fornecedor, area_retalho,
+                                  largura, comprimento, localizacao)
+            VALUES (1, 'Branco', 'F', ?, ?, ?, 'P')
+        ''', (area, largura, comprimento)).lastrowid
+    return db_manager.write(op)
+
+
+def _remnant(db_manager, id_retalho):
+    with db_manager.get_connection() as conn:
+        row = conn.execute('SELECT area_retalho, largura, comprimento FROM retalhos WHERE id_retalho = ?',
+                           (id_retalho,)).fetchone()
+    return tuple(row) if row else None
+
+
+def _plan(id_retalho, pieces, **allocation):
+    return {'material': 'Branco', 'alocacoes': [{
+        'tipo': cut_planner.RETALHO, 'id': id_retalho,
+        'pecas': [{'largura': w, 'comprimento': h} for w, h in pieces], **allocation}]}
+
+
+def test_leftover_comes_from_stored_dimensions(db_manager):
+    id_retalho = _add_remnant(db_manager, 1.0, 1.0, 1.0)
+    # Sobra inventada pelo cliente é ignorada
+    cut_planner.commit_plan(db_manager, _plan(id_retalho, [(0.4, 1.0)],
+                                              sobra={'largura': 5.0, 'comprimento': 5.0}))
+
+    area, largura, comprimento = _remnant(db_manager, id_retalho)
+    assert sorted((largura, comprimento)) == pytest.approx([0.6, 1.0])
+    assert area == pytest.approx(largura * comprimento)
+
+
+def test_missing_leftover_keeps_dimensions(db_manager):
+    id_retalho = _add_remnant(db_manager, 1.0, 1.0, 1.0)
+    cut_planner.commit_plan(db_manager, _plan(id_retalho, [(0.5, 0.5)]))
+
+    area, largura, comprimento = _remnant(db_manager, id_retalho)
+    assert largura is not None and comprimento is not None
+    assert area == pytest.approx(largura * comprimento)
+    # Continua encontrável pela busca por medidas
+    assert [row['id_retalho'] for row in find_fitting_remnants(db_manager, 'Branco', 0, 0.5, 0.5)] == [id_retalho]
+
+
+def test_pieces_that_do_not_fit_are_rejected(db_manager):
+    # Área suficiente, mas a peça é mais comprida que o retalho
+    id_retalho = _add_remnant(db_manager, 1.0, 0.5, 2.0)
+    with pytest.raises(WriteRejected) as error:
+        cut_planner.commit_plan(db_manager, _plan(id_retalho, [(0.3, 2.5)]))
+    assert error.value.status == 409
+    assert _remnant(db_manager, id_retalho) == (1.0, 0.5, 2.0)
+
+
+def test_remnant_without_dimensions_is_allocated_by_area(db_manager):
+    id_retalho = _add_remnant(db_manager, 1.0)
+    cut_planner.commit_plan(db_manager, _plan(id_retalho, [(0.5, 1.0)], sobra={'largura': 3, 'comprimento': 3}))
+    assert _remnant(db_manager, id_retalho) == (pytest.approx(0.5), None, None)
+
+
+def test_remnant_changes_are_published(db_manager):
+    kept = _add_remnant(db_manager, 1.0, 1.0, 1.0)
+    used_up = _add_remnant(db_manager, 0.25, 0.5, 0.5)
+    plan = _plan(kept, [(0.4, 1.0)])
+    plan['alocacoes'] += _plan(used_up, [(0.5, 0.5)])['alocacoes']
+    cut_planner.commit_plan(db_manager, plan)
+
+    with db_manager.get_connection() as conn:
+        rows = conn.execute('SELECT tipo, id_chapa FROM eventos ORDER BY id_evento').fetchall()
+    assert [tuple(row) for row in rows] == [('retalho_atualizado', 1), ('retalho_removido', 1)]
+    assert _remnant(db_manager, used_up) is None
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes do feed SSE: limite de clientes por processo
+"""
+
+import threading
+import pytest
+from events import EventBroker
+
+
+@pytest.fixture
+def broker(db_manager):
+    broker = EventBroker(db_manager, max_clients=2)
+    yield broker
+    broker.stop()
+
+
+def test_concurrent_acquire_respects_limit(broker):
+    barrier = threading.Barrier(8)
+    results = []
+
+    def connect():
+        barrier.wait()
+        results.append(broker.try_acquire())
+
+    threads = [threading.Thread(target=connect) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 2
+    assert broker.clients == 2
+
+
+def test_closed_stream_releases_slot(broker):
+    assert broker.try_acquire()
+    assert broker.try_acquire()
+    assert not broker.try_acquire()
+
+    stream = broker.stream()
+    assert next(stream).startswith('retry:')
+    stream.close()
+
+    assert broker.clients == 1
+    assert broker.try_acquire()
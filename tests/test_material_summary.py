@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes do resumo por material mantido pelos triggers de ``chapas``
+"""
+
+import pytest
+from migrations import rebuild_material_summary
+
+
+def _slab(id_chapa, material, area, preco):
+    return {'id_chapa': id_chapa, 'nome_material': material, 'fornecedor': 'F', 'preco_compra_m2': preco,
+            'area_liquida_inicial': area, 'localizacao': 'P'}
+
+
+def _rebuilt(db_manager):
+    """Resumo recalculado do zero, sem alterar o banco"""
+    with db_manager.get_connection() as conn:
+        conn.execute('BEGIN')
+        try:
+            rebuild_material_summary(conn)
+            return [tuple(row) for row in conn.execute('''
+                SELECT nome_material, area_total_inicial, area_total_disponivel, quantidade_chapas,
+                       soma_preco_m2 / quantidade_chapas
+                FROM material_summary ORDER BY nome_material
+            ''')]
+        finally:
+            conn.rollback()
+
+
+def _summary(db_manager):
+    return [(m['nome_material'], m['area_total_inicial'], m['area_total_disponivel'], m['quantidade_chapas'],
+             m['preco_medio_m2']) for m in db_manager.get_material_summary()]
+
+
+def _assert_consistent(db_manager):
+    summary, rebuilt = _summary(db_manager), _rebuilt(db_manager)
+    assert [row[0] for row in summary] == [row[0] for row in rebuilt]
+    for actual, expected in zip(summary, rebuilt):
+        assert actual[1:] == pytest.approx(expected[1:])
+    assert db_manager.verify_material_summary() == []
+
+
+def test_triggers_follow_insert_update_and_delete(db_manager):
+    for slab in (_slab(1, 'Branco', 3.0, 100.0), _slab(2, 'Branco', 2.0, 120.0), _slab(3, 'Preto', 4.0, 200.0)):
+        db_manager.add_slab(slab)
+    _assert_consistent(db_manager)
+    assert [row[0] for row in _summary(db_manager)] == ['Branco', 'Preto']
+
+    def update(sql, *params):
+        db_manager.write(lambda conn: conn.execute(sql, params))
+        _assert_consistent(db_manager)
+
+    # Área disponível, área inicial e preço
+    update('UPDATE chapas SET area_disponivel = 1.25 WHERE id_chapa = 1')
+    update('UPDATE chapas SET area_liquida_inicial = 5.0, preco_compra_m2 = 90.0 WHERE id_chapa = 3')
+    # Troca de material: sai de um resumo e entra (ou cria) outro
+    update("UPDATE chapas SET nome_material = 'Verde' WHERE id_chapa = 2")
+    update("UPDATE chapas SET nome_material = 'Preto', area_disponivel = 0.5 WHERE id_chapa = 1")
+    assert [row[0] for row in _summary(db_manager)] == ['Preto', 'Verde']
+
+    # Exclusão da última chapa remove a linha do material
+    update('DELETE FROM chapas WHERE id_chapa = 2')
+    assert [row[0] for row in _summary(db_manager)] == ['Preto']
+    update('DELETE FROM chapas')
+    assert _summary(db_manager) == []
+
+
+def test_bulk_insert_keeps_summary(db_manager):
+    db_manager.add_slabs_bulk([_slab(10 + i, 'Branco' if i % 2 else 'Preto', 1.0 + i, 50.0 + i) for i in range(20)])
+    _assert_consistent(db_manager)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes da fila de impressão: gabarito em lote, envio RAW por TCP e
+retomada de etiquetas cujo prazo (lease) expirou
+"""
+
+import socket
+import threading
+import time
+import pytest
+from labels import ZplTemplate
+from print_queue import CONCLUIDO, IMPRESSO, IMPRIMINDO, PrintQueue, RawTcpSink
+
+TEMPLATE = '^XA^FO50,50^FD${id}^FS^FO50,100^FD${material}^FS^PQ9^XZ'
+
+
+class _Printer:
+    """Impressora falsa: aceita conexões na porta RAW e guarda cada trabalho"""
+
+    def __init__(self):
+        self.jobs = []
+        self._received = threading.Condition()
+        self._server = socket.create_server(('127.0.0.1', 0))
+        self.port = self._server.getsockname()[1]
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with conn:
+                chunks = []
+                while True:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    chunks.append(data)
+            with self._received:
+                self.jobs.append(b''.join(chunks))
+                self._received.notify_all()
+
+    def wait_jobs(self, count: int, timeout: float = 5.0):
+        """Espera a impressora terminar de receber ``count`` trabalhos"""
+        with self._received:
+            assert self._received.wait_for(lambda: len(self.jobs) >= count, timeout)
+        return self.jobs
+
+    def close(self):
+        self._server.close()
+
+
+@pytest.fixture
+def printer():
+    printer = _Printer()
+    yield printer
+    printer.close()
+
+
+@pytest.fixture
+def make_queue(db_manager, printer, tmp_path):
+    template = tmp_path / 'gabarito.zpl'
+    template.write_text(TEMPLATE)
+    queues = []
+
+    def make(**options):
+        queue = PrintQueue(db_manager, sink=RawTcpSink('127.0.0.1', printer.port, timeout=5),
+                           template_path=str(template), workers=1, **options)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop()
+
+
+def _wait_job(queue, job_id, status, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get_job(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} ficou em {job["status"]}, esperado {status}')
+
+
+def test_render_batch_copies_and_ids():
+    zpl = ZplTemplate(TEMPLATE).render_batch([
+        {'id': 101, 'material': 'Branco', 'copias': 3},
+        {'id': 102, 'material': 'Preto', 'copias': 1},
+    ])
+
+    labels = [label + '^XZ' for label in zpl.split('^XZ') if label]
+    assert labels == [
+        '^XA^FO50,50^FD101^FS^FO50,100^FDBranco^FS^PQ3^XZ',
+        '^XA^FO50,50^FD102^FS^FO50,100^FDPreto^FS^PQ1^XZ',
+    ]
+    # O ^PQ do gabarito é substituído, não repetido
+    assert '^PQ9' not in zpl
+
+
+def test_legacy_id_placeholder():
+    zpl = ZplTemplate('^XA^FD12345^FS^XZ').render(copies=2, id=777)
+    assert zpl == '^XA^FD777^FS^PQ2^XZ'
+
+
+def test_job_is_sent_over_raw_tcp(make_queue, printer):
+    queue = make_queue()
+    job_id, label_ids = queue.enqueue_new_labels(3, 2)
+
+    job = _wait_job(queue, job_id, CONCLUIDO)
+
+    assert job['ids_gerados'] == label_ids
+    assert job['total_solicitado'] == job['total_impresso'] == 6
+    assert all(item['status'] == IMPRESSO and item['tentativas'] == 1 for item in job['itens'])
+    # Um único trabalho de spool com as três etiquetas, duas cópias cada
+    assert len(printer.wait_jobs(1)) == 1
+    expected = ''.join(f'^XA^FO50,50^FD{label_id}^FS^FO50,100^FD^FS^PQ2^XZ' for label_id in label_ids)
+    assert printer.jobs[0] == expected.encode('utf-8')
+
+
+def test_expired_lease_is_claimed_again(make_queue, db_manager, printer):
+    # Sem threads: o teste faz o papel de dois workers
+    queue = make_queue(lease=0.2)
+    job_id = db_manager.write(PrintQueue._insert_job, [501, 502], 1)
+
+    # O primeiro worker pega as etiquetas e morre sem concluir
+    claimed = queue._claim()
+    assert [item['id_etiqueta'] for item in claimed] == [501, 502]
+    assert all(item['status'] == IMPRIMINDO for item in queue.get_job(job_id)['itens'])
+
+    # Dentro do prazo ninguém mais as pega
+    assert queue._claim() == []
+
+    time.sleep(0.3)
+    retried = queue._claim()
+    assert [item['id_item'] for item in retried] == [item['id_item'] for item in claimed]
+    assert all(item['tentativas'] == 2 for item in retried)
+
+    queue._process(retried)
+    job = queue.get_job(job_id)
+    assert job['status'] == CONCLUIDO
+    assert [(item['status'], item['tentativas']) for item in job['itens']] == [(IMPRESSO, 2), (IMPRESSO, 2)]
+    assert len(printer.wait_jobs(1)) == 1
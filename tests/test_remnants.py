@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes da busca de retalhos por material, área e medidas
+"""
+
+from remnants import _match_query, find_fitting_remnants
+
+
+def _seed(db_manager, rows):
+    def op(conn):
+        conn.executemany('''
+            INSERT INTO retalhos (id_chapa_original, nome_material, fornecedor, area_retalho,
+                                  largura, comprimento, localizacao)
+            VALUES (1, ?, 'F', ?, ?, ?, 'P')
+        ''', [(material, area, largura, comprimento) for material, area, largura, comprimento in rows])
+    db_manager.write(op)
+
+
+def _ids(rows):
+    return [row['id_retalho'] for row in rows]
+
+
+def test_smallest_fitting_remnants_of_the_material(db_manager):
+    _seed(db_manager, [
+        ('Branco', 1.5, 1.0, 1.5),    # 1
+        ('Branco', 0.5, 0.5, 1.0),    # 2
+        ('Branco', 0.4, None, None),  # 3: sem medidas
+        ('Preto', 0.6, 0.6, 1.0),     # 4: outro material
+        ('Branco', 0.6, 0.2, 3.0),    # 5: área suficiente, lado curto demais
+        ('Branco', 0.7, 1.0, 0.7),    # 6
+    ])
+
+    assert _ids(find_fitting_remnants(db_manager, 'Branco', 0.45)) == [2, 5, 6, 1]
+    # Peça girada: 0.9 x 0.5 cabe em 0.5 x 1.0
+    assert _ids(find_fitting_remnants(db_manager, 'Branco', 0, 0.9, 0.5)) == [2, 6, 1]
+    assert _ids(find_fitting_remnants(db_manager, 'Branco', 0, 0.9, 0.5, limit=2)) == [2, 6]
+    assert _ids(find_fitting_remnants(db_manager, 'Branco', 0, 1.1, 1.1)) == []
+    assert _ids(find_fitting_remnants(db_manager, 'Preto', 0, 0.5, 0.5)) == [4]
+
+
+def test_match_walks_the_material_area_index(db_manager):
+    query, params = _match_query('Branco', 0, 0.5, 2.0, 10)
+    with db_manager.get_connection() as conn:
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+    # Uma única busca no índice, sem ordenação temporária
+    assert len(plan) == 1 and 'idx_retalhos_material_area (nome_material=? AND area_retalho>?)' in plan[0]
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes da busca textual: reindexação pelos triggers do FTS5 e busca por
+prefixo sem acentos
+"""
+
+import pytest
+from pagination import decode_cursor
+from search import build_match_query, parse_position, search
+
+
+def _add_slab(db_manager, id_chapa, material, fornecedor='Pedreira Ávila', localizacao='Pátio 1'):
+    db_manager.add_slab({'id_chapa': id_chapa, 'nome_material': material, 'fornecedor': fornecedor,
+                         'preco_compra_m2': 100.0, 'area_liquida_inicial': 2.0, 'localizacao': localizacao})
+
+
+def _execute(db_manager, sql, *params):
+    db_manager.write(lambda conn: conn.execute(sql, params))
+
+
+def _found(db_manager, text):
+    results, _ = search(db_manager, text, 50)
+    return sorted((item['tipo'], item['id']) for item in results)
+
+
+def _assert_index_matches_tables(db_manager):
+    # Com rank = 1 o FTS5 confere o índice contra a tabela de conteúdo externo
+    with db_manager.get_connection() as conn:
+        for fts in ('chapas_fts', 'retalhos_fts'):
+            conn.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('integrity-check', 1)")
+
+
+def test_triggers_reindex_insert_update_and_delete(db_manager):
+    _add_slab(db_manager, 1, 'Granito São Gabriel')
+    _add_slab(db_manager, 2, 'Mármore Carrara', fornecedor='Importadora Sul', localizacao='Galpão B')
+    _assert_index_matches_tables(db_manager)
+    assert _found(db_manager, 'gabriel') == [('chapa', 1)]
+
+    _execute(db_manager, "UPDATE chapas SET nome_material = 'Quartzito Azul' WHERE id_chapa = 1")
+    _assert_index_matches_tables(db_manager)
+    assert _found(db_manager, 'gabriel') == []
+    assert _found(db_manager, 'quartz') == [('chapa', 1)]
+
+    # Coluna fora do índice não reindexa, mas o registro continua encontrável
+    _execute(db_manager, 'UPDATE chapas SET area_disponivel = 1.0 WHERE id_chapa = 1')
+    _execute(db_manager, "UPDATE chapas SET localizacao = 'Galpão C' WHERE id_chapa = 1")
+    _assert_index_matches_tables(db_manager)
+    assert _found(db_manager, 'galpao') == [('chapa', 1), ('chapa', 2)]
+
+    _execute(db_manager, 'DELETE FROM chapas WHERE id_chapa = 2')
+    _assert_index_matches_tables(db_manager)
+    assert _found(db_manager, 'carrara') == []
+    assert _found(db_manager, 'galpao') == [('chapa', 1)]
+
+
+def test_remnants_are_indexed(db_manager):
+    _execute(db_manager, '''
+        INSERT INTO retalhos (id_chapa_original, nome_material, fornecedor, area_retalho, localizacao)
+        VALUES (7, 'Granito Preto Absoluto', 'Pedreira Ávila', 0.8, 'Pátio 3')
+    ''')
+    _add_slab(db_manager, 8, 'Granito Branco')
+    _assert_index_matches_tables(db_manager)
+    # O app identifica o retalho pela chapa original
+    assert _found(db_manager, 'granito') == [('chapa', 8), ('retalho', 7)]
+    assert _found(db_manager, 'absol') == [('retalho', 7)]
+
+    _execute(db_manager, 'DELETE FROM retalhos')
+    _assert_index_matches_tables(db_manager)
+    assert _found(db_manager, 'absol') == []
+
+
+def test_prefix_search_ignores_accents_and_case(db_manager):
+    _add_slab(db_manager, 1, 'Granito São Gabriel')
+    for text in ('sao', 'SÃO', 'gab', 'avil', 'ÁVILA', 'patio 1', 'pát', 'sao gab'):
+        assert _found(db_manager, text) == [('chapa', 1)], text
+    # Todas as palavras precisam aparecer
+    assert _found(db_manager, 'sao marmore') == []
+    # Sintaxe do FTS5 digitada pelo usuário vira texto comum
+    assert build_match_query('granito OR "x" -y') == '"granito"* "OR"* "x"* "y"*'
+    with pytest.raises(ValueError):
+        build_match_query('-- "')
+
+
+def test_cursor_pages_through_all_results(db_manager):
+    for id_chapa in range(1, 8):
+        _add_slab(db_manager, id_chapa, f'Granito {id_chapa}')
+    seen, position = [], None
+    while True:
+        results, cursor = search(db_manager, 'granito', 3, position)
+        seen.extend(item['id'] for item in results)
+        if cursor is None:
+            break
+        position = parse_position(decode_cursor(cursor))
+    assert sorted(seen) == list(range(1, 8)) and len(seen) == 7
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes da sincronização incremental (``/app/sync``): log de alterações,
+tombstones, páginas e compactação
+"""
+
+from config import ServerConfig
+from sync import compact_change_log
+
+
+def _add_slab(db_manager, id_chapa, material='Branco'):
+    db_manager.add_slab({'id_chapa': id_chapa, 'nome_material': material, 'fornecedor': 'F',
+                         'preco_compra_m2': 100.0, 'area_liquida_inicial': 2.0, 'localizacao': 'P'})
+
+
+def _execute(db_manager, sql, *params):
+    db_manager.write(lambda conn: conn.execute(sql, params))
+
+
+def _sync(client, since):
+    response = client.get(f'/app/sync?since={since}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _ids(changes, kind, table='chapas'):
+    return sorted(item['id'] if isinstance(item, dict) else item for item in changes[kind][table])
+
+
+def _age_log(db_manager):
+    _execute(db_manager, "UPDATE alteracoes SET data_alteracao = datetime('now', '-400 days')")
+
+
+def test_changes_since_cursor(client, db_manager):
+    _add_slab(db_manager, 1)
+    _add_slab(db_manager, 2)
+    first = _sync(client, 0)
+    assert _ids(first, 'upserts') == [1, 2] and not first['resync'] and not first['hasMore']
+
+    _execute(db_manager, 'UPDATE chapas SET area_disponivel = 1.5 WHERE id_chapa = 1')
+    _execute(db_manager, 'DELETE FROM chapas WHERE id_chapa = 2')
+    _add_slab(db_manager, 3)
+    second = _sync(client, first['highWaterMark'])
+    assert _ids(second, 'upserts') == [1, 3]
+    assert _ids(second, 'deletes') == [2]
+    assert [item['tamanho'] for item in second['upserts']['chapas'] if item['id'] == 1] == [1.5]
+
+    # Em dia: nada novo, mesmo cursor
+    third = _sync(client, second['highWaterMark'])
+    assert third['highWaterMark'] == second['highWaterMark']
+    assert _ids(third, 'upserts') == [] and _ids(third, 'deletes') == [] and not third['resync']
+
+
+def test_pages_and_rows_deleted_after_the_page(client, db_manager, monkeypatch):
+    monkeypatch.setattr(ServerConfig, 'get_sync_max_changes', staticmethod(lambda: 2))
+    for id_chapa in (1, 2, 3):
+        _add_slab(db_manager, id_chapa)
+    # A inclusão de 2 está na primeira página, mas a chapa já não existe
+    _execute(db_manager, 'DELETE FROM chapas WHERE id_chapa = 2')
+
+    page = _sync(client, 0)
+    assert page['hasMore'] and _ids(page, 'upserts') == [1] and _ids(page, 'deletes') == [2]
+    seen_upserts, seen_deletes = set(_ids(page, 'upserts')), set(_ids(page, 'deletes'))
+    while page['hasMore']:
+        page = _sync(client, page['highWaterMark'])
+        seen_upserts.update(_ids(page, 'upserts'))
+        seen_deletes.update(_ids(page, 'deletes'))
+    assert seen_upserts == {1, 3} and seen_deletes == {2}
+
+
+def test_compaction_keeps_clients_at_head_in_sync(client, db_manager):
+    _add_slab(db_manager, 1)
+    _add_slab(db_manager, 2)
+    behind = _sync(client, 0)['highWaterMark']
+    _execute(db_manager, 'DELETE FROM chapas WHERE id_chapa = 2')
+    # O último registro do log é um tombstone antigo
+    head = _sync(client, behind)['highWaterMark']
+    _age_log(db_manager)
+
+    result = compact_change_log(db_manager, tombstone_days=30)
+    assert result['tombstones'] == 0 and result['piso'] == head
+
+    current = _sync(client, head)
+    assert not current['resync'] and current['highWaterMark'] == head
+    # Quem ficou antes do tombstone removido precisa de carga completa
+    stale = _sync(client, behind)
+    assert stale['resync'] and stale['highWaterMark'] == head
+
+    # Escritas seguintes continuam a partir do mesmo cursor
+    _add_slab(db_manager, 3)
+    after = _sync(client, head)
+    assert _ids(after, 'upserts') == [3] and not after['resync']
+
+
+def test_compaction_drops_superseded_entries_and_old_tombstones(client, db_manager):
+    _add_slab(db_manager, 1)
+    _add_slab(db_manager, 2)
+    _execute(db_manager, 'UPDATE chapas SET localizacao = ? WHERE id_chapa = 1', 'Q')
+    _execute(db_manager, 'DELETE FROM chapas WHERE id_chapa = 2')
+    _add_slab(db_manager, 3)
+    _age_log(db_manager)
+
+    result = compact_change_log(db_manager, tombstone_days=30)
+    assert result['substituidas'] >= 2 and result['tombstones'] == 1
+
+    # Carga inicial após a compactação: tudo o que existe, nada removido
+    full = _sync(client, 0)
+    assert full['resync']
+    fresh = _sync(client, full['highWaterMark'])
+    assert not fresh['resync'] and _ids(fresh, 'upserts') == []
+    with db_manager.get_connection() as conn:
+        log = [tuple(row) for row in conn.execute('SELECT tabela, id_registro, operacao FROM alteracoes ORDER BY seq')]
+    assert ('chapas', 2, 'delete') not in log and len(log) == len(set((t, i) for t, i, _ in log))
+
+
+def test_cursor_beyond_head_requests_resync(client, db_manager):
+    _add_slab(db_manager, 1)
+    head = _sync(client, 0)['highWaterMark']
+    assert _sync(client, head + 10)['resync']
+    assert client.get('/app/sync?since=-1').status_code == 400
+
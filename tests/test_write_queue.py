@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes do escritor único: isolamento das escritas de um mesmo lote e
+tempo limite de quem espera uma escrita
+"""
+
+import threading
+import time
+import pytest
+from write_queue import WriteQueue
+
+
+def _create_table(conn):
+    conn.execute('CREATE TABLE teste (valor TEXT NOT NULL)')
+
+
+def _insert(conn, valor):
+    conn.execute('INSERT INTO teste (valor) VALUES (?)', (valor,))
+    return valor
+
+
+def _insert_and_fail(conn, valor):
+    conn.execute('INSERT INTO teste (valor) VALUES (?)', (valor,))
+    raise ValueError('falha proposital')
+
+
+def _hold(conn, started, release):
+    """Ocupa o escritor até ``release`` para as próximas escritas se acumularem"""
+    started.set()
+    assert release.wait(5)
+
+
+def _values(db_manager):
+    with db_manager.get_connection() as conn:
+        return sorted(row[0] for row in conn.execute('SELECT valor FROM teste'))
+
+
+@pytest.fixture
+def make_writer(db_manager):
+    writers = []
+
+    def make(**kwargs):
+        writer = WriteQueue(db_manager, **kwargs)
+        writer.execute(_create_table)
+        writers.append(writer)
+        return writer
+
+    yield make
+    for writer in writers:
+        writer.stop()
+
+
+def test_failed_write_does_not_discard_batch(db_manager, make_writer):
+    writer = make_writer(batch_delay=0.5)
+    started, release = threading.Event(), threading.Event()
+    holder = writer.submit(_hold, started, release)
+    assert started.wait(5)
+
+    ok_before = writer.submit(_insert, 'antes')
+    failed = writer.submit(_insert_and_fail, 'desfeita')
+    ok_after = writer.submit(_insert, 'depois')
+    release.set()
+
+    holder.result(5)
+    assert ok_before.result(5) == 'antes'
+    assert ok_after.result(5) == 'depois'
+    with pytest.raises(ValueError):
+        failed.result(5)
+    assert _values(db_manager) == ['antes', 'depois']
+
+
+def test_timeout_cancels_queued_write(db_manager, make_writer):
+    writer = make_writer(batch_delay=0, timeout=0.2)
+    started, release = threading.Event(), threading.Event()
+    holder = writer.submit(_hold, started, release)
+    assert started.wait(5)
+
+    with pytest.raises(TimeoutError):
+        writer.execute(_insert, 'cancelada')
+    release.set()
+    holder.result(5)
+
+    assert writer.execute(_insert, 'seguinte') == 'seguinte'
+    assert _values(db_manager) == ['seguinte']
+
+
+def test_timeout_waits_for_running_batch(db_manager, make_writer):
+    writer = make_writer(batch_delay=0, timeout=0.1)
+
+    def slow_insert(conn):
+        time.sleep(0.4)
+        return _insert(conn, 'lenta')
+
+    assert writer.execute(slow_insert) == 'lenta'
+    assert _values(db_manager) == ['lenta']
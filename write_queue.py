@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Escritor único com commit em grupo
+
+Todas as alterações no banco passam por uma única thread escritora. Cada
+escrita é uma função ``op(conn, *args)`` colocada em uma fila; o escritor
+junta as escritas que chegarem dentro de uma pequena janela (ou até o
+limite do lote) e aplica todas em uma só transação, com um ``SAVEPOINT``
+por escrita e um único ``COMMIT`` (um fsync) no final.
+
+Quem envia a escrita bloqueia no ``Future`` dela e recebe o próprio
+resultado ou a própria exceção: uma escrita que falha é desfeita até o
+seu savepoint sem afetar as demais do lote. Como só uma conexão escreve,
+as requisições não disputam mais o lock de escrita do SQLite.
+
+As funções de escrita não devem chamar ``commit``/``rollback`` nem abrir
+transações; quem controla a transação é o escritor.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, List, NamedTuple, Optional
+from config import ServerConfig
+import metrics
+
+
+class WriteRejected(Exception):
+    """Escrita recusada por regra de negócio (a transação da escrita é desfeita)
+
+    ``status`` é o código HTTP que a rota deve devolver.
+    """
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class _Write(NamedTuple):
+    """Escrita pendente na fila"""
+    op: Callable[..., Any]
+    args: tuple
+    future: Future
+
+
+class WriteQueue:
+    """Fila de escritas aplicada por uma thread com commit em grupo"""
+
+    def __init__(self, db_manager, batch_size: int = None, batch_delay: float = None,
+                 timeout: float = None):
+        self.db_manager = db_manager
+        self.batch_size = batch_size or ServerConfig.get_write_batch_size()
+        self.batch_delay = ServerConfig.get_write_batch_delay() if batch_delay is None else batch_delay
+        self.timeout = timeout or ServerConfig.get_write_timeout()
+        self._pid = None
+        self._lock = threading.Lock()
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def execute(self, op: Callable[..., Any], *args: Any) -> Any:
+        """Aplica ``op(conn, *args)`` pelo escritor e retorna seu resultado
+
+        Bloqueia até o COMMIT do lote em que a escrita entrou. Chamadas
+        feitas de dentro de outra escrita rodam direto na mesma transação.
+
+        Se o tempo limite vencer com a escrita ainda na fila, ela é
+        cancelada e nunca será aplicada (``TimeoutError``). Se ela já
+        entrou em um lote, espera o lote terminar: desistir nesse ponto
+        faria a rota responder erro para uma escrita que ainda pode ser
+        gravada, e a nova tentativa do cliente a duplicaria.
+        """
+        if threading.current_thread() is self._thread:
+            with self.db_manager.get_connection() as conn:
+                return op(conn, *args)
+        started = time.perf_counter()
+        future = self.submit(op, *args)
+        try:
+            try:
+                return future.result(self.timeout)
+            except TimeoutError:
+                if future.cancel():
+                    raise
+                return future.result()
+        finally:
+            metrics.WRITE_WAIT.observe(time.perf_counter() - started)
+
+    def submit(self, op: Callable[..., Any], *args: Any) -> Future:
+        """Enfileira ``op(conn, *args)`` e retorna o ``Future`` do resultado"""
+        self.start()
+        future = Future()
+        self._queue.put(_Write(op, args, future))
+        return future
+
+    def start(self):
+        """Inicia a thread escritora (uma vez por processo)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                            name='db-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout: float = 5.0):
+        """Aplica as escritas já enfileiradas e encerra a thread"""
+        if self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._pid = None
+        self._thread = None
+
+    def _run(self, pending: queue.Queue):
+        """Thread escritora: aplica os lotes da fila até receber o sinal de parada"""
+        with self.db_manager.dedicated_connection():
+            self._loop(pending)
+
+    def _loop(self, pending: queue.Queue):
+        """Laço da thread escritora"""
+        while True:
+            first = pending.get()
+            if first is None:
+                return
+
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.batch_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._apply(batch)
+            if stopping:
+                return
+
+    def _apply(self, batch: List[_Write]):
+        """Aplica um lote em uma transação e resolve os futures após o COMMIT"""
+        batch = [write for write in batch if write.future.set_running_or_notify_cancel()]
+        outcomes = []
+        try:
+            with self.db_manager.get_connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for write in batch:
+                        conn.execute('SAVEPOINT escrita')
+                        try:
+                            result = write.op(conn, *write.args)
+                        except Exception as e:
+                            conn.execute('ROLLBACK TO SAVEPOINT escrita')
+                            conn.execute('RELEASE SAVEPOINT escrita')
+                            outcomes.append((write.future, None, e))
+                        else:
+                            conn.execute('RELEASE SAVEPOINT escrita')
+                            outcomes.append((write.future, result, None))
+                    conn.commit()
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    raise
+        except Exception as e:
+            # Falha do lote inteiro (BEGIN/COMMIT): nenhuma escrita foi gravada
+            print(f"ERRO no escritor do banco ({len(batch)} escritas): {str(e)}")
+            for write in batch:
+                write.future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)